@@ -0,0 +1,146 @@
+"""
+Чтение получателей рассылки страницами (broadcast.py) на таблице users разного размера.
+
+Запуск из корня проекта (нужен PostgreSQL из config.ini):
+    python -m benchmarks.bench_broadcast --sizes 100000 500000
+
+Данные создаются в отдельной схеме bench_broadcast и удаляются после замера. last_active
+пользователей распределено по последним 90 дням, затем часть пользователей несколько раз
+"заходит в бота", чтобы строки таблицы лежали не по порядку id, как в живой БД.
+Для окон last_active (все пользователи, напоминание 1–30 дней, один день) замеряется
+страница в начале и в конце списка и чтение всех страниц:
+OFFSET – LIMIT/OFFSET по id, pk – keyset-пагинация (database.BROADCAST_PAGE_SQL) только
+с первичным ключом, index – она же с индексом idx_users_id_last_active (migrations.create_broadcasts).
+OFFSET читает все пропущенные строки, поэтому у него замеряются только первая и последняя страницы.
+"""
+import argparse
+import time
+
+import psycopg2
+
+import database
+import migrations
+
+SCHEMA = "bench_broadcast"
+DAYS = 90
+CHURN_ROUNDS = 3
+CHURN_SHARE = 0.3
+
+OFFSET_PAGE_SQL = """
+    SELECT id
+    FROM users
+    WHERE last_active >= %(active_after)s AND last_active < %(active_before)s
+    ORDER BY id
+    LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+# (название, начало окна, конец окна) в днях назад, None – без ограничения
+WINDOWS = [
+    ("все", None, None),
+    ("1–30 дней", 30, 1),
+    ("2–3 дня", 3, 2),
+]
+
+
+def create_schema(cur):
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+    cur.execute(f"CREATE SCHEMA {SCHEMA};")
+    cur.execute(f"SET search_path TO {SCHEMA};")
+    migrations.create_base_tables(cur)
+
+
+def fill(cur, size: int):
+    cur.execute("DROP INDEX IF EXISTS idx_users_id_last_active;")
+    cur.execute("TRUNCATE users CASCADE;")
+    cur.execute("""
+        INSERT INTO users (id, name, last_active)
+        SELECT g, 'user' || g, NOW() - random() * %s * interval '1 day'
+        FROM generate_series(1, %s) g;
+    """, (DAYS, size))
+    for _ in range(CHURN_ROUNDS):
+        cur.execute("""
+            UPDATE users SET last_active = NOW() - random() * %s * interval '1 day'
+            WHERE random() < %s;
+        """, (DAYS, CHURN_SHARE))
+    cur.execute("VACUUM ANALYZE users;")
+
+
+def window(cur, days_after, days_before):
+    cur.execute("""
+        SELECT COALESCE(NOW()::timestamp - %s * interval '1 day', '-infinity'),
+               COALESCE(NOW()::timestamp - %s * interval '1 day', 'infinity')
+    """, (days_after, days_before))
+    return cur.fetchone()
+
+
+def timed(cur, query, params):
+    started = time.perf_counter()
+    cur.execute(query, params)
+    rows = cur.fetchall()
+    return (time.perf_counter() - started) * 1000, rows
+
+
+def keyset(cur, bounds, limit: int) -> dict:
+    after_id, pages, worst, first = 0, 0, 0.0, None
+    started = time.perf_counter()
+    while True:
+        elapsed, rows = timed(cur, database.BROADCAST_PAGE_SQL, {
+            "after_id": after_id, "active_after": bounds[0], "active_before": bounds[1], "limit": limit})
+        if not rows:
+            break
+        first = elapsed if first is None else first
+        worst = max(worst, elapsed)
+        after_id = rows[-1][0]
+        pages += 1
+    last, _ = timed(cur, database.BROADCAST_PAGE_SQL, {
+        "after_id": max(after_id - 1, 0), "active_after": bounds[0], "active_before": bounds[1], "limit": limit})
+    return {"pages": pages, "first": first or 0.0, "last": last, "worst": worst,
+            "total": time.perf_counter() - started}
+
+
+def offset(cur, bounds, limit: int, pages: int) -> dict:
+    params = {"active_after": bounds[0], "active_before": bounds[1], "limit": limit}
+    first, _ = timed(cur, OFFSET_PAGE_SQL, {**params, "offset": 0})
+    last, _ = timed(cur, OFFSET_PAGE_SQL, {**params, "offset": max(pages - 1, 0) * limit})
+    return {"pages": pages, "first": first, "last": last, "worst": last, "total": None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 500000])
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--keep", action="store_true", help="не удалять схему после замера")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**database.DB_CONFIG)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            create_schema(cur)
+            print(f"{'пользователей':>13} | {'окно':<10} | {'способ':<6} | {'страниц':>7} | {'первая, мс':>10} | "
+                  f"{'последняя, мс':>13} | {'худшая, мс':>10} | {'все, с':>7}")
+            for size in args.sizes:
+                fill(cur, size)
+                bounds = {name: window(cur, days_after, days_before) for name, days_after, days_before in WINDOWS}
+                results = {}
+                for name, _, _ in WINDOWS:
+                    results[name, "pk"] = keyset(cur, bounds[name], args.batch_size)
+                    results[name, "OFFSET"] = offset(cur, bounds[name], args.batch_size, results[name, "pk"]["pages"])
+                migrations.create_broadcasts(cur)
+                cur.execute("ANALYZE users;")
+                for name, _, _ in WINDOWS:
+                    results[name, "index"] = keyset(cur, bounds[name], args.batch_size)
+                for name, _, _ in WINDOWS:
+                    for method in ("OFFSET", "pk", "index"):
+                        result = results[name, method]
+                        total = f"{result['total']:>7.2f}" if result["total"] is not None else f"{'–':>7}"
+                        print(f"{size:>13} | {name:<10} | {method:<6} | {result['pages']:>7} | "
+                              f"{result['first']:>10.2f} | {result['last']:>13.2f} | {result['worst']:>10.2f} | {total}")
+            if not args.keep:
+                cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE;")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Подбор неправильных вариантов ответа (distractors.py) на словарях разного размера.
+
+Запуск из корня проекта (БД не нужна):
+    python -m benchmarks.bench_distractors --sizes 1000 10000 100000
+
+Словарь – переводы из data/initial_words.csv и случайные "слова" с длиной как у английских
+(в среднем 7 букв). Замеряются построение индекса, выбор трех вариантов для случайного
+перевода и добавление слова в уже построенный индекс.
+"""
+import argparse
+import random
+import statistics
+import string
+import time
+
+import distractors
+import storage
+
+
+def make_words(size: int, rng: random.Random) -> list:
+    words = [row[1] for row in storage.initial_words()]
+    while len(words) < size:
+        length = max(2, int(rng.gauss(7, 2.5)))
+        words.append(''.join(rng.choice(string.ascii_lowercase) for _ in range(length)).capitalize())
+    return words[:size]
+
+
+def measure(action, items) -> dict:
+    timings = []
+    for item in items:
+        started = time.perf_counter()
+        action(item)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "mean": statistics.mean(timings),
+        "p50": timings[len(timings) // 2],
+        "p95": timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    print(f"{'слов':>8} | {'индекс, с':>9} | {'операция':<10} | {'mean, мс':>9} | {'p50, мс':>8} | {'p95, мс':>8}")
+    for size in args.sizes:
+        words = make_words(size, rng)
+        index = distractors.DistractorIndex(lambda: ((word, None) for word in words))
+        started = time.perf_counter()
+        index.load()
+        built = time.perf_counter() - started
+        targets = [rng.choice(words) for _ in range(args.iterations)]
+        results = {
+            "выбор": measure(index.pick, targets),
+            "добавление": measure(lambda number: index.add(f"Added{number}", 1), range(args.iterations)),
+        }
+        for name, result in results.items():
+            print(f"{size:>8} | {built:>9.2f} | {name:<10} | {result['mean']:>9.3f} | "
+                  f"{result['p50']:>8.3f} | {result['p95']:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+CPU-стоимость клавиатуры в одном ответе: создание ReplyKeyboardMarkup и сериализация
+в JSON на каждый ответ против заранее сериализованных клавиатур из keyboards.py.
+
+Запуск из корня проекта (БД и сеть не нужны):
+    python -m benchmarks.bench_keyboards
+
+Время включает apihelper._convert_markup, то есть то, что telebot делает с reply_markup
+перед отправкой запроса.
+"""
+import argparse
+import random
+import time
+
+from telebot import apihelper, types
+
+import keyboards
+
+# Слов в замере: все их клавиатуры (по 24 на слово) помещаются в кэш keyboards.py
+WORDS = 400
+
+
+def legacy_main():
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
+    markup.add(
+        types.KeyboardButton('Новое слово 🆕'),
+        types.KeyboardButton('Добавить слово ➕'),
+        types.KeyboardButton('Удалить слово ❌')
+    )
+    return apihelper._convert_markup(markup)
+
+
+def legacy_quiz(word):
+    options = list(word[1:])
+    random.shuffle(options)
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
+    for option in options:
+        markup.add(types.KeyboardButton(option))
+    markup.add(types.KeyboardButton('Пропустить ⏩'), types.KeyboardButton('Главное меню 🏠'))
+    return apihelper._convert_markup(markup)
+
+
+def cached_main():
+    return apihelper._convert_markup(keyboards.MAIN)
+
+
+def cached_quiz(word):
+    return apihelper._convert_markup(
+        keyboards.quiz_keyboard(word[0], word[1:], keyboards.random_permutation())
+    )
+
+
+def uncached_quiz(word):
+    options = word[1:]
+    permutation = keyboards.random_permutation()
+    return apihelper._convert_markup(keyboards.options_keyboard([options[index] for index in permutation]))
+
+
+def measure(func, words, iterations: int):
+    """
+    Среднее время одного вызова, мкс
+    """
+    started = time.perf_counter()
+    if words is None:
+        for _ in range(iterations):
+            func()
+    else:
+        for number in range(iterations):
+            func(words[number % len(words)])
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    words = [(number, f"Translation{number}", f"Wrong{number}a", f"Wrong{number}b", f"Wrong{number}c")
+             for number in range(WORDS)]
+    # Прогреваем кэш вопросов: у бота в работе большинство ответов – повторные слова
+    for word in words:
+        for permutation in keyboards.PERMUTATIONS:
+            keyboards.quiz_keyboard(word[0], word[1:], permutation)
+
+    rows = [
+        ("главное меню", measure(legacy_main, None, args.iterations), measure(cached_main, None, args.iterations)),
+        ("вопрос", measure(legacy_quiz, words, args.iterations), measure(cached_quiz, words, args.iterations)),
+        ("вопрос, промах", measure(legacy_quiz, words, args.iterations), measure(uncached_quiz, words, args.iterations)),
+    ]
+    print(f"{'клавиатура':<14} | {'каждый раз, мкс':>15} | {'keyboards.py, мкс':>17} | ускорение")
+    for name, legacy, cached in rows:
+        print(f"{name:<14} | {legacy:>15.2f} | {cached:>17.2f} | x{legacy / cached:.1f}")
+
+
+if __name__ == "__main__":
+    main()
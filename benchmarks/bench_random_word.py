@@ -0,0 +1,168 @@
+"""
+Сравнение выбора случайного слова из словаря пользователя (общие слова без удаленных
+и свои): ORDER BY RANDOM() и выбор по rand_key (database.RANDOM_WORD_SQL).
+
+Запуск из корня проекта (нужен PostgreSQL из config.ini):
+    python -m benchmarks.bench_random_word --sizes 1000 10000 100000
+
+Данные создаются в отдельной схеме bench_random_word, которая удаляется после замера.
+"""
+import argparse
+import random
+import statistics
+import time
+
+import psycopg2
+
+import database
+
+SCHEMA = "bench_random_word"
+USER_ID = 1
+OTHER_USERS = 3
+DELETED_SHARE = 0.1
+
+OWN_WORDS = 100
+
+# Выбор без rand_key по тому же словарю пользователя (общие слова без удаленных и свои):
+# ORDER BY RANDOM() сортирует весь словарь на каждый вопрос
+LEGACY_RANDOM_WORD_SQL = """
+    SELECT w.id, w.russian_word, w.target_word,
+           w.other_word_1, w.other_word_2, w.other_word_3
+    FROM words w
+    WHERE (w.user_id IS NULL OR w.user_id = %(user_id)s)
+    AND NOT EXISTS (
+        SELECT 1 FROM deleted_words dw
+        WHERE dw.user_id = %(user_id)s AND dw.words_id = w.id
+    )
+    ORDER BY RANDOM()
+    LIMIT 1;
+"""
+
+
+def create_schema(cur):
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+    cur.execute(f"CREATE SCHEMA {SCHEMA};")
+    cur.execute(f"SET search_path TO {SCHEMA};")
+    cur.execute("""
+        CREATE TABLE users(id BIGINT PRIMARY KEY, name VARCHAR(100));
+        CREATE TABLE words(
+            id SERIAL PRIMARY KEY,
+            russian_word VARCHAR(50) NOT NULL,
+            target_word VARCHAR(50) NOT NULL,
+            other_word_1 VARCHAR(50) NOT NULL,
+            other_word_2 VARCHAR(50) NOT NULL,
+            other_word_3 VARCHAR(50) NOT NULL,
+            user_id BIGINT,
+            rand_key DOUBLE PRECISION NOT NULL DEFAULT random()
+        );
+        CREATE TABLE deleted_words(
+            user_id BIGINT NOT NULL,
+            words_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, words_id)
+        );
+        CREATE INDEX idx_deleted_words_user_id ON deleted_words(user_id);
+        CREATE INDEX idx_words_global_rand_key ON words(rand_key) WHERE user_id IS NULL;
+        CREATE INDEX idx_words_user_rand_key ON words(user_id, rand_key);
+    """)
+
+
+def fill(cur, size: int):
+    """
+    Общий словарь из size слов и по OWN_WORDS своих слов у каждого пользователя,
+    часть общих слов каждый пользователь удалил
+    """
+    cur.execute("TRUNCATE users, words, deleted_words RESTART IDENTITY;")
+    cur.execute("""
+        INSERT INTO users (id, name)
+        SELECT g, 'user' || g FROM generate_series(1, %s) g;
+    """, (OTHER_USERS + 1,))
+    cur.execute("""
+        INSERT INTO words (russian_word, target_word, other_word_1, other_word_2, other_word_3)
+        SELECT 'слово' || g, 'word' || g, 'a' || g, 'b' || g, 'c' || g
+        FROM generate_series(1, %s) g;
+    """, (size,))
+    cur.execute("""
+        INSERT INTO words (russian_word, target_word, other_word_1, other_word_2, other_word_3, user_id)
+        SELECT 'свое' || g, 'own' || g, 'a' || g, 'b' || g, 'c' || g, u.id
+        FROM users u CROSS JOIN generate_series(1, %s) g;
+    """, (OWN_WORDS,))
+    cur.execute("""
+        INSERT INTO deleted_words (user_id, words_id)
+        SELECT u.id, w.id FROM users u CROSS JOIN words w
+        WHERE w.user_id IS NULL AND random() < %s;
+    """, (DELETED_SHARE,))
+    cur.execute("ANALYZE;")
+    cur.execute("""
+        SELECT w.id FROM words w
+        WHERE (w.user_id IS NOT NULL AND w.user_id <> %(user_id)s)
+        OR EXISTS (SELECT 1 FROM deleted_words dw WHERE dw.user_id = %(user_id)s AND dw.words_id = w.id)
+    """, {"user_id": USER_ID})
+    return {row[0] for row in cur.fetchall()}
+
+
+def legacy_pick(cur):
+    cur.execute(LEGACY_RANDOM_WORD_SQL, {"user_id": USER_ID})
+    return cur.fetchone()
+
+
+def rand_key_pick(cur):
+    threshold = random.random()
+    cur.execute(database.RANDOM_WORD_SQL, {"user_id": USER_ID, "threshold": threshold,
+                                           "limit": database.RANDOM_WORD_SAMPLE, "excluded": []})
+    words = cur.fetchall()
+    if len(words) < database.RANDOM_WORD_SAMPLE:
+        cur.execute(database.RANDOM_WORD_SQL, {"user_id": USER_ID, "threshold": 0.0,
+                                               "limit": database.RANDOM_WORD_SAMPLE - len(words),
+                                               "excluded": []})
+        words += cur.fetchall()
+    return random.choice(words) if words else None
+
+
+def measure(cur, pick, iterations: int, excluded: set):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        word = pick(cur)
+        timings.append((time.perf_counter() - started) * 1000)
+        if word is None or word[0] in excluded:
+            raise AssertionError(f"Выбрано недопустимое слово: {word}")
+    timings.sort()
+    return {
+        "mean": statistics.mean(timings),
+        "p50": timings[len(timings) // 2],
+        "p95": timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--keep", action="store_true", help="не удалять схему после замера")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**database.DB_CONFIG)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            create_schema(cur)
+            print(f"{'слов':>8} | {'запрос':<17} | {'mean, мс':>9} | {'p50, мс':>8} | {'p95, мс':>8}")
+            for size in args.sizes:
+                excluded = fill(cur, size)
+                results = {
+                    "ORDER BY RANDOM()": measure(cur, legacy_pick, args.iterations, excluded),
+                    "rand_key": measure(cur, rand_key_pick, args.iterations, excluded),
+                }
+                for name, result in results.items():
+                    print(f"{size:>8} | {name:<17} | {result['mean']:>9.3f} | "
+                          f"{result['p50']:>8.3f} | {result['p95']:>8.3f}")
+                speedup = results["ORDER BY RANDOM()"]["mean"] / results["rand_key"]["mean"]
+                print(f"{'':>8} | ускорение: x{speedup:.1f}")
+            if not args.keep:
+                cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE;")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Стоимость выбора обработчика сообщения: перебор фильтров @bot.message_handler(func=...)
+против таблицы router.Router.
+
+Запуск из корня проекта (БД и сеть не нужны):
+    python -m benchmarks.bench_router --handlers 5 50 500
+
+Для каждого числа кнопок измеряется обработка сообщения, которое совпадает с последней
+зарегистрированной кнопкой (худший случай для перебора), через telebot.process_new_messages.
+"""
+import argparse
+import statistics
+import time
+
+import telebot
+from telebot import types
+
+import router
+
+TOKEN = "123456:BENCHMARK"
+STATE_MAIN = 0
+USER_ID = 1
+
+
+def make_message(text: str):
+    return types.Message.de_json({
+        "message_id": 1, "date": 0, "text": text,
+        "chat": {"id": USER_ID, "type": "private"},
+        "from": {"id": USER_ID, "is_bot": False, "first_name": "bench"},
+    })
+
+
+def linear_bot(buttons, states):
+    """
+    Бот со старой схемой: по обработчику с фильтром на каждую кнопку
+    """
+    bot = telebot.TeleBot(TOKEN, threaded=False)
+    for text in buttons:
+        bot.message_handler(
+            func=lambda m, text=text: m.text == text and states.get(m.from_user.id, STATE_MAIN) == STATE_MAIN
+        )(lambda message: None)
+    return bot
+
+
+def router_bot(buttons, states):
+    """
+    Бот с одним обработчиком и таблицей маршрутов
+    """
+    bot = telebot.TeleBot(TOKEN, threaded=False)
+    routes = router.Router()
+    for text in buttons:
+        routes.button(text, STATE_MAIN)(lambda message: None)
+
+    @bot.message_handler(content_types=['text'])
+    def route(message):
+        handler = routes.resolve(message.text, states.get(message.from_user.id, STATE_MAIN))
+        if handler is not None:
+            handler(message)
+
+    return bot
+
+
+def measure(bot, message, iterations: int, repeats: int = 5):
+    """
+    Лучшее из repeats среднее время обработки сообщения, мкс
+    """
+    results = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            bot.process_new_messages([message])
+        results.append((time.perf_counter() - started) / iterations * 1e6)
+    return min(results), statistics.mean(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--handlers", type=int, nargs="+", default=[5, 50, 500])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    states = {}
+    print(f"{'кнопок':>7} | {'маршрутизация':<14} | {'min, мкс':>9} | {'mean, мкс':>9}")
+    for count in args.handlers:
+        buttons = [f"Кнопка {number}" for number in range(count)]
+        message = make_message(buttons[-1])
+        results = {
+            "фильтры": measure(linear_bot(buttons, states), message, args.iterations),
+            "router": measure(router_bot(buttons, states), message, args.iterations),
+        }
+        for name, (best, mean) in results.items():
+            print(f"{count:>7} | {name:<14} | {best:>9.2f} | {mean:>9.2f}")
+        print(f"{'':>7} | ускорение: x{results['фильтры'][0] / results['router'][0]:.1f}")
+
+
+if __name__ == "__main__":
+    main()
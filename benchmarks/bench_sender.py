@@ -0,0 +1,123 @@
+"""
+Всплеск исходящих сообщений на локальный fake Bot API с ограничениями как у Telegram:
+прямые вызовы bot.send_message из потоков обработчиков против очереди sender.OutboundSender.
+
+Запуск из корня проекта (БД и сеть не нужны):
+    python -m benchmarks.bench_sender --chats 50 --messages 4
+
+Для прямых вызовов считаются сообщения, потерянные из-за 429. Для очереди проверяется,
+что доставлено все и в исходном порядке внутри чата, и выводится задержка в очереди.
+Отдельно замеряется, насколько ответы на вопросы обгоняют рассылку.
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import telebot
+from telebot import apihelper
+
+import sender
+from tools.fake_bot_api import FakeBotAPI
+
+TOKEN = "123456:BENCHMARK"
+
+
+def burst(chats: int, messages: int):
+    return [(1000 + chat, f"{chat}:{number}") for number in range(messages) for chat in range(chats)]
+
+
+def direct(bot, jobs, workers: int):
+    """
+    Как раньше: каждый обработчик сам вызывает send_message
+    """
+    failed = 0
+
+    def send(job):
+        nonlocal failed
+        try:
+            bot.send_message(*job)
+        except apihelper.ApiTelegramException:
+            failed += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(send, jobs))
+    return time.perf_counter() - started, failed
+
+
+def queued(bot, jobs, workers: int, rate: float):
+    outbox = sender.OutboundSender(bot, workers=workers, global_rate=rate)
+    started = time.perf_counter()
+    futures = [outbox.send_message(*job) for job in jobs]
+    wait(futures)
+    elapsed = time.perf_counter() - started
+    outbox.stop()
+    failed = sum(1 for future in futures if future.exception() is not None)
+    return elapsed, failed, outbox.stats()
+
+
+def in_order(messages) -> bool:
+    last = {}
+    for chat_id, text, _ in messages:
+        number = int(text.split(":")[1])
+        if number < last.get(chat_id, -1):
+            return False
+        last[chat_id] = number
+    return True
+
+
+def priority(bot, workers: int, rate: float, bulk: int, interactive: int):
+    """
+    Рассылка bulk сообщений, за которой приходят ответы interactive пользователям
+    """
+    outbox = sender.OutboundSender(bot, workers=workers, global_rate=rate)
+    sent_at = {}
+    for number in range(bulk):
+        outbox.send_message(5000 + number, f"рассылка:{number}", priority=sender.PRIORITY_BULK)
+    started = time.perf_counter()
+    futures = [outbox.send_message(9000 + number, f"ответ:{number}") for number in range(interactive)]
+    for future in futures:
+        future.add_done_callback(lambda f: sent_at.setdefault(id(f), time.perf_counter()))
+    wait(futures)
+    interactive_done = max(sent_at.values()) - started
+    outbox.stop()
+    return interactive_done, bulk / rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=4, help="сообщений в каждый чат")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--global-rate", type=float, default=30)
+    args = parser.parse_args()
+
+    api = FakeBotAPI(global_rate=args.global_rate).start()
+    apihelper.API_URL = api.api_url
+    sender.configure_session(args.workers)
+    bot = telebot.TeleBot(TOKEN, threaded=False)
+    jobs = burst(args.chats, args.messages)
+    try:
+        elapsed, failed = direct(bot, jobs, args.workers)
+        print(f"Напрямую:  {len(jobs)} сообщений за {elapsed:.2f} с, потеряно из-за 429: {failed}")
+
+        api.messages.clear()
+        time.sleep(max(1.0, args.chats / args.global_rate))  # Ведра fake API наполняются заново
+        rejected_before = api.rejected
+        elapsed, failed, stats = queued(bot, jobs, args.workers, args.global_rate)
+        print(f"Очередь:   {len(jobs)} сообщений за {elapsed:.2f} с, потеряно: {failed}, "
+              f"429 от API: {api.rejected - rejected_before}, порядок в чатах сохранен: {in_order(api.messages)}")
+        print(f"           задержка в очереди p50 {stats['latency_p50'] * 1000:.0f} мс, "
+              f"p95 {stats['latency_p95'] * 1000:.0f} мс, max {stats['latency_max'] * 1000:.0f} мс")
+
+        time.sleep(max(1.0, args.chats / args.global_rate))
+        interactive_done, bulk_time = priority(bot, args.workers, args.global_rate,
+                                               bulk=int(args.global_rate * 3), interactive=5)
+        print(f"Приоритет: 5 ответов отправлены за {interactive_done:.2f} с при рассылке "
+              f"на {bulk_time:.1f} с впереди них")
+    finally:
+        api.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Выбор следующего слова в режиме интервального повторения на больших словарях.
+
+Запуск из корня проекта (нужен PostgreSQL из config.ini):
+    python -m benchmarks.bench_spaced --sizes 1000 10000 100000
+
+Данные создаются в отдельной схеме bench_spaced теми же миграциями, что и в боте,
+и удаляются после замера. У пользователя size слов, по большей части из них уже есть
+прогресс с разными due_at. Замеряются три случая: есть слово к повторению, повторять
+нечего и берется новое слово, новых слов нет и берется ближайшее к повторению.
+Для сравнения первый случай повторяется без индекса (user_id, due_at).
+Кроме времени выводится число страниц, прочитанных запросом (EXPLAIN BUFFERS):
+при выборе по индексу оно почти не растет с размером словаря.
+"""
+import argparse
+import statistics
+import time
+
+import psycopg2
+
+import database
+import migrations
+
+SCHEMA = "bench_spaced"
+USER_ID = 1
+OTHER_USERS = 3
+INTRODUCED_SHARE = 0.9
+DELETED_SHARE = 0.05
+
+
+def create_schema(cur):
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+    cur.execute(f"CREATE SCHEMA {SCHEMA};")
+    cur.execute(f"SET search_path TO {SCHEMA};")
+    migrations.create_base_tables(cur)
+    migrations.create_word_progress(cur)
+
+
+def fill(cur, size: int, introduced_share: float, due_share: float):
+    """
+    size общих слов, прогресс по первым introduced_share из них; доля due_share
+    прогресса уже пора повторять, остальное – в ближайшие 30 дней
+    """
+    cur.execute("TRUNCATE users, words, deleted_words, word_progress RESTART IDENTITY CASCADE;")
+    cur.execute("""
+        INSERT INTO users (id, name)
+        SELECT g, 'user' || g FROM generate_series(1, %s) g;
+    """, (OTHER_USERS + 1,))
+    cur.execute("""
+        INSERT INTO words (russian_word, target_word, other_word_1, other_word_2, other_word_3)
+        SELECT 'слово' || g, 'word' || g, 'a' || g, 'b' || g, 'c' || g
+        FROM generate_series(1, %s) g;
+    """, (size,))
+    # Прогресс у всех пользователей, чтобы в индексе были чужие строки
+    cur.execute("""
+        INSERT INTO word_progress (user_id, words_id, repetitions, interval_days, due_at)
+        SELECT u.id, w.id, 3, 10,
+               CASE WHEN random() < %s THEN NOW() - random() * interval '1 day'
+                    ELSE NOW() + interval '1 minute' + random() * interval '30 days' END
+        FROM users u
+        JOIN words w ON w.id <= %s;
+    """, (due_share, int(size * introduced_share)))
+    cur.execute("""
+        INSERT INTO deleted_words (user_id, words_id)
+        SELECT %s, id FROM words WHERE id > %s AND random() < %s;
+    """, (USER_ID, int(size * introduced_share), DELETED_SHARE))
+    cur.execute("ANALYZE;")
+
+
+def pick(cur):
+    """
+    То же, что database.get_next_user_word, на курсоре схемы замера
+    """
+    params = {"user_id": USER_ID, "excluded": []}
+    cur.execute(database.NEXT_DUE_WORD_SQL, params)
+    due = cur.fetchone()
+    word = due[:-1] if due else None
+    if due is None or not due[-1]:
+        cur.execute(database.NEW_WORD_SQL, params)
+        word = cur.fetchone() or word
+    return word
+
+
+def pages(cur) -> int:
+    """
+    Страниц (shared buffers), прочитанных запросами одного выбора
+    """
+    params = {"user_id": USER_ID, "excluded": []}
+    total = 0
+    cur.execute(database.NEXT_DUE_WORD_SQL, params)
+    due = cur.fetchone()
+    queries = [database.NEXT_DUE_WORD_SQL]
+    if due is None or not due[-1]:
+        queries.append(database.NEW_WORD_SQL)
+    for query in queries:
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, params)
+        plan = cur.fetchone()[0][0]["Plan"]
+        total += plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0)
+    return total
+
+
+def measure(cur, iterations: int):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        word = pick(cur)
+        timings.append((time.perf_counter() - started) * 1000)
+        if word is None:
+            raise AssertionError("Слово не выбрано")
+    timings.sort()
+    return {
+        "mean": statistics.mean(timings),
+        "p50": timings[len(timings) // 2],
+        "p95": timings[int(len(timings) * 0.95) - 1],
+        "pages": pages(cur),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--keep", action="store_true", help="не удалять схему после замера")
+    args = parser.parse_args()
+
+    cases = [
+        ("есть к повторению", INTRODUCED_SHARE, 0.1),
+        ("новое слово", INTRODUCED_SHARE, 0.0),
+        ("ближайшее", 1.0, 0.0),
+    ]
+    conn = psycopg2.connect(**database.DB_CONFIG)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            create_schema(cur)
+            print(f"{'слов':>8} | {'случай':<30} | {'mean, мс':>9} | {'p50, мс':>8} | {'p95, мс':>8} | {'страниц':>7}")
+            for size in args.sizes:
+                for name, introduced_share, due_share in cases:
+                    fill(cur, size, introduced_share, due_share)
+                    result = measure(cur, args.iterations)
+                    print(f"{size:>8} | {name:<30} | {result['mean']:>9.3f} | "
+                          f"{result['p50']:>8.3f} | {result['p95']:>8.3f} | {result['pages']:>7}")
+                # Первый случай без индекса по due_at: сортировка всего прогресса пользователя
+                fill(cur, size, INTRODUCED_SHARE, 0.1)
+                cur.execute("DROP INDEX idx_word_progress_due;")
+                result = measure(cur, max(1, args.iterations // 10))
+                print(f"{size:>8} | {'есть к повторению, без индекса':<30} | {result['mean']:>9.3f} | "
+                      f"{result['p50']:>8.3f} | {result['p95']:>8.3f} | {result['pages']:>7}")
+                cur.execute("CREATE INDEX idx_word_progress_due ON word_progress(user_id, due_at);")
+            if not args.keep:
+                cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE;")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
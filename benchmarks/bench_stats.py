@@ -0,0 +1,127 @@
+"""
+Статистика пользователя (/stats) при разном объеме его истории.
+
+Запуск из корня проекта (нужен PostgreSQL из config.ini):
+    python -m benchmarks.bench_stats --sizes 1000 10000 100000
+
+Данные создаются в отдельной схеме bench_stats теми же миграциями, что и в боте,
+и удаляются после замера. У пользователя size своих слов, size удаленных (из них
+пятая часть выучена) и 5 * size ответов за последние 60 дней. Замеряются подсчет
+статистики запросами COUNT(*) по таблицам, чтение строки счетчиков user_stats
+(database.USER_STATS_SQL) и сверка счетчиков этого пользователя (user_stats.RECONCILE_SQL).
+"""
+import argparse
+import statistics
+import time
+
+import psycopg2
+
+import database
+import migrations
+import user_stats
+
+SCHEMA = "bench_stats"
+USER_ID = 1
+OTHER_USERS = 3
+ANSWERS_PER_WORD = 5
+LEARNED_SHARE = 0.2
+
+# Статистика без счетчиков: каждый запрос считает строки всех таблиц пользователя
+COUNT_SQL = """
+    SELECT (SELECT COUNT(*) FROM words WHERE user_id = %(user_id)s),
+           (SELECT COUNT(*) FROM deleted_words WHERE user_id = %(user_id)s),
+           (SELECT COUNT(*) FROM learned_words WHERE user_id = %(user_id)s),
+           COUNT(*), COUNT(*) FILTER (WHERE correct)
+    FROM answer_events
+    WHERE user_id = %(user_id)s
+"""
+
+
+def create_schema(cur):
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+    cur.execute(f"CREATE SCHEMA {SCHEMA};")
+    cur.execute(f"SET search_path TO {SCHEMA};")
+    migrations.create_base_tables(cur)
+    migrations.create_answer_events(cur)
+    migrations.create_word_progress(cur)
+    migrations.create_user_stats(cur)
+
+
+def fill(cur, size: int):
+    cur.execute("TRUNCATE users, words, deleted_words, learned_words, answer_events, user_stats RESTART IDENTITY CASCADE;")
+    cur.execute("""
+        INSERT INTO users (id, name)
+        SELECT g, 'user' || g FROM generate_series(1, %s) g;
+    """, (OTHER_USERS + 1,))
+    # Свои слова у всех пользователей, чтобы в индексах были чужие строки
+    cur.execute("""
+        INSERT INTO words (russian_word, target_word, other_word_1, other_word_2, other_word_3, user_id)
+        SELECT 'слово' || g, 'word' || g, 'a' || g, 'b' || g, 'c' || g, u.id
+        FROM users u, generate_series(1, %s) g;
+    """, (size,))
+    cur.execute("""
+        INSERT INTO deleted_words (user_id, words_id) SELECT user_id, id FROM words;
+        INSERT INTO learned_words (user_id, words_id) SELECT user_id, id FROM words WHERE random() < %s;
+    """, (LEARNED_SHARE,))
+    cur.execute("""
+        INSERT INTO answer_events (user_id, words_id, correct, answered_at)
+        SELECT w.user_id, w.id, random() < 0.7, NOW() - random() * interval '60 days'
+        FROM words w, generate_series(1, %s);
+    """, (ANSWERS_PER_WORD,))
+    cur.execute("INSERT INTO user_stats (user_id) SELECT id FROM users;")
+    cur.execute(user_stats.RECONCILE_SQL, {"limit": None})
+    cur.execute("ANALYZE;")
+
+
+def measure(cur, query, params, iterations: int):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        cur.execute(query, params)
+        if cur.description:
+            cur.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "mean": statistics.mean(timings),
+        "p50": timings[len(timings) // 2],
+        "p95": timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--keep", action="store_true", help="не удалять схему после замера")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**database.DB_CONFIG)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            create_schema(cur)
+            print(f"{'слов':>8} | {'запрос':<22} | {'mean, мс':>9} | {'p50, мс':>8} | {'p95, мс':>8}")
+            for size in args.sizes:
+                fill(cur, size)
+                # Сверка одного пользователя: он единственный не сверенный
+                cur.execute("UPDATE user_stats SET reconciled_at = NOW();")
+                cases = [
+                    ("COUNT(*) по таблицам", COUNT_SQL, {"user_id": USER_ID}, args.iterations),
+                    ("счетчики user_stats", database.USER_STATS_SQL, (USER_ID,), args.iterations),
+                    ("сверка пользователя",
+                     "UPDATE user_stats SET reconciled_at = NULL WHERE user_id = %(user_id)s;"
+                     + user_stats.RECONCILE_SQL, {"user_id": USER_ID, "limit": 1}, max(1, args.iterations // 10)),
+                ]
+                for name, query, params, iterations in cases:
+                    result = measure(cur, query, params, iterations)
+                    print(f"{size:>8} | {name:<22} | {result['mean']:>9.3f} | "
+                          f"{result['p50']:>8.3f} | {result['p95']:>8.3f}")
+            if not args.keep:
+                cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE;")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
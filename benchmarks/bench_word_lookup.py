@@ -0,0 +1,116 @@
+"""
+Поиск слова при удалении (word_lookup.py и find_user_word_id) на словарях пользователя разного размера.
+
+Запуск из корня проекта (БД не нужна):
+    python -m benchmarks.bench_word_lookup --sizes 1000 10000 50000
+    python -m benchmarks.bench_word_lookup --storage sqlite
+
+Словарь – слова из data/initial_words.csv и случайные "русские слова" (в среднем 8 букв).
+Запросы – слова словаря с опечаткой (замена, пропуск или перестановка букв), их началом
+и другим регистром. Замеряются построение индекса пользователя, подсказки и точный поиск
+по нормализованному написанию в хранилище (memory или sqlite, индекс idx_words_normalized).
+Код возврата 1, если на словаре от 10 000 слов p95 подсказок или построение индекса
+(пропорционально размеру словаря) не укладываются в цели из word_lookup.py.
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+
+import storage
+import word_lookup
+
+ALPHABET = "абвгдеёжзийклмнопрстуфхцчшщыэюя"
+USER_ID = 1
+# Цели из word_lookup.py для словаря в TARGET_SIZE слов
+TARGET_SIZE = 10000
+TARGET_SUGGEST_P95_MS = 2.0
+TARGET_BUILD_MS = 250.0
+
+
+def make_words(size: int, rng: random.Random) -> list:
+    words = [row[0] for row in storage.initial_words()]
+    seen = set(words)
+    while len(words) < size:
+        word = ''.join(rng.choice(ALPHABET) for _ in range(max(3, int(rng.gauss(8, 2.5)))))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words[:size]
+
+
+def make_query(word: str, rng: random.Random) -> str:
+    kind = rng.randrange(4)
+    position = rng.randrange(len(word))
+    if kind == 0:
+        return word[:position] + rng.choice(ALPHABET) + word[position + 1:]
+    if kind == 1 and len(word) > 3:
+        return word[:position] + word[position + 1:]
+    if kind == 2 and position < len(word) - 1:
+        return word[:position] + word[position + 1] + word[position] + word[position + 2:]
+    return word[:max(2, len(word) // 2)].upper()
+
+
+def measure(action, items) -> dict:
+    timings = []
+    for item in items:
+        started = time.perf_counter()
+        action(item)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "mean": statistics.mean(timings),
+        "p50": timings[len(timings) // 2],
+        "p95": timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--storage", choices=["memory", "sqlite"], default="memory")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    failed = False
+    print(f"{'слов':>8} | {'индекс, мс':>10} | {'операция':<11} | {'mean, мс':>9} | {'p50, мс':>8} | "
+          f"{'p95, мс':>8} | {'найдено':>7}")
+    for size in args.sizes:
+        store = storage.MemoryStorage() if args.storage == "memory" else storage.SQLiteStorage(":memory:")
+        store.open()
+        words = make_words(size, rng)
+        for word in words:
+            store.add_custom_word(USER_ID, word, "target", "one", "two", "three")
+        lookup = word_lookup.WordLookup(store.get_user_vocabulary)
+
+        started = time.perf_counter()
+        lookup.suggest(USER_ID, words[0])
+        built = (time.perf_counter() - started) * 1000
+
+        originals = [rng.choice(words) for _ in range(args.iterations)]
+        queries = [make_query(word, rng) for word in originals]
+        found = sum(word in lookup.suggest(USER_ID, query) for word, query in zip(originals, queries))
+        # Другой регистр и ё вместо е находятся точным поиском по нормализованному написанию
+        exact = [rng.choice(words).upper().replace('Е', 'Ё') for _ in range(args.iterations)]
+        exact_found = sum(store.find_user_word_id(USER_ID, query) is not None for query in exact)
+        results = {
+            "подсказки": (measure(lambda query: lookup.suggest(USER_ID, query), queries), found / len(queries)),
+            "точный": (measure(lambda query: store.find_user_word_id(USER_ID, query), exact), exact_found / len(exact)),
+        }
+        for name, (result, hit_rate) in results.items():
+            print(f"{size:>8} | {built:>10.1f} | {name:<11} | {result['mean']:>9.3f} | "
+                  f"{result['p50']:>8.3f} | {result['p95']:>8.3f} | {hit_rate:>7.0%}")
+        build_target = TARGET_BUILD_MS * size / TARGET_SIZE
+        if size >= TARGET_SIZE and (results["подсказки"][0]["p95"] > TARGET_SUGGEST_P95_MS or built > build_target):
+            failed = True
+            print(f"{size:>8} | цели не выполнены: p95 подсказок {TARGET_SUGGEST_P95_MS} мс, "
+                  f"индекс {build_target:.0f} мс")
+        store.close()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
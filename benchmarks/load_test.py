@@ -0,0 +1,451 @@
+"""
+Нагрузочный тест бота целиком: main.py получает обновления через getUpdates от локального
+fake Bot API (tools/fake_bot_api.py) и отвечает через sendMessage, а виртуальные пользователи
+проходят настоящие сценарии: /start, новое слово, верные и неверные ответы, "Оставить"
+и "Удалить" слово, добавление своего слова и удаление с подтверждением.
+
+Запуск из корня проекта (нужен config.ini с токеном, сеть не нужна):
+    python -m benchmarks.load_test --users 50 --rounds 5 --storage memory
+    python -m benchmarks.load_test --storage postgres --save baseline.json
+    python -m benchmarks.load_test --storage postgres --baseline baseline.json
+
+Выводит пропускную способность, задержку ответа p50/p95/p99 (от getUpdates до sendMessage),
+число обращений к хранилищу и SQL-запросов на одно сообщение пользователя и прирост памяти
+процесса. --save записывает результаты в JSON, --baseline сравнивает с сохраненными
+и завершается с кодом 1, если какая-то метрика хуже больше чем на --tolerance процентов.
+
+С --storage postgres тест пишет в БД из config.ini (пользователи с id от USER_ID_BASE,
+удаляются в конце) – используйте отдельную БД. По умолчанию ограничения частоты Telegram
+в fake API и очереди отправки сняты, чтобы мерить сам бот; --telegram-limits их включает.
+Fake API, бот и пользователи работают в одном процессе, поэтому числа имеют смысл
+в сравнении между запусками на одной машине.
+
+С --workers N бот работает в N рабочих процессах supervisor.py, а этот процесс получает
+обновления и раздает их по ID пользователя, как python supervisor.py. Обращения к хранилищу
+и память рабочих процессов не считаются; с --storage memory и sqlite (:memory:) у каждого
+процесса свое хранилище, этого достаточно, потому что пользователь не переходит между ними.
+"""
+import argparse
+import configparser
+import json
+import os
+import queue
+import random
+import re
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from telebot import apihelper
+
+import sender
+import storage
+from tools.fake_bot_api import FakeBotAPI
+
+USER_ID_BASE = 9_000_000_000
+REPLY_TIMEOUT = 30
+QUESTIONS_PER_ROUND = 3
+NO_LIMIT = 1e9
+
+# Метрики, по которым сравнивается с сохраненными результатами; True – чем больше, тем лучше
+COMPARED = {
+    "throughput": True,
+    "latency_p50": False,
+    "latency_p95": False,
+    "latency_p99": False,
+    "storage_calls_per_message": False,
+    "sql_per_message": False,
+    "memory_growth_kb_per_1000": False,
+}
+
+
+class Counter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def add(self, *args):
+        with self._lock:
+            self.value += 1
+
+
+def count_sql(store, counter: Counter):
+    """
+    Считает SQL-запросы хранилища: курсоры psycopg2 для postgres, трассировка для sqlite
+    """
+    if isinstance(store, storage.PostgresStorage):
+        from psycopg2.extensions import cursor
+
+        class CountingCursor(cursor):
+            def execute(self, query, vars=None):
+                counter.add()
+                return super().execute(query, vars)
+
+        store.database.DB_CONFIG["cursor_factory"] = CountingCursor
+        return True
+    if isinstance(store, storage.SQLiteStorage):
+        store._conn.set_trace_callback(counter.add)
+        return True
+    return False
+
+
+def count_calls(store, counter: Counter):
+    """
+    Считает вызовы операций хранилища (Storage.OPERATIONS)
+    """
+    for name in store.OPERATIONS:
+        operation = getattr(store, name)
+
+        def counted(*args, _operation=operation, **kwargs):
+            counter.add()
+            return _operation(*args, **kwargs)
+
+        setattr(store, name, counted)
+
+
+def rss_kb() -> int:
+    """
+    Текущий объем памяти процесса, КБ (пиковый, если /proc недоступен)
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
+
+
+class VirtualUser:
+    """
+    Пользователь, который пишет боту и ждет ответ на каждое сообщение
+    """
+
+    def __init__(self, user_id: int, api: FakeBotAPI, answers: dict, think: float, seed: int):
+        self.user_id = user_id
+        self.api = api
+        self.answers = answers
+        self.think = think
+        self.random = random.Random(seed)
+        self.replies = queue.Queue()
+        self.latencies = defaultdict(list)  # вид сообщения -> задержки ответа, с
+        self.messages = 0
+        self.errors = 0
+        self._message_ids = 0
+
+    def say(self, text: str, kind: str):
+        """
+        Отправляет сообщение и возвращает параметры sendMessage ответа бота
+        """
+        self._message_ids += 1
+        message = {
+            "message_id": self._message_ids, "date": int(time.time()), "text": text,
+            "chat": {"id": self.user_id, "type": "private"},
+            "from": {"id": self.user_id, "is_bot": False, "first_name": f"load{self.user_id}"},
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+        sent_at = time.monotonic()
+        self.api.push_update({"message": message})
+        self.messages += 1
+        try:
+            params, received_at = self.replies.get(timeout=REPLY_TIMEOUT)
+        except queue.Empty:
+            self.errors += 1
+            return {}
+        self.latencies[kind].append(received_at - sent_at)
+        if self.think:
+            time.sleep(self.random.uniform(0, 2 * self.think))
+        return params
+
+    @staticmethod
+    def options(params) -> list:
+        markup = json.loads(params.get("reply_markup") or "{}")
+        buttons = [button["text"] for row in markup.get("keyboard", []) for button in row]
+        return [text for text in buttons if text not in ("Пропустить ⏩", "Главное меню 🏠")]
+
+    def quiz(self):
+        params = self.say("Новое слово 🆕", "new_word")
+        match = re.search(r"<b>(.*?)</b>", params.get("text", ""))
+        options = self.options(params)
+        if not match or not options:
+            return  # Слова кончились
+        correct = self.answers.get(match.group(1))
+        for attempt, chance in enumerate((0.7, 0.5), start=1):
+            wrong = [option for option in options if option != correct]
+            right = correct is not None and self.random.random() < chance
+            reply = self.say(correct if right else self.random.choice(wrong or options), f"answer_{attempt}")
+            if "Правильно" in reply.get("text", ""):
+                action = self.random.random()
+                if action < 0.8:
+                    self.say("Оставить слово 🔄", "keep")
+                elif action < 0.9:
+                    self.say("Удалить слово ✅", "learned")
+                else:
+                    self.say("Главное меню 🏠", "menu")
+                return
+            if "Попытка" not in reply.get("text", ""):
+                return
+
+    def add_and_delete(self, number: int):
+        russian = f"Нагрузка{self.user_id % 1_000_000}x{number}"
+        self.say("Добавить слово ➕", "add_start")
+        self.say(f"{russian} : Load : Alpha : Beta : Gamma", "add_word")
+        self.answers[russian] = "Load"
+        self.say("Удалить слово ❌", "delete_start")
+        self.say(russian, "delete_word")
+        self.say("Да, удалить ✅", "delete_confirm")
+
+    def run(self, rounds: int):
+        for number in range(rounds):
+            for _ in range(QUESTIONS_PER_ROUND):
+                self.quiz()
+            self.add_and_delete(number)
+
+
+def cleanup(store, first_id: int, last_id: int):
+    """
+    Удаляет из PostgreSQL пользователей теста и их слова
+    """
+    if not isinstance(store, storage.PostgresStorage):
+        return
+    with store.database.get_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM words WHERE user_id BETWEEN %s AND %s", (first_id, last_id))
+        cur.execute("DELETE FROM users WHERE id BETWEEN %s AND %s", (first_id, last_id))
+        cur.execute("DELETE FROM conversation_state WHERE user_id BETWEEN %s AND %s", (first_id, last_id))
+        conn.commit()
+
+
+def prepare(main, backend: str, sqlite_path: str, limits: bool):
+    """
+    Подменяет хранилище и очередь отправки main до запуска бота: обработчики берут их из main,
+    а индексы вариантов и похожих слов – хранилище из bot_common
+    """
+    if backend != type(main.store).__name__.replace("Storage", "").lower():
+        import bot_common
+
+        main.store = bot_common.store = {"memory": storage.MemoryStorage, "sqlite": storage.SQLiteStorage,
+                                         "postgres": storage.PostgresStorage}[backend](*(
+                                             (sqlite_path, main.store.selection) if backend == "sqlite"
+                                             else (main.store.selection,)))
+        main.store.add_vocabulary_listener(main.prefetcher.invalidate)
+        main.store.add_vocabulary_listener(main.word_search.invalidate)
+    if not limits:
+        main.outbox.stop()
+        main.outbox = sender.OutboundSender(main.bot, workers=main.SENDER_WORKERS, global_rate=NO_LIMIT,
+                                            chat_rate=NO_LIMIT, chat_burst=NO_LIMIT)
+
+
+def worker(index: int, workers: int, api_url: str, backend: str, sqlite_path: str, limits: bool):
+    """
+    Рабочий процесс supervisor.py для --workers: бот из main.py на fake API
+    без метрик, рассылок и сверки статистики
+    """
+    apihelper.API_URL = api_url
+    import main
+
+    prepare(main, backend, sqlite_path, limits)
+    if limits:
+        main.share_rate_limits(workers)
+    main.store.open()
+    return main.bot, main.stop_services
+
+
+def run(args) -> dict:
+    users = {}
+
+    def on_message(chat_id, params, received_at):
+        user = users.get(chat_id)
+        if user is not None:
+            user.replies.put((params, received_at))
+
+    limits = args.telegram_limits
+    api = FakeBotAPI(chat_rate=1 if limits else 0, global_rate=30 if limits else 0,
+                     on_message=on_message, keep_messages=False).start()
+    apihelper.API_URL = api.api_url
+
+    sql = Counter()
+    calls = Counter()
+    if args.workers:
+        # Бот работает в рабочих процессах, обращения к хранилищу и память в них не считаются
+        import supervisor
+
+        main = None
+        config = configparser.ConfigParser()
+        config.read("config.ini", encoding="utf-8")
+        selection = config.get("quiz", "selection", fallback="random")
+        # Пользователей теста в PostgreSQL удаляет этот процесс
+        store = storage.PostgresStorage(selection) if args.storage == "postgres" else None
+        if store is not None:
+            store.open()
+        has_sql = False
+        bots = supervisor.Supervisor("benchmarks.load_test:worker",
+                                     (args.workers, api.api_url, args.storage, args.sqlite_path, limits),
+                                     workers=args.workers).start()
+        stopping = threading.Event()
+        polling = threading.Thread(target=supervisor.poll, args=(bots, "load", stopping),
+                                   kwargs={"timeout": 1}, name="polling", daemon=True)
+    else:
+        import main
+
+        prepare(main, args.storage, args.sqlite_path, limits)
+        store = main.store
+        selection = store.selection
+        has_sql = count_sql(store, sql)
+        store.open()
+        count_calls(store, calls)
+        polling = threading.Thread(target=main.bot.polling,
+                                   kwargs={"non_stop": True, "interval": 0, "timeout": 5, "long_polling_timeout": 1},
+                                   name="polling", daemon=True)
+
+    answers = {row[0]: row[1] for row in storage.initial_words()}
+    first_id = USER_ID_BASE
+    for number in range(args.users):
+        user_id = first_id + number
+        users[user_id] = VirtualUser(user_id, api, dict(answers), args.think, seed=number)
+
+    polling.start()
+    try:
+        # Разогрев: /start всех пользователей не входит в замер
+        threads = [threading.Thread(target=user.say, args=("/start", "start")) for user in users.values()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for user in users.values():
+            user.latencies.clear()
+            user.messages = 0
+        sql.value = calls.value = 0
+        rss_before = rss_kb()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=user.run, args=(args.rounds,)) for user in users.values()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        rss_after = rss_kb()
+        sql_total, calls_total = sql.value, calls.value
+    finally:
+        if main is None:
+            stopping.set()
+            polling.join(10)
+            bots.stop()
+        else:
+            main.bot.stop_polling()
+            polling.join(10)
+            main.bot.dispatcher.stop()
+            main.prefetcher.stop()
+            main.outbox.stop()
+        if store is not None:
+            cleanup(store, first_id, first_id + args.users - 1)
+            store.close()
+        api.stop()
+
+    by_kind = defaultdict(list)
+    for user in users.values():
+        for kind, values in user.latencies.items():
+            by_kind[kind].extend(values)
+    latencies = sorted(value for values in by_kind.values() for value in values)
+    messages = sum(user.messages for user in users.values())
+    return {
+        "storage": args.storage,
+        "selection": selection,
+        "workers": args.workers,
+        "users": args.users,
+        "rounds": args.rounds,
+        "messages": messages,
+        "errors": sum(user.errors for user in users.values()),
+        "elapsed": elapsed,
+        "throughput": messages / elapsed if elapsed else 0.0,
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_p99": percentile(latencies, 0.99),
+        "latency_by_kind": {kind: {"count": len(values), "p50": percentile(sorted(values), 0.5),
+                                   "p95": percentile(sorted(values), 0.95)}
+                            for kind, values in sorted(by_kind.items())},
+        "storage_calls_per_message": calls_total / messages if messages and main is not None else None,
+        "sql_per_message": sql_total / messages if messages and has_sql else None,
+        "memory_before_kb": rss_before if main is not None else None,
+        "memory_growth_kb": rss_after - rss_before if main is not None else None,
+        "memory_growth_kb_per_1000": (rss_after - rss_before) * 1000 / messages
+        if messages and main is not None else None,
+    }
+
+
+def report(result: dict):
+    print(f"Хранилище {result['storage']} ({result['selection']}), пользователей: {result['users']}, "
+          f"раундов: {result['rounds']}"
+          + (f", рабочих процессов: {result['workers']}" if result.get("workers") else ""))
+    print(f"Сообщений: {result['messages']} за {result['elapsed']:.2f} с – {result['throughput']:.0f} в секунду, "
+          f"без ответа: {result['errors']}")
+    print(f"Задержка ответа: p50 {result['latency_p50'] * 1000:.1f} мс, p95 {result['latency_p95'] * 1000:.1f} мс, "
+          f"p99 {result['latency_p99'] * 1000:.1f} мс")
+    print(f"{'сообщение':<16} | {'число':>6} | {'p50, мс':>8} | {'p95, мс':>8}")
+    for kind, stats in result["latency_by_kind"].items():
+        print(f"{kind:<16} | {stats['count']:>6} | {stats['p50'] * 1000:>8.1f} | {stats['p95'] * 1000:>8.1f}")
+    if result["storage_calls_per_message"] is None:
+        # --workers: хранилище и память в рабочих процессах не замеряются
+        return
+    sql = result["sql_per_message"]
+    print(f"На сообщение: обращений к хранилищу {result['storage_calls_per_message']:.2f}"
+          + (f", SQL-запросов {sql:.2f}" if sql is not None else ""))
+    print(f"Память: {result['memory_before_kb'] / 1024:.1f} МБ до замера, прирост {result['memory_growth_kb']} КБ "
+          f"({result['memory_growth_kb_per_1000']:.1f} КБ на 1000 сообщений)")
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> bool:
+    """
+    Печатает изменения относительно baseline, возвращает True, если есть ухудшения
+    """
+    worse = False
+    print(f"Сравнение с сохраненными результатами (допуск {tolerance:.0f}%):")
+    for metric, higher_is_better in COMPARED.items():
+        old, new = baseline.get(metric), result.get(metric)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        regression = (change < -tolerance) if higher_is_better else (change > tolerance)
+        # Малые абсолютные значения памяти шумят, их не считаем ухудшением
+        if metric == "memory_growth_kb_per_1000" and new - old < 100:
+            regression = False
+        worse = worse or regression
+        print(f"  {metric:<28} {old:>12.4f} -> {new:>12.4f} ({change:+.1f}%){'  ХУЖЕ' if regression else ''}")
+    return worse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=5,
+                        help=f"раундов на пользователя: {QUESTIONS_PER_ROUND} вопроса, добавление и удаление слова")
+    parser.add_argument("--storage", choices=("memory", "sqlite", "postgres"), default="memory")
+    parser.add_argument("--sqlite-path", default=":memory:")
+    parser.add_argument("--think", type=float, default=0.0, help="средняя пауза пользователя между сообщениями, с")
+    parser.add_argument("--telegram-limits", action="store_true", help="ограничения частоты как у Telegram")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="бот в стольких процессах supervisor.py, 0 – в этом же процессе")
+    parser.add_argument("--save", help="записать результаты в JSON-файл")
+    parser.add_argument("--baseline", help="сравнить с результатами из JSON-файла")
+    parser.add_argument("--tolerance", type=float, default=20.0, help="допустимое ухудшение, %%")
+    args = parser.parse_args()
+
+    result = run(args)
+    report(result)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if compare(result, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import configparser
+import random
+import time
+
+import distractors
+import keyboards
+import state_store
+import storage
+import word_lookup
+
+# Общее для синхронного (main.py) и асинхронного (main_async.py) режимов: настройки,
+# хранилище и помощники обработчиков. main_async.py импортирует этот модуль, а не main.py,
+# иначе при запуске python main.py модуль main выполнился бы второй раз (он уже __main__)
+# со вторым ботом, очередью отправки, хранилищем и индексами.
+
+config = configparser.ConfigParser()
+config.read('config.ini', encoding='utf-8')
+
+TOKEN = config['configs']['token']
+password = config['configs']['password']
+# Режим работы бота: sync (telebot.TeleBot) или async (AsyncTeleBot, см. main_async.py)
+RUNTIME = config.get('bot', 'runtime', fallback='sync')
+# Источник обновлений для режима sync: polling или webhook (см. webhook.py и секцию [webhook])
+UPDATES = config.get('bot', 'updates', fallback='polling')
+
+# Состояния для FSM (Finite State Machine)
+STATE_MAIN = 0
+STATE_ADD_WORD = 1
+STATE_DELETE_WORD = 2
+
+# Слова и прогресс пользователей: PostgreSQL, SQLite или память процесса (секция [storage])
+store = storage.from_config(config)
+
+# Состояние диалога и ожидаемый следующий шаг хранятся в state_store (секция [state]):
+# записи небольшие, с ограниченным временем жизни и числом, и могут храниться в SQLite
+# или PostgreSQL, чтобы переживать перезапуск. Пользователь без записи в главном меню.
+states = state_store.from_config(config)
+
+
+# Неправильные варианты, секция [quiz]: static – из словаря (other_word_1..3), generated –
+# подбираются по похожести на перевод (см. distractors.py). Индекс переводов нужен и в режиме
+# static: по нему заполняются варианты слова, добавленного как "Русское : Перевод"
+DISTRACTORS = config.get('quiz', 'distractors', fallback='static')
+distractor_index = distractors.DistractorIndex(
+    lambda: store.get_target_words(),
+    max_age=config.getfloat('quiz', 'distractors_max_age', fallback=600),
+)
+store.add_vocabulary_listener(distractor_index.invalidate)
+# Столько секунд варианты слова у пользователя не меняются, в том числе между попытками
+DISTRACTOR_PERIOD = 60 * 60
+
+
+# Подсказки при удалении слова, секция [lookup]: если слова с введенным написанием нет,
+# похожие слова пользователя предлагаются кнопками (см. word_lookup.py)
+word_search = word_lookup.WordLookup(
+    lambda user_id: store.get_user_vocabulary(user_id),
+    max_users=config.getint('lookup', 'max_users', fallback=1000),
+    max_age=config.getfloat('lookup', 'max_age', fallback=600),
+    limit=config.getint('lookup', 'suggestions', fallback=word_lookup.SUGGESTIONS),
+)
+store.add_vocabulary_listener(word_search.invalidate)
+
+
+def quiz_options(user_id, word_data):
+    """
+    (правильный перевод, три неправильных) для вопроса по слову word_data
+    """
+    if DISTRACTORS != 'generated':
+        return tuple(word_data[2:])
+    rng = random.Random(f"{user_id}:{word_data[0]}:{int(time.time() // DISTRACTOR_PERIOD)}")
+    wrong = distractor_index.pick(word_data[2], user_id, rng=rng)
+    return (word_data[2], *wrong) if len(wrong) == 3 else tuple(word_data[2:])
+
+
+def complete_word_parts(user_id, parts):
+    """
+    Ввод "Русское : Перевод" дополняется тремя подобранными неправильными вариантами
+    """
+    if len(parts) == 2 and all(parts):
+        wrong = distractor_index.pick(parts[1], user_id)
+        if len(wrong) == 3:
+            return [*parts, *wrong]
+    return parts
+
+
+# Клавиатура главного меню, сериализуется один раз (см. keyboards.py)
+def main_keyboard():
+    return keyboards.MAIN
+
+
+def stats_text(stats):
+    """
+    Текст ответа на /stats
+    """
+    accuracy = f"{stats['accuracy']:.0%}" if stats['accuracy'] is not None else "–"
+    return (
+        "📊 <b>Твоя статистика</b>\n\n"
+        f"📚 Слов в изучении: {stats['in_study']}\n"
+        f"✅ Выучено: {stats['learned']}\n"
+        f"🗑 Удалено: {stats['deleted']}\n"
+        f"🎯 Точность ответов: {accuracy} (ответов: {stats['answers']})\n"
+        f"🔥 Дней подряд: {stats['streak']} (лучшая серия: {stats['best_streak']})"
+    )
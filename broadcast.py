@@ -0,0 +1,208 @@
+import datetime
+import threading
+import time
+
+import sender
+
+# Рассылки: объявления всем пользователям и ежедневные напоминания тем, кто давно не заходил.
+# Рассылка – строка в хранилище (в PostgreSQL таблица broadcasts) с текстом, окном last_active
+# получателей и курсором: наибольшим id пользователя, которому рассылка уже выдана.
+# Получатели читаются страницами по batch_size пользователей с id больше курсора
+# (keyset-пагинация по индексу (id, last_active), без OFFSET), и курсор сдвигается на конец
+# страницы в той же транзакции, в которой она прочитана. Поэтому после сбоя рассылка
+# продолжается со следующей страницы и никому не приходит дважды (недоотправленная часть
+# страницы теряется), а при обычной остановке курсор возвращается к первому неотправленному.
+# Сообщения уходят через очередь sender.py с приоритетом PRIORITY_BULK не быстрее rate
+# в секунду и не больше max_in_flight сразу, поэтому ответы пользователям обгоняют рассылку
+# и не ждут места в очереди отправки. Читает и отправляет отдельный поток Broadcaster.
+# Окно last_active фиксируется при создании рассылки: пользователь, который зашел в бота
+# во время напоминания, его уже не получит, а вышедший из окна не вернется в него обратно.
+
+# Сколько секунд в сутках, окна напоминаний задаются в днях
+DAY = 24 * 60 * 60
+
+REMINDER_TEXT = ("👋 Давно не виделись! Слова сами себя не выучат – "
+                 "нажми «Новое слово 🆕», чтобы продолжить.")
+
+
+def reminder_name(day: datetime.date) -> str:
+    """
+    Имя напоминания за день day: одно на день, сколько бы процессов его ни создавали
+    """
+    return f"reminder:{day.isoformat()}"
+
+
+class Broadcaster:
+    """
+    Поток рассылок. store – хранилище с операциями рассылок (storage.Storage),
+    send(user_id, text) ставит сообщение в очередь и возвращает Future.
+    Раз в poll_interval секунд поток создает напоминание за сегодня, если уже наступил
+    remind_hour (-1 – без напоминаний), и отправляет самую старую незаконченную рассылку
+    """
+
+    def __init__(self, store, send, rate: float = 20, batch_size: int = 500, max_in_flight: int = 100,
+                 poll_interval: float = 30, remind_hour: int = -1, remind_after_days: float = 1,
+                 remind_max_days: float = 30, reminder_text: str = REMINDER_TEXT):
+        self.store = store
+        self.send = send
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.remind_hour = remind_hour
+        self.remind_after_days = remind_after_days
+        self.remind_max_days = remind_max_days
+        self.reminder_text = reminder_text
+        self.bucket = sender.TokenBucket(rate, rate)
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._reminded = None  # день последнего созданного напоминания
+
+        self.current = None  # id отправляемой рассылки
+        self.in_flight = 0
+        self.sent = 0
+        self.failed = 0
+        self.finished = 0
+        self.errors = 0
+        self._unsaved = [0, 0]  # отправлено и не отправлено, еще не записанные в рассылку
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="broadcaster", daemon=True)
+        self._thread.start()
+
+    def schedule_reminder(self, now: datetime.datetime = None):
+        """
+        Создает напоминание за сегодня, если наступил remind_hour и его еще нет
+        """
+        now = now or datetime.datetime.now()
+        if self.remind_hour < 0 or now.hour < self.remind_hour or self._reminded == now.date():
+            return None
+        moment = now.timestamp()
+        broadcast_id = self.store.create_broadcast(
+            reminder_name(now.date()), self.reminder_text,
+            active_after=moment - self.remind_max_days * DAY,
+            active_before=moment - self.remind_after_days * DAY,
+        )
+        self._reminded = now.date()
+        return broadcast_id
+
+    def run_once(self) -> bool:
+        """
+        Отправляет самую старую незаконченную рассылку, False – если таких нет
+        """
+        self.schedule_reminder()
+        broadcast = self.store.next_broadcast()
+        if broadcast is None:
+            return False
+        self._send(*broadcast)
+        return True
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception as e:
+                self.errors += 1
+                print(f"Ошибка при рассылке: {e}")
+            self._stopping.wait(self.poll_interval)
+
+    def _send(self, broadcast_id, text):
+        self.current = broadcast_id
+        try:
+            while not self._stopping.is_set():
+                users = self.store.claim_broadcast_page(broadcast_id, self.batch_size)
+                if not users:
+                    with self._lock:
+                        self.finished += 1
+                    break
+                for user_id in users:
+                    # Остановка или ошибка посреди страницы: курсор возвращается к первому неотправленному
+                    try:
+                        queued = self._acquire() and self._dispatch(user_id, text)
+                    except Exception:
+                        self._rewind(broadcast_id, users[-1], user_id)
+                        raise
+                    if not queued:
+                        self._rewind(broadcast_id, users[-1], user_id)
+                        return
+                self._save(broadcast_id)
+            self._drain()
+            self._save(broadcast_id)
+        finally:
+            self.current = None
+
+    def _acquire(self) -> bool:
+        """
+        Ждет места среди max_in_flight и токена частоты, False – если поток останавливается
+        """
+        while not self._slots.acquire(timeout=0.5):
+            if self._stopping.is_set():
+                return False
+        while True:
+            delay = self.bucket.delay(time.monotonic())
+            if not delay:
+                self.bucket.consume()
+                return True
+            if self._stopping.wait(delay):
+                self._slots.release()
+                return False
+
+    def _dispatch(self, user_id, text) -> bool:
+        with self._lock:
+            self.in_flight += 1
+        try:
+            future = self.send(user_id, text)
+        except Exception:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda done: self._done(done.exception() is None))
+        return True
+
+    def _done(self, delivered: bool):
+        with self._lock:
+            self.in_flight -= 1
+            if delivered:
+                self.sent += 1
+                self._unsaved[0] += 1
+            else:
+                self.failed += 1
+                self._unsaved[1] += 1
+        self._slots.release()
+
+    def _drain(self, timeout: float = 10.0):
+        """
+        Ждет ответа на уже отправленные сообщения, чтобы записать их в счетчики рассылки
+        """
+        deadline = time.monotonic() + timeout
+        while self.in_flight and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _save(self, broadcast_id, claimed_until=None, resume_from=None):
+        with self._lock:
+            sent, failed = self._unsaved
+            self._unsaved = [0, 0]
+        self.store.save_broadcast_progress(broadcast_id, sent, failed, claimed_until, resume_from)
+
+    def _rewind(self, broadcast_id, claimed_until, resume_from):
+        self._drain()
+        self._save(broadcast_id, claimed_until, resume_from)
+
+    def stop(self, timeout: float = 15.0):
+        """
+        Останавливает поток, дождавшись отправки уже поставленных в очередь сообщений
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"current_broadcast": self.current or 0, "in_flight": self.in_flight, "sent": self.sent,
+                    "failed": self.failed, "finished": self.finished, "errors": self.errors}
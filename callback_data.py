@@ -0,0 +1,52 @@
+import base64
+import hashlib
+import hmac
+
+# Данные inline-кнопок (callback_data, не длиннее 64 байт): поля через ":" и подпись HMAC.
+# Подпись считается от данных и ID пользователя, поэтому кнопку нельзя подделать или
+# нажать за другого пользователя, а ответ может обработать любой процесс бота с тем же
+# секретом – на сервере для этого ничего не хранится.
+
+SEPARATOR = ":"
+# Байт подписи (HMAC-SHA256 обрезается), в base64 это 11 символов
+TAG_BYTES = 8
+MAX_LENGTH = 64
+
+
+class CallbackSigner:
+    def __init__(self, secret: bytes):
+        self._key = secret
+
+    @classmethod
+    def from_config(cls, config, token: str):
+        """
+        Секрет из callback_secret секции [quiz]; если он не задан – производный от токена бота,
+        одинаковый у всех процессов одного бота
+        """
+        secret = config.get('quiz', 'callback_secret', fallback='')
+        if secret:
+            return cls(secret.encode('utf-8'))
+        return cls(hashlib.sha256(b"callback_data:" + token.encode('utf-8')).digest())
+
+    def _tag(self, user_id: int, payload: str) -> str:
+        digest = hmac.new(self._key, f"{user_id}{SEPARATOR}{payload}".encode('utf-8'), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:TAG_BYTES]).rstrip(b"=").decode('ascii')
+
+    def sign(self, user_id: int, *fields) -> str:
+        """
+        callback_data из полей (без ":") для кнопки, которую нажмет user_id
+        """
+        payload = SEPARATOR.join(map(str, fields))
+        data = f"{payload}{SEPARATOR}{self._tag(user_id, payload)}"
+        if len(data.encode('utf-8')) > MAX_LENGTH:
+            raise ValueError(f"callback_data длиннее {MAX_LENGTH} байт: {data}")
+        return data
+
+    def verify(self, user_id: int, data: str):
+        """
+        Поля из callback_data, если подпись верна для user_id, иначе None
+        """
+        payload, _, tag = (data or "").rpartition(SEPARATOR)
+        if not payload or not hmac.compare_digest(tag, self._tag(user_id, payload)):
+            return None
+        return payload.split(SEPARATOR)
@@ -1,7 +1,14 @@
-import psycopg2
-from psycopg2 import sql, errors
-from datetime import datetime
 import configparser
+import random
+import threading
+
+import db_pool
+import metrics
+import migrations
+import spaced
+import user_stats
+import word_cache
+import write_behind
  
 config = configparser.ConfigParser()
 config.read('config.ini', encoding = 'utf-8')
@@ -16,179 +23,132 @@ DB_CONFIG = {
     "host": "localhost",
     "port": "5432"
 }
+
+# Настройки пула соединений, секция [database] в config.ini
+POOL_CONFIG = {
+    "min_size": config.getint('database', 'pool_min', fallback=1),
+    "max_size": config.getint('database', 'pool_max', fallback=10),
+    "timeout": config.getfloat('database', 'checkout_timeout', fallback=5.0),
+    "health_check_interval": config.getfloat('database', 'health_check_interval', fallback=30.0),
+}
+
+# Применять недостающие миграции при запуске бота
+AUTO_MIGRATE = config.getboolean('database', 'auto_migrate', fallback=True)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Кэш слов по id, секция [cache] в config.ini
+words_cache = word_cache.WordCache(int(config.getfloat('cache', 'max_mb', fallback=16) * 1024 * 1024))
+CACHE_NOTIFY = config.getboolean('cache', 'notify', fallback=False)
+_cache_listener = None
+
+# Как выбирается следующее слово, секция [quiz]: random – случайное слово,
+# spaced – интервальное повторение (см. spaced.py)
+WORD_SELECTION = config.get('quiz', 'selection', fallback='random')
+
+# Отложенная запись активности, ответов, выученных и удаленных слов, секция [write_behind]
+writes = write_behind.WriteBehind(
+    lambda: get_pool(),
+    flush_interval=config.getfloat('write_behind', 'flush_interval', fallback=1.0),
+    max_rows=config.getint('write_behind', 'max_rows', fallback=500),
+    max_pending=config.getint('write_behind', 'max_pending', fallback=100000),
+)
+
+# Число общих слов одинаково у всех пользователей и меняется только при загрузке словаря,
+# поэтому для статистики оно хранится в процессе и обновляется при сверке счетчиков
+global_words = None
+
+# Кто должен узнать об изменении набора слов пользователя (например, prefetch.Prefetcher)
+_vocabulary_listeners = []
+
+
+def add_vocabulary_listener(listener):
+    """
+    listener(user_id, word_id) вызывается после удаления слова word_id из списка пользователя
+    и listener(user_id, None) после добавления пользователем своего слова
+    """
+    _vocabulary_listeners.append(listener)
+
+
+def notify_vocabulary_changed(user_id, word_id=None):
+    for listener in _vocabulary_listeners:
+        listener(user_id, word_id)
+
+
+def get_pool():
+    """
+    Возвращает общий пул соединений, создавая его при первом обращении
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = db_pool.ConnectionPool(DB_CONFIG, **POOL_CONFIG)
+                pool.warm_up()
+                _pool = pool
+    return _pool
+
+
+def pool_stats():
+    """
+    Статистика использования пула соединений
+    """
+    return get_pool().stats()
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
  
+def start_cache_listener():
+    """
+    Подписывает кэш слов на LISTEN words_changed, если notify включен в секции [cache]
+    """
+    global _cache_listener
+    if CACHE_NOTIFY and _cache_listener is None:
+        _cache_listener = word_cache.WordCacheListener(words_cache, DB_CONFIG)
+        _cache_listener.start()
+
+
+def stop_cache_listener():
+    global _cache_listener
+    if _cache_listener is not None:
+        _cache_listener.stop()
+        _cache_listener = None
+
+
 def create_database():
     """
     Функция, которая создает таблицы в базе данных с учетом сохранения прогресса
-    Всего в БД 5 таблицы:
+    Всего в БД 4 таблицы:
     Пользователи
     Слова
-    Связующая таблица для Пользователей и слов
     Удаленные пользователями слова
     Таблица, сохраняющая историю
+
+    Общие слова (words.user_id IS NULL) не копируются каждому пользователю: они
+    по умолчанию входят в словарь любого пользователя, а в БД хранятся только
+    отличия — свои слова, удаления и прогресс.
+
+    Схема создается и обновляется миграциями (см. migrations.py). При запуске проверяется
+    только версия схемы; если auto_migrate в секции [database] выключен, миграции
+    применяются отдельно командой python manage.py migrate.
     """
-    conn = psycopg2.connect(**DB_CONFIG)
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name='words' AND column_name='user_id'
-        """)
-        if not cur.fetchone():
-            # Добавляем столбец если его нет
-            cur.execute("ALTER TABLE words ADD COLUMN user_id BIGINT;")
-            conn.commit()
-        
-        # Проверяем существование ограничения
-        cur.execute("""
-            SELECT constraint_name 
-            FROM information_schema.table_constraints 
-            WHERE table_name='words' AND constraint_name='unique_word_per_user'
-        """)
-        if not cur.fetchone():
-            # Добавляем ограничение если его нет
-            cur.execute("""
-                ALTER TABLE words 
-                ADD CONSTRAINT unique_word_per_user 
-                UNIQUE (russian_word, user_id);
-            """)
-            conn.commit()
-        # Таблица пользователей
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS users(
-            id BIGINT PRIMARY KEY,
-            name VARCHAR(100),
-            created_at TIMESTAMP DEFAULT NOW(),
-            last_active TIMESTAMP DEFAULT NOW()
-            );
-        """)
- 
-        # Таблица слов (добавляем user_id)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS words(
-            id SERIAL PRIMARY KEY,
-            russian_word VARCHAR(50) NOT NULL, 
-            target_word VARCHAR(50) NOT NULL,
-            other_word_1 VARCHAR(50) NOT NULL,
-            other_word_2 VARCHAR(50) NOT NULL,
-            other_word_3 VARCHAR(50) NOT NULL,
-            user_id BIGINT,  
-            added_at TIMESTAMP DEFAULT NOW(),
-            CONSTRAINT unique_word_per_user UNIQUE (russian_word, user_id)
-            );
-        """)
- 
-        # Связующая таблица (для слов в изучении)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS user_word(
-            user_id BIGINT NOT NULL,
-            words_id INTEGER NOT NULL,
-            added_at TIMESTAMP DEFAULT NOW(),
-            PRIMARY KEY (user_id, words_id),
-            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-            FOREIGN KEY (words_id) REFERENCES words(id) ON DELETE CASCADE
-            );
-        """)
- 
-        # Таблица удаленных слов (для сохранения прогресса)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS deleted_words(
-            user_id BIGINT NOT NULL,
-            words_id INTEGER NOT NULL,
-            deleted_at TIMESTAMP DEFAULT NOW(),
-            PRIMARY KEY (user_id, words_id),
-            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-            FOREIGN KEY (words_id) REFERENCES words(id) ON DELETE CASCADE
-            );
-        """)
- 
-        # Таблица для хранения истории
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS learned_words(
-            user_id BIGINT NOT NULL,
-            words_id INTEGER NOT NULL,
-            learned_at TIMESTAMP DEFAULT NOW(),
-            PRIMARY KEY (user_id, words_id),
-            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-            FOREIGN KEY (words_id) REFERENCES words(id) ON DELETE CASCADE
-            );
-        """)
- 
-        # Индексы для ускорения запросов
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_user_word_user_id ON user_word(user_id);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_deleted_words_user_id ON deleted_words(user_id);")
- 
-        # Добавляем начальный набор слов, в последствии этот момент можно доработать, чтобы слова подгружались из CSV или JSON фалов
-        initial_words = [
-            ('Кот', 'Cat', 'Dog', 'White', 'Tree'),
-            ('Собака', 'Dog', 'Green', 'Animal', 'Table'),
-            ('Дом', 'House', 'Building', 'Home', 'Roof'),
-            ('Солнце', 'Sun', 'Star', 'Light', 'Sky'),
-            ('Вода', 'Water', 'Liquid', 'Ocean', 'Rain'),
-            ('Огонь', 'Fire', 'Flame', 'Heat', 'Burn'),
-            ('Земля', 'Earth', 'Ground', 'Soil', 'World'),
-            ('Воздух', 'Air', 'Wind', 'Breeze', 'Atmosphere'),
-            ('Дерево', 'Tree', 'Wood', 'Forest', 'Leaf'),
-            ('Цветок', 'Flower', 'Rose', 'Plant', 'Bloom'),
-            ('Книга', 'Book', 'Page', 'Read', 'Library'),
-            ('Ручка', 'Pen', 'Pencil', 'Write', 'Ink'),
-            ('Стол', 'Table', 'Desk', 'Wooden', 'Chair'),
-            ('Стул', 'Chair', 'Seat', 'Furniture', 'Bench'),
-            ('Окно', 'Window', 'Glass', 'View', 'Open'),
-            ('Дверь', 'Door', 'Entrance', 'Exit', 'Handle'),
-            ('Город', 'City', 'Town', 'Urban', 'Street'),
-            ('Деревня', 'Village', 'Country', 'Rural', 'Farm'),
-            ('Машина', 'Car', 'Vehicle', 'Drive', 'Road'),
-            ('Поезд', 'Train', 'Railway', 'Station', 'Track'),
-            ('Самолет', 'Airplane', 'Fly', 'Airport', 'Wings'),
-            ('Корабль', 'Ship', 'Boat', 'Sail', 'Ocean'),
-            ('Деньги', 'Money', 'Cash', 'Currency', 'Wealth'),
-            ('Работа', 'Work', 'Job', 'Office', 'Career'),
-            ('Школа', 'School', 'Education', 'Learn', 'Teacher'),
-            ('Университет', 'University', 'College', 'Study', 'Degree'),
-            ('Больница', 'Hospital', 'Doctor', 'Medicine', 'Health'),
-            ('Парк', 'Park', 'Garden', 'Walk', 'Nature'),
-            ('Река', 'River', 'Stream', 'Water', 'Flow'),
-            ('Гора', 'Mountain', 'Peak', 'Climb', 'Hill'),
-            ('Лес', 'Forest', 'Woods', 'Trees', 'Wild'),
-            ('Море', 'Sea', 'Ocean', 'Beach', 'Wave'),
-            ('Озеро', 'Lake', 'Pond', 'Water', 'Fish'),
-            ('Птица', 'Bird', 'Fly', 'Wings', 'Feather'),
-            ('Рыба', 'Fish', 'Swim', 'Water', 'Ocean'),
-            ('Змея', 'Snake', 'Reptile', 'Slither', 'Venom'),
-            ('Лошадь', 'Horse', 'Animal', 'Ride', 'Gallop'),
-            ('Корова', 'Cow', 'Farm', 'Milk', 'Animal'),
-            ('Овца', 'Sheep', 'Wool', 'Farm', 'Animal'),
-            ('Свинья', 'Pig', 'Farm', 'Pork', 'Animal'),
-            ('Курица', 'Chicken', 'Bird', 'Farm', 'Egg'),
-            ('Хлеб', 'Bread', 'Bakery', 'Wheat', 'Loaf'),
-            ('Молоко', 'Milk', 'Dairy', 'Cow', 'White'),
-            ('Сыр', 'Cheese', 'Dairy', 'Milk', 'Yellow'),
-            ('Мясо', 'Meat', 'Beef', 'Chicken', 'Pork'),
-            ('Фрукт', 'Fruit', 'Apple', 'Banana', 'Orange'),
-            ('Овощ', 'Vegetable', 'Carrot', 'Potato', 'Tomato'),
-            ('Яблоко', 'Apple', 'Fruit', 'Red', 'Tree'),
-            ('Банан', 'Banana', 'Fruit', 'Yellow', 'Peel'),
-            ('Апельсин', 'Orange', 'Fruit', 'Citrus', 'Juice')
-        ]
- 
-        for word in initial_words:
-            try:
-                cur.execute("""
-                    INSERT INTO words (russian_word, target_word, other_word_1, other_word_2, other_word_3)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (russian_word) DO NOTHING;
-                """, word)
-            except errors.UniqueViolation:
-                conn.rollback()
- 
-        conn.commit()
-    conn.close()
- 
+    with get_pool().connection() as conn:
+        applied = migrations.ensure_schema(conn, AUTO_MIGRATE)
+    if applied:
+        print(f"Применены миграции: {', '.join(map(str, applied))}")
+
+
+@metrics.query('add_user_if_not_exists')
 def add_user_if_not_exists(user_id: int, username: str):
-    conn = psycopg2.connect(**DB_CONFIG)
-    with conn.cursor() as cur:
-        # 1. Добавляем/обновляем пользователя
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        # Добавляем/обновляем пользователя, общие слова доступны ему без копирования
         cur.execute("""
             INSERT INTO users (id, name)
             VALUES (%s, %s)
@@ -196,83 +156,239 @@ def add_user_if_not_exists(user_id: int, username: str):
             SET name = EXCLUDED.name,
                 last_active = NOW();
         """, (user_id, username))
+        # У нового пользователя счетчики точны с самого начала
         cur.execute("""
-            INSERT INTO user_word (user_id, words_id)
-            SELECT %s, w.id
-            FROM words w
-            WHERE 
-                (w.user_id IS NULL OR w.user_id = %s)
-                AND NOT EXISTS (
-                    SELECT 1 FROM user_word uw 
-                    WHERE uw.user_id = %s AND uw.words_id = w.id
-                )
-                AND NOT EXISTS (
-                    SELECT 1 FROM deleted_words dw
-                    WHERE dw.user_id = %s AND dw.words_id = w.id
-                )
-        """, (user_id, user_id, user_id, user_id))
+            INSERT INTO user_stats (user_id, reconciled_at)
+            VALUES (%s, NOW())
+            ON CONFLICT (user_id) DO NOTHING;
+        """, (user_id,))
         
         conn.commit()
-    conn.close()
 
 
+# Выбор случайного слова без ORDER BY RANDOM(): у каждого слова есть случайный ключ rand_key,
+# берем несколько слов с ключом не меньше случайного порога и выбираем одно из них.
+# Общие слова и слова пользователя ищутся отдельно по своим индексам, поэтому запрос
+# читает несколько строк индекса вместо сортировки всего словаря. Выбор из нескольких
+# соседей, а не только первого, сглаживает неравномерность промежутков между ключами.
+RANDOM_WORD_SAMPLE = 8
+
+RANDOM_WORD_SQL = """
+    SELECT id, russian_word, target_word, other_word_1, other_word_2, other_word_3
+    FROM (
+        (SELECT w.id, w.russian_word, w.target_word,
+                w.other_word_1, w.other_word_2, w.other_word_3, w.rand_key
+         FROM words w
+         WHERE w.user_id IS NULL AND w.rand_key >= %(threshold)s
+         AND w.id <> ALL(%(excluded)s::integer[])
+         AND NOT EXISTS (
+             SELECT 1 FROM deleted_words dw
+             WHERE dw.user_id = %(user_id)s AND dw.words_id = w.id
+         )
+         ORDER BY w.rand_key
+         LIMIT %(limit)s)
+        UNION ALL
+        (SELECT w.id, w.russian_word, w.target_word,
+                w.other_word_1, w.other_word_2, w.other_word_3, w.rand_key
+         FROM words w
+         WHERE w.user_id = %(user_id)s AND w.rand_key >= %(threshold)s
+         AND w.id <> ALL(%(excluded)s::integer[])
+         AND NOT EXISTS (
+             SELECT 1 FROM deleted_words dw
+             WHERE dw.user_id = %(user_id)s AND dw.words_id = w.id
+         )
+         ORDER BY w.rand_key
+         LIMIT %(limit)s)
+    ) candidates
+    ORDER BY rand_key
+    LIMIT %(limit)s;
+"""
+
+
+@metrics.query('get_random_user_word')
 def get_random_user_word(user_id: int):
-    conn = psycopg2.connect(**DB_CONFIG)
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT w.id, w.russian_word, w.target_word, 
-                   w.other_word_1, w.other_word_2, w.other_word_3
-            FROM words w
-            JOIN user_word uw ON w.id = uw.words_id
-            WHERE uw.user_id = %s
-            AND (uw.user_id = %s OR uw.user_id IS NULL)
-            AND NOT EXISTS (  
-                SELECT 1 FROM deleted_words dw 
-                WHERE dw.user_id = %s AND dw.words_id = w.id
-            )
-            ORDER BY RANDOM()
-            LIMIT 1;
-        """, (user_id, user_id, user_id))
-        return cur.fetchone()
-    conn.close()
+    version = words_cache.version()
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        threshold = random.random()
+        # Удаления, которые еще ждут записи в deleted_words
+        excluded = writes.pending_deletions(user_id)
+        cur.execute(RANDOM_WORD_SQL, {"user_id": user_id, "threshold": threshold,
+                                      "limit": RANDOM_WORD_SAMPLE, "excluded": excluded})
+        words = cur.fetchall()
+        if len(words) < RANDOM_WORD_SAMPLE:
+            # Дошли до конца индекса, добираем кандидатов с его начала
+            cur.execute(RANDOM_WORD_SQL, {"user_id": user_id, "threshold": 0.0,
+                                          "limit": RANDOM_WORD_SAMPLE - len(words), "excluded": excluded})
+            seen = {word[0] for word in words}
+            words += [word for word in cur.fetchall() if word[0] not in seen]
+    # Кандидаты попадают в кэш: повторная попытка по слову обойдется без запроса
+    words_cache.put_many(words, version)
+    return random.choice(words) if words else None
 
- 
-def remove_user_word(user_id: int, word_id: int):
+
+# Интервальное повторение. Слово с самым ранним due_at – первая строка индекса
+# (user_id, due_at), последний столбец показывает, пора ли его повторять
+NEXT_DUE_WORD_SQL = """
+    SELECT w.id, w.russian_word, w.target_word,
+           w.other_word_1, w.other_word_2, w.other_word_3, p.due_at <= NOW()
+    FROM word_progress p
+    JOIN words w ON w.id = p.words_id
+    WHERE p.user_id = %(user_id)s
+    AND p.words_id <> ALL(%(excluded)s::integer[])
+    ORDER BY p.due_at
+    LIMIT 1;
+"""
+
+# Новые слова показываются по возрастанию id: следующее новое слово – первое с id больше
+# наибольшего id в прогрессе пользователя. Слова, добавленные позже, получают больший id
+# и не пропускаются, а поиск остается одним шагом по индексу
+NEW_WORD_SQL = """
+    SELECT id, russian_word, target_word, other_word_1, other_word_2, other_word_3
+    FROM (
+        (SELECT w.id, w.russian_word, w.target_word,
+                w.other_word_1, w.other_word_2, w.other_word_3
+         FROM words w
+         WHERE w.user_id IS NULL
+         AND w.id > (SELECT COALESCE(MAX(words_id), 0) FROM word_progress WHERE user_id = %(user_id)s)
+         AND w.id <> ALL(%(excluded)s::integer[])
+         AND NOT EXISTS (
+             SELECT 1 FROM deleted_words dw
+             WHERE dw.user_id = %(user_id)s AND dw.words_id = w.id
+         )
+         ORDER BY w.id
+         LIMIT 1)
+        UNION ALL
+        (SELECT w.id, w.russian_word, w.target_word,
+                w.other_word_1, w.other_word_2, w.other_word_3
+         FROM words w
+         WHERE w.user_id = %(user_id)s
+         AND w.id > (SELECT COALESCE(MAX(words_id), 0) FROM word_progress WHERE user_id = %(user_id)s)
+         AND w.id <> ALL(%(excluded)s::integer[])
+         AND NOT EXISTS (
+             SELECT 1 FROM deleted_words dw
+             WHERE dw.user_id = %(user_id)s AND dw.words_id = w.id
+         )
+         ORDER BY w.id
+         LIMIT 1)
+    ) candidates
+    ORDER BY id
+    LIMIT 1;
+"""
+
+REVIEW_SQL = """
+    INSERT INTO word_progress (user_id, words_id, repetitions, interval_days, ease, due_at, reviewed_at)
+    VALUES (%s, %s, %s, %s, %s, NOW() + make_interval(secs => %s), NOW())
+    ON CONFLICT (user_id, words_id) DO UPDATE
+    SET repetitions = EXCLUDED.repetitions,
+        interval_days = EXCLUDED.interval_days,
+        ease = EXCLUDED.ease,
+        due_at = EXCLUDED.due_at,
+        reviewed_at = EXCLUDED.reviewed_at;
+"""
+
+
+@metrics.query('get_next_user_word')
+def get_next_user_word(user_id: int):
+    """
+    Следующее слово для вопроса: случайное или, в режиме spaced, слово, которое пора
+    повторить, иначе новое, а если новых нет – ближайшее к повторению
+    """
+    if WORD_SELECTION != 'spaced':
+        return get_random_user_word(user_id)
+    params = {"user_id": user_id, "excluded": writes.pending_deletions(user_id)}
+    version = words_cache.version()
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute(NEXT_DUE_WORD_SQL, params)
+        due = cur.fetchone()
+        word = due[:-1] if due else None
+        if due is None or not due[-1]:
+            cur.execute(NEW_WORD_SQL, params)
+            word = cur.fetchone() or word
+    words_cache.put(word, version)
+    return word
+
+
+@metrics.query('record_review')
+def record_review(user_id: int, word_id: int, quality: int):
     """
-    Функция удаляет связь между пользователем и словом
+    Пересчитывает интервал повторения слова по качеству ответа (см. spaced.py).
+    В режиме random прогресс не ведется
     """
-    conn = psycopg2.connect(**DB_CONFIG)
-    try:
-        with conn.cursor() as cur:
-            # Удаляем связь пользователь-слово
+    if WORD_SELECTION != 'spaced':
+        return
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        try:
             cur.execute("""
-                DELETE FROM user_word
+                SELECT repetitions, interval_days, ease
+                FROM word_progress
                 WHERE user_id = %s AND words_id = %s
+                FOR UPDATE;
             """, (user_id, word_id))
-            
-            # Добавляем запись в deleted_words
-            cur.execute("""
-                INSERT INTO deleted_words (user_id, words_id)
-                VALUES (%s, %s)
-                ON CONFLICT (user_id, words_id) DO NOTHING;
-            """, (user_id, word_id))
-            
+            progress = cur.fetchone() or (0, 0.0, spaced.DEFAULT_EASE)
+            repetitions, interval, ease, delay = spaced.review(*progress, quality)
+            cur.execute(REVIEW_SQL, (user_id, word_id, repetitions, interval, ease, delay))
             conn.commit()
-            return True
-    except Exception as e:
-        conn.rollback()
-        print(f"Ошибка при удалении слова: {e}")
-        return False
-    finally:
-        conn.close()
+        except Exception as e:
+            conn.rollback()
+            metrics.error("record_review")
+            print(f"Ошибка при сохранении прогресса: {e}")
 
 
+@metrics.query('keep_word')
+def keep_word(user_id: int, word_id: int):
+    """
+    "Оставить слово": слово вернется на повторение не позже чем через spaced.KEEP_DELAY
+    """
+    if WORD_SELECTION != 'spaced':
+        return
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE word_progress
+            SET due_at = LEAST(due_at, NOW() + make_interval(secs => %s))
+            WHERE user_id = %s AND words_id = %s;
+        """, (spaced.KEEP_DELAY, user_id, word_id))
+        conn.commit()
+
+ 
+def remove_user_word(user_id: int, word_id: int):
+    """
+    Функция убирает слово из списка изучения пользователя.
+    Запись в deleted_words отложена (см. write_behind.py), до нее слово
+    исключается из выборки по списку отложенных удалений. Ошибка записи
+    не видна пользователю: удаление остается в буфере до следующей пачки
+    """
+    writes.deleted(user_id, word_id)
+    notify_vocabulary_changed(user_id, word_id)
+
+
+def mark_word_learned(user_id: int, word_id: int):
+    """
+    Слово выучено: попадает в историю learned_words и убирается из списка изучения
+    """
+    writes.learned(user_id, word_id)
+    remove_user_word(user_id, word_id)
+
+
+def record_answer(user_id: int, word_id: int, correct: bool, attempt: int = 1):
+    """
+    Сохраняет ответ пользователя в историю answer_events (отложенно)
+    """
+    writes.answer(user_id, word_id, correct, attempt)
+
+
+def touch_user(user_id: int):
+    """
+    Обновляет время последней активности пользователя (отложенно)
+    """
+    writes.touch(user_id)
+
+
+@metrics.query('add_custom_word')
 def add_custom_word(user_id: int, russian: str, target_word: str, wrong1: str, wrong2: str, wrong3: str):
     """
     Добавляет слово, которое будет доступно только этому пользователю.
     """
-    conn = psycopg2.connect(**DB_CONFIG)
-    with conn.cursor() as cur:
+    with get_pool().connection() as conn, conn.cursor() as cur:
         try:
             # Пытаемся добавить слово с привязкой к пользователю
             cur.execute("""
@@ -287,33 +403,240 @@ def add_custom_word(user_id: int, russian: str, target_word: str, wrong1: str, w
                 conn.rollback()
                 return False
             
-            # Связываем слово с пользователем
             cur.execute("""
-                INSERT INTO user_word (user_id, words_id)
-                VALUES (%s, %s)
-                ON CONFLICT (user_id, words_id) DO NOTHING;
-            """, (user_id, word_id[0]))
-            
+                INSERT INTO user_stats AS s (user_id, custom_words)
+                SELECT id, 1 FROM users WHERE id = %s
+                ON CONFLICT (user_id) DO UPDATE SET custom_words = s.custom_words + 1;
+            """, (user_id,))
             conn.commit()
+            words_cache.invalidate(word_id[0])
+            notify_vocabulary_changed(user_id)
             return True
         except Exception as e:
             conn.rollback()
+            metrics.error("add_custom_word")
             print(f"Ошибка при добавлении слова: {e}")
             return False
-    conn.close()
 
 
+@metrics.query('get_word_by_id')
 def get_word_by_id(word_id):
     """
     Функция получает слово по его ID
     """
-    conn = psycopg2.connect(**DB_CONFIG)
-    with conn.cursor() as cur:
+    word = words_cache.get(word_id)
+    if word is not None:
+        return word
+    version = words_cache.version()
+    with get_pool().connection() as conn, conn.cursor() as cur:
         cur.execute("""
             SELECT id, russian_word, target_word, 
                    other_word_1, other_word_2, other_word_3
             FROM words
             WHERE id = %s
         """, (word_id,))
+        word = cur.fetchone()
+    words_cache.put(word, version)
+    return word
+
+
+@metrics.query('get_target_words')
+def get_target_words():
+    """
+    Переводы всех слов с владельцем (None – общее слово) и id для подбора вариантов
+    (см. distractors.py), кроме своих слов, удаленных владельцем
+    """
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT w.target_word, w.user_id, w.id FROM words w
+            WHERE w.user_id IS NULL
+            OR NOT EXISTS (SELECT 1 FROM deleted_words dw WHERE dw.user_id = w.user_id AND dw.words_id = w.id)
+        """)
+        return cur.fetchall()
+
+
+@metrics.query('find_user_word_id')
+def find_user_word_id(user_id: int, russian_word: str):
+    """
+    Функция ищет ID слова из списка изучения пользователя по русскому написанию
+    без учета регистра, пробелов по краям и ё (индекс idx_words_normalized).
+    Из нескольких подходящих сначала свое слово, затем точно совпадающее по написанию
+    """
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT w.id 
+            FROM words w
+            WHERE (w.user_id IS NULL OR w.user_id = %(user_id)s)
+            AND normalize_word(w.russian_word) = normalize_word(%(word)s)
+            AND w.id <> ALL(%(pending)s::integer[])
+            AND NOT EXISTS (
+                SELECT 1 FROM deleted_words dw
+                WHERE dw.user_id = %(user_id)s AND dw.words_id = w.id
+            )
+            ORDER BY w.user_id NULLS LAST, w.russian_word <> %(word)s, w.id
+            LIMIT 1
+        """, {"user_id": user_id, "word": russian_word, "pending": writes.pending_deletions(user_id)})
+        result = cur.fetchone()
+    return result[0] if result else None
+
+
+@metrics.query('get_user_vocabulary')
+def get_user_vocabulary(user_id: int):
+    """
+    Пары (id, russian_word) всех слов, которые видит пользователь: общие без удаленных
+    и свои. По ним строятся подсказки при удалении слова (см. word_lookup.py)
+    """
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT w.id, w.russian_word
+            FROM words w
+            WHERE (w.user_id IS NULL OR w.user_id = %(user_id)s)
+            AND w.id <> ALL(%(pending)s::integer[])
+            AND NOT EXISTS (
+                SELECT 1 FROM deleted_words dw
+                WHERE dw.user_id = %(user_id)s AND dw.words_id = w.id
+            )
+        """, {"user_id": user_id, "pending": writes.pending_deletions(user_id)})
+        return cur.fetchall()
+
+
+@metrics.query('count_global_words')
+def count_global_words():
+    """
+    Обновляет число общих слов (global_words)
+    """
+    global global_words
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM words WHERE user_id IS NULL")
+        global_words = cur.fetchone()[0]
+    return global_words
+
+
+# Счетчики статистики пользователя, серия прервана, если вчера и сегодня ответов не было
+USER_STATS_SQL = """
+    SELECT custom_words, deleted_words, learned_words, answers, correct_answers,
+           CASE WHEN last_answer_date >= CURRENT_DATE - 1 THEN streak_days ELSE 0 END,
+           best_streak
+    FROM user_stats
+    WHERE user_id = %s
+"""
+
+
+@metrics.query('get_user_stats')
+def get_user_stats(user_id: int):
+    """
+    Статистика пользователя для /stats (см. user_stats.summary) из строки счетчиков user_stats
+    """
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute(USER_STATS_SQL, (user_id,))
+        row = cur.fetchone()
+    return user_stats.summary(global_words if global_words is not None else count_global_words(), row)
+
+
+@metrics.query('reconcile_stats')
+def reconcile_stats(limit=None):
+    """
+    Пересчитывает счетчики limit давно не сверенных пользователей (None – всех)
+    и число общих слов. Возвращает число сверенных пользователей
+    """
+    count_global_words()
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        try:
+            cur.execute(user_stats.RECONCILE_SQL, {"limit": limit})
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            metrics.error("reconcile_stats")
+            raise
+        return cur.rowcount
+
+
+# Страница получателей рассылки: keyset-пагинация по id (индекс idx_users_id_last_active),
+# окно last_active проверяется в том же индексе
+BROADCAST_PAGE_SQL = """
+    SELECT id
+    FROM users
+    WHERE id > %(after_id)s
+    AND last_active >= %(active_after)s AND last_active < %(active_before)s
+    ORDER BY id
+    LIMIT %(limit)s
+"""
+
+
+@metrics.query('create_broadcast')
+def create_broadcast(name, text: str, active_after=None, active_before=None):
+    """
+    Создает рассылку пользователям, которые последний раз заходили между active_after
+    и active_before (unix time, None – без ограничения). Рассылка с именем name создается
+    один раз, повторный вызов возвращает None
+    """
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO broadcasts (name, text, active_after, active_before)
+            VALUES (%s, %s, COALESCE(to_timestamp(%s)::timestamp, '-infinity'),
+                    COALESCE(to_timestamp(%s)::timestamp, 'infinity'))
+            ON CONFLICT (name) DO NOTHING
+            RETURNING id;
+        """, (name, text, active_after, active_before))
+        result = cur.fetchone()
+        conn.commit()
+    return result[0] if result else None
+
+
+@metrics.query('next_broadcast')
+def next_broadcast():
+    """
+    (id, текст) самой старой незаконченной рассылки или None
+    """
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id, text FROM broadcasts WHERE finished_at IS NULL ORDER BY id LIMIT 1")
         return cur.fetchone()
-    conn.close()
\ No newline at end of file
+
+
+@metrics.query('claim_broadcast_page')
+def claim_broadcast_page(broadcast_id: int, limit: int):
+    """
+    id следующих limit получателей рассылки. Курсор сдвигается на конец страницы
+    под блокировкой строки рассылки, поэтому несколько процессов бота не выдадут одного
+    получателя дважды. Пустой список – рассылка закончена
+    """
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT last_user_id, active_after, active_before
+            FROM broadcasts
+            WHERE id = %s AND finished_at IS NULL
+            FOR UPDATE
+        """, (broadcast_id,))
+        broadcast = cur.fetchone()
+        if broadcast is None:
+            conn.rollback()
+            return []
+        after_id, active_after, active_before = broadcast
+        cur.execute(BROADCAST_PAGE_SQL, {"after_id": after_id, "active_after": active_after,
+                                         "active_before": active_before, "limit": limit})
+        users = [row[0] for row in cur.fetchall()]
+        if users:
+            cur.execute("UPDATE broadcasts SET last_user_id = %s WHERE id = %s", (users[-1], broadcast_id))
+        else:
+            cur.execute("UPDATE broadcasts SET finished_at = NOW() WHERE id = %s", (broadcast_id,))
+        conn.commit()
+    return users
+
+
+@metrics.query('save_broadcast_progress')
+def save_broadcast_progress(broadcast_id: int, sent: int, failed: int, claimed_until=None, resume_from=None):
+    """
+    Прибавляет отправленные и неотправленные сообщения. Если курсор все еще на конце
+    выданной страницы claimed_until, возвращает его к получателю resume_from
+    """
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE broadcasts
+            SET sent = sent + %(sent)s,
+                failed = failed + %(failed)s,
+                last_user_id = CASE WHEN last_user_id = %(claimed_until)s THEN %(resume_from)s - 1
+                                    ELSE last_user_id END
+            WHERE id = %(broadcast_id)s
+        """, {"broadcast_id": broadcast_id, "sent": sent, "failed": failed,
+              "claimed_until": claimed_until, "resume_from": resume_from})
+        conn.commit()
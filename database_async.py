@@ -0,0 +1,278 @@
+import asyncio
+import random
+
+import asyncpg
+
+import database
+import metrics
+import spaced
+import user_stats
+
+# Асинхронные версии функций database.py на asyncpg для режима runtime = async.
+# Запросы те же, что и в синхронной версии, меняется только синтаксис параметров.
+
+RANDOM_WORD_SQL = (database.RANDOM_WORD_SQL
+                   .replace("%(user_id)s", "$1")
+                   .replace("%(threshold)s", "$2")
+                   .replace("%(limit)s", "$3")
+                   .replace("%(excluded)s", "$4"))
+
+NEXT_DUE_WORD_SQL = (database.NEXT_DUE_WORD_SQL
+                     .replace("%(user_id)s", "$1")
+                     .replace("%(excluded)s", "$2"))
+
+NEW_WORD_SQL = (database.NEW_WORD_SQL
+                .replace("%(user_id)s", "$1")
+                .replace("%(excluded)s", "$2"))
+
+REVIEW_SQL = database.REVIEW_SQL % ("$1", "$2", "$3", "$4", "$5", "$6")
+
+_pool = None
+
+
+async def init_pool():
+    """
+    Создает общий асинхронный пул соединений с настройками из секции [database]
+    """
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(
+            database=database.DB_CONFIG["database"],
+            user=database.DB_CONFIG["user"],
+            password=database.DB_CONFIG["password"],
+            host=database.DB_CONFIG["host"],
+            port=int(database.DB_CONFIG["port"]),
+            min_size=database.POOL_CONFIG["min_size"],
+            max_size=database.POOL_CONFIG["max_size"],
+        )
+    return _pool
+
+
+def get_pool():
+    if _pool is None:
+        raise RuntimeError("Асинхронный пул не создан, сначала вызовите init_pool()")
+    return _pool
+
+
+def _acquire():
+    return get_pool().acquire(timeout=database.POOL_CONFIG["timeout"])
+
+
+def pool_stats():
+    """
+    Статистика использования асинхронного пула соединений
+    """
+    pool = get_pool()
+    return {
+        "max_size": pool.get_max_size(),
+        "open": pool.get_size(),
+        "idle": pool.get_idle_size(),
+        "in_use": pool.get_size() - pool.get_idle_size(),
+    }
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def create_database():
+    # Схема создается один раз при старте, поэтому выполняем синхронную версию в отдельном потоке
+    await asyncio.to_thread(database.create_database)
+
+
+@metrics.query('add_user_if_not_exists')
+async def add_user_if_not_exists(user_id: int, username: str):
+    async with _acquire() as conn, conn.transaction():
+        await conn.execute("""
+            INSERT INTO users (id, name)
+            VALUES ($1, $2)
+            ON CONFLICT (id) DO UPDATE
+            SET name = EXCLUDED.name,
+                last_active = NOW();
+        """, user_id, username)
+        await conn.execute("""
+            INSERT INTO user_stats (user_id, reconciled_at)
+            VALUES ($1, NOW())
+            ON CONFLICT (user_id) DO NOTHING;
+        """, user_id)
+
+
+@metrics.query('get_random_user_word')
+async def get_random_user_word(user_id: int):
+    version = database.words_cache.version()
+    async with _acquire() as conn:
+        threshold = random.random()
+        excluded = database.writes.pending_deletions(user_id)
+        words = await conn.fetch(RANDOM_WORD_SQL, user_id, threshold, database.RANDOM_WORD_SAMPLE, excluded)
+        words = [tuple(word) for word in words]
+        if len(words) < database.RANDOM_WORD_SAMPLE:
+            # Дошли до конца индекса, добираем кандидатов с его начала
+            rest = await conn.fetch(RANDOM_WORD_SQL, user_id, 0.0,
+                                    database.RANDOM_WORD_SAMPLE - len(words), excluded)
+            seen = {word[0] for word in words}
+            words += [tuple(word) for word in rest if word[0] not in seen]
+    database.words_cache.put_many(words, version)
+    return random.choice(words) if words else None
+
+
+@metrics.query('get_next_user_word')
+async def get_next_user_word(user_id: int):
+    """
+    Следующее слово для вопроса в режиме из секции [quiz] (см. database.get_next_user_word)
+    """
+    if database.WORD_SELECTION != 'spaced':
+        return await get_random_user_word(user_id)
+    excluded = database.writes.pending_deletions(user_id)
+    version = database.words_cache.version()
+    async with _acquire() as conn:
+        due = await conn.fetchrow(NEXT_DUE_WORD_SQL, user_id, excluded)
+        word = tuple(due)[:-1] if due else None
+        if due is None or not due[-1]:
+            new = await conn.fetchrow(NEW_WORD_SQL, user_id, excluded)
+            word = tuple(new) if new else word
+    database.words_cache.put(word, version)
+    return word
+
+
+@metrics.query('record_review')
+async def record_review(user_id: int, word_id: int, quality: int):
+    """
+    Пересчитывает интервал повторения слова по качеству ответа (только в режиме spaced)
+    """
+    if database.WORD_SELECTION != 'spaced':
+        return
+    try:
+        async with _acquire() as conn, conn.transaction():
+            progress = await conn.fetchrow("""
+                SELECT repetitions, interval_days, ease
+                FROM word_progress
+                WHERE user_id = $1 AND words_id = $2
+                FOR UPDATE;
+            """, user_id, word_id)
+            progress = tuple(progress) if progress else (0, 0.0, spaced.DEFAULT_EASE)
+            repetitions, interval, ease, delay = spaced.review(*progress, quality)
+            await conn.execute(REVIEW_SQL, user_id, word_id, repetitions, interval, ease, float(delay))
+    except Exception as e:
+        metrics.error("record_review")
+        print(f"Ошибка при сохранении прогресса: {e}")
+
+
+@metrics.query('keep_word')
+async def keep_word(user_id: int, word_id: int):
+    """
+    "Оставить слово": слово вернется на повторение не позже чем через spaced.KEEP_DELAY
+    """
+    if database.WORD_SELECTION != 'spaced':
+        return
+    async with _acquire() as conn:
+        await conn.execute("""
+            UPDATE word_progress
+            SET due_at = LEAST(due_at, NOW() + make_interval(secs => $1))
+            WHERE user_id = $2 AND words_id = $3;
+        """, float(spaced.KEEP_DELAY), user_id, word_id)
+
+
+async def remove_user_word(user_id: int, word_id: int):
+    """
+    Функция убирает слово из списка изучения пользователя.
+    Запись отложенная и общая с синхронной версией (database.writes), поэтому без await в БД
+    """
+    database.remove_user_word(user_id, word_id)
+
+
+async def mark_word_learned(user_id: int, word_id: int):
+    database.mark_word_learned(user_id, word_id)
+
+
+@metrics.query('add_custom_word')
+async def add_custom_word(user_id: int, russian: str, target_word: str, wrong1: str, wrong2: str, wrong3: str):
+    """
+    Добавляет слово, которое будет доступно только этому пользователю.
+    """
+    try:
+        async with _acquire() as conn, conn.transaction():
+            word_id = await conn.fetchval("""
+                INSERT INTO words (russian_word, target_word, other_word_1, other_word_2, other_word_3, user_id)
+                VALUES ($1, $2, $3, $4, $5, $6)
+                ON CONFLICT (russian_word, user_id) DO NOTHING
+                RETURNING id;
+            """, russian, target_word, wrong1, wrong2, wrong3, user_id)
+            if word_id is not None:
+                await conn.execute("""
+                    INSERT INTO user_stats AS s (user_id, custom_words)
+                    SELECT id, 1 FROM users WHERE id = $1
+                    ON CONFLICT (user_id) DO UPDATE SET custom_words = s.custom_words + 1;
+                """, user_id)
+        if word_id is None:
+            return False
+        database.words_cache.invalidate(word_id)
+        database.notify_vocabulary_changed(user_id)
+        return True
+    except Exception as e:
+        metrics.error("add_custom_word")
+        print(f"Ошибка при добавлении слова: {e}")
+        return False
+
+
+@metrics.query('get_word_by_id')
+async def get_word_by_id(word_id):
+    """
+    Функция получает слово по его ID, кэш слов общий с синхронной версией
+    """
+    word = database.words_cache.get(word_id)
+    if word is not None:
+        return word
+    version = database.words_cache.version()
+    async with _acquire() as conn:
+        word = await conn.fetchrow("""
+            SELECT id, russian_word, target_word,
+                   other_word_1, other_word_2, other_word_3
+            FROM words
+            WHERE id = $1
+        """, word_id)
+    word = tuple(word) if word else None
+    database.words_cache.put(word, version)
+    return word
+
+
+@metrics.query('find_user_word_id')
+async def find_user_word_id(user_id: int, russian_word: str):
+    """
+    Функция ищет ID слова из списка изучения пользователя по русскому написанию
+    без учета регистра, пробелов по краям и ё (как database.find_user_word_id)
+    """
+    async with _acquire() as conn:
+        return await conn.fetchval("""
+            SELECT w.id
+            FROM words w
+            WHERE (w.user_id IS NULL OR w.user_id = $1)
+            AND normalize_word(w.russian_word) = normalize_word($2)
+            AND w.id <> ALL($3::integer[])
+            AND NOT EXISTS (
+                SELECT 1 FROM deleted_words dw
+                WHERE dw.user_id = $1 AND dw.words_id = w.id
+            )
+            ORDER BY w.user_id NULLS LAST, w.russian_word <> $2, w.id
+            LIMIT 1
+        """, user_id, russian_word, database.writes.pending_deletions(user_id))
+
+
+@metrics.query('get_user_stats')
+async def get_user_stats(user_id: int):
+    """
+    Статистика пользователя для /stats (как database.get_user_stats)
+    """
+    async with _acquire() as conn:
+        if database.global_words is None:
+            database.global_words = await conn.fetchval("SELECT COUNT(*) FROM words WHERE user_id IS NULL")
+        row = await conn.fetchrow("""
+            SELECT custom_words, deleted_words, learned_words, answers, correct_answers,
+                   CASE WHEN last_answer_date >= CURRENT_DATE - 1 THEN streak_days ELSE 0 END,
+                   best_streak
+            FROM user_stats
+            WHERE user_id = $1
+        """, user_id)
+    return user_stats.summary(database.global_words, tuple(row) if row else None)
@@ -0,0 +1,190 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(Exception):
+    """
+    Не удалось получить соединение из пула за отведенное время
+    """
+
+
+class ConnectionPool:
+    """
+    Ограниченный пул соединений с PostgreSQL.
+
+    Одновременно выдается не больше max_size соединений, остальные потоки ждут
+    освобождения не дольше timeout секунд. Соединение, которое пролежало в пуле
+    дольше health_check_interval секунд, перед выдачей проверяется запросом SELECT 1,
+    а сломанные соединения закрываются и заменяются новыми.
+    """
+
+    def __init__(self, dsn: dict, min_size: int = 1, max_size: int = 10,
+                 timeout: float = 5.0, health_check_interval: float = 30.0):
+        if max_size < 1:
+            raise ValueError("max_size должен быть больше 0")
+        self._dsn = dict(dsn)
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._idle = []  # [(conn, время возврата в пул)]
+        self._closed = False
+
+        # Статистика использования пула
+        self._in_use = 0
+        self._created = 0
+        self._discarded = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _connect(self):
+        conn = psycopg2.connect(**self._dsn)
+        with self._lock:
+            self._created += 1
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            self._discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_alive(self, conn) -> bool:
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def warm_up(self):
+        """
+        Заранее открывает min_size соединений
+        """
+        while True:
+            with self._lock:
+                if self._closed or self._created - self._discarded >= self.min_size:
+                    return
+            conn = self._connect()
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+
+    def getconn(self):
+        if self._closed:
+            raise PoolTimeout("Пул соединений закрыт")
+
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeout(
+                f"Нет свободных соединений в пуле ({self.max_size}) за {self.timeout} с"
+            )
+        waited = time.monotonic() - started
+
+        try:
+            conn = None
+            while conn is None:
+                with self._lock:
+                    item = self._idle.pop() if self._idle else None
+                if item is None:
+                    conn = self._connect()
+                    break
+                candidate, returned_at = item
+                if candidate.closed:
+                    self._discard(candidate)
+                elif (time.monotonic() - returned_at >= self.health_check_interval
+                        and not self._is_alive(candidate)):
+                    self._discard(candidate)
+                else:
+                    conn = candidate
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def putconn(self, conn, discard: bool = False):
+        try:
+            if not discard and not conn.closed:
+                status = conn.info.transaction_status
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    discard = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    # Незавершенную транзакцию откатываем, чтобы не отдать ее следующему
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        discard = True
+
+            if discard or conn.closed or self._closed:
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Выдает соединение из пула и гарантированно возвращает его обратно.
+        Коммит остается на вызывающем коде, незакоммиченное при возврате откатывается.
+        """
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.putconn(conn, discard=broken)
+
+    def stats(self) -> dict:
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                "max_size": self.max_size,
+                "open": self._created - self._discarded,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "created": self._created,
+                "discarded": self._discarded,
+                "checkouts": checkouts,
+                "timeouts": self._timeouts,
+                "wait_avg_ms": (self._wait_total / checkouts * 1000) if checkouts else 0.0,
+                "wait_max_ms": self._wait_max * 1000,
+            }
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
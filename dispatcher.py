@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import deque
+
+import telebot
+
+
+def update_user_id(update):
+    """
+    ID пользователя, от которого пришло обновление, или None
+    """
+    for event in (update.message, update.edited_message, update.callback_query):
+        if event is not None and event.from_user is not None:
+            return event.from_user.id
+    return None
+
+
+class OrderedDispatcher:
+    """
+    Пул рабочих потоков, который выполняет задачи параллельно для разных ключей,
+    но строго по очереди для одного ключа (ключ – ID пользователя).
+
+    У каждого ключа своя очередь задач. Ключ с задачами попадает в общую очередь
+    готовых ключей, и пока одна его задача выполняется, следующие ждут. Поэтому
+    медленный запрос одного пользователя задерживает только его самого, а не всех,
+    кто оказался с ним в одном потоке.
+    """
+
+    def __init__(self, workers: int = 4, queue_size: int = 10000):
+        self.workers = workers
+        self.queue_size = queue_size
+
+        self._cond = threading.Condition()
+        self._pending = {}  # ключ -> deque задач; ключ есть, пока у него есть задачи или одна выполняется
+        self._ready = deque()  # ключи с задачами, которые сейчас никто не выполняет
+        self._queued = 0
+        self._threads = []
+        self._stopping = False
+
+        self._started_at = None
+        self._busy = [0.0] * workers
+        self._processed = [0] * workers
+        self._errors = 0
+
+    def start(self):
+        with self._cond:
+            if self._threads:
+                return
+            self._stopping = False
+            self._started_at = time.monotonic()
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._worker, args=(number,),
+                                          name=f"dispatcher-{number}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, key, func, *args, **kwargs):
+        """
+        Ставит задачу в очередь ключа. Если задач в очереди больше queue_size,
+        ждет, пока освободится место
+        """
+        if not self._threads:
+            self.start()
+        with self._cond:
+            while self._queued >= self.queue_size and not self._stopping:
+                self._cond.wait()
+            if self._stopping:
+                raise RuntimeError("Диспетчер остановлен")
+            tasks = self._pending.get(key)
+            if tasks is None:
+                self._pending[key] = deque([(func, args, kwargs)])
+                self._ready.append(key)
+            else:
+                tasks.append((func, args, kwargs))
+            self._queued += 1
+            self._cond.notify_all()
+
+    def _worker(self, number: int):
+        while True:
+            with self._cond:
+                while not self._ready and not (self._stopping and not self._queued):
+                    self._cond.wait()
+                if not self._ready:
+                    return
+                key = self._ready.popleft()
+                func, args, kwargs = self._pending[key].popleft()
+
+            started = time.monotonic()
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                with self._cond:
+                    self._errors += 1
+                print(f"Ошибка при обработке обновления: {e}")
+            elapsed = time.monotonic() - started
+
+            with self._cond:
+                self._busy[number] += elapsed
+                self._processed[number] += 1
+                self._queued -= 1
+                if self._pending[key]:
+                    self._ready.append(key)
+                else:
+                    del self._pending[key]
+                self._cond.notify_all()
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Дожидается выполнения уже поставленных задач и останавливает потоки
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def stats(self) -> dict:
+        with self._cond:
+            uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+            return {
+                "workers": self.workers,
+                "queue_depth": self._queued,
+                "active_users": len(self._pending),
+                "errors": self._errors,
+                "processed": list(self._processed),
+                "utilization": [busy / uptime if uptime else 0.0 for busy in self._busy],
+            }
+
+
+class OrderedTeleBot(telebot.TeleBot):
+    """
+    TeleBot, который выполняет обработчики в OrderedDispatcher: обновления разных
+    пользователей обрабатываются параллельно, одного пользователя – по порядку.
+    Так user_states, deletion_data и цепочки register_next_step_handler одного
+    пользователя не меняются из нескольких потоков одновременно.
+    """
+
+    def __init__(self, token, workers: int = 4, queue_size: int = 10000, **kwargs):
+        kwargs["threaded"] = False
+        super().__init__(token, **kwargs)
+        self.dispatcher = OrderedDispatcher(workers, queue_size)
+
+    def process_new_updates(self, updates):
+        for update in updates:
+            # Смещение для getUpdates сдвигаем сразу, не дожидаясь обработки
+            if update.update_id > self.last_update_id:
+                self.last_update_id = update.update_id
+            user_id = update_user_id(update)
+            key = user_id if user_id is not None else ("update", update.update_id)
+            self.dispatcher.submit(key, super().process_new_updates, [update])
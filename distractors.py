@@ -0,0 +1,238 @@
+import random
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+# Неправильные варианты ответа, похожие на правильный перевод.
+# Каждый target_word словаря превращается в вектор n-грамм символов (биграммы и триграммы
+# слова с пробелами по краям, хешированные в DIMENSIONS ячеек) единичной длины. Векторы
+# слов одной длины лежат строками одной матрицы, и похожесть на перевод – умножение
+# матриц соседних длин (±LENGTH_SPREAD) на вектор перевода, поэтому выбор вариантов
+# занимает доли миллисекунды на словарях в десятки тысяч слов.
+# Из самых похожих слов (за вычетом почти совпадающих с переводом) берутся случайные три,
+# поэтому варианты у одного слова меняются от вопроса к вопросу.
+# Слова пользователя видны в вариантах только ему самому.
+# Свое слово попадает в индекс сразу после добавления (add), удаленное пользователем слово
+# перестает быть для него вариантом (invalidate – слушатель Storage.add_vocabulary_listener).
+# Слова, загруженные manage.py load-words, появляются при перечитывании словаря в фоне
+# раз в max_age секунд: до конца перечитывания варианты выбираются по старому индексу.
+
+DIMENSIONS = 128
+NGRAMS = (2, 3)
+# Из скольких самых похожих слов выбираются варианты
+CANDIDATES = 12
+# Слова похожее этого считаются тем же словом (Cat и cat, Color и Colour)
+MAX_SIMILARITY = 0.9
+# Варианты ищутся среди слов, длина которых отличается от перевода не больше чем на столько
+LENGTH_SPREAD = 2
+INITIAL_CAPACITY = 64
+GLOBAL_OWNER = -1
+# Для скольких пользователей помнить удаленные ими слова
+MAX_HIDDEN_USERS = 10000
+
+
+def vectorize(text: str):
+    """
+    Вектор n-грамм символов слова единичной длины
+    """
+    padded = f" {text.strip().lower()} "
+    counts = np.zeros(DIMENSIONS, dtype=np.float32)
+    for n in NGRAMS:
+        for start in range(len(padded) - n + 1):
+            counts[zlib.crc32(padded[start:start + n].encode('utf-8')) % DIMENSIONS] += 1
+    norm = np.linalg.norm(counts)
+    return counts / norm if norm else counts
+
+
+class _Bucket:
+    """
+    Слова одной длины: матрица векторов, владельцы и тексты. Массивы растут вдвое,
+    читатель, взявший старые массивы, дочитывает их без блокировки
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.vectors = np.zeros((INITIAL_CAPACITY, DIMENSIONS), dtype=np.float32)
+        self.owners = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self.texts = []
+
+    def append(self, vector, owner: int, text: str):
+        if self.size == len(self.owners):
+            capacity = 2 * len(self.owners)
+            vectors = np.zeros((capacity, DIMENSIONS), dtype=np.float32)
+            vectors[:self.size] = self.vectors[:self.size]
+            owners = np.zeros(capacity, dtype=np.int64)
+            owners[:self.size] = self.owners[:self.size]
+            self.vectors, self.owners = vectors, owners
+        self.vectors[self.size] = vector
+        self.owners[self.size] = owner
+        self.texts.append(text)
+        self.size += 1
+
+    def snapshot(self):
+        return self.vectors[:self.size], self.owners[:self.size], self.texts
+
+
+class DistractorIndex:
+    """
+    Индекс переводов для подбора неправильных вариантов. loader() возвращает строки
+    (target_word, user_id или None, id слова) всего словаря и вызывается при первом обращении
+    и затем раз в max_age секунд (0 – словарь читается один раз)
+    """
+
+    def __init__(self, loader=None, max_age: float = 0):
+        self.loader = loader
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._loaded = loader is None
+        self._loaded_at = None
+        self._reloading = None  # слова, добавленные во время перечитывания словаря
+        self._size = 0
+        self._buckets = {}  # длина -> _Bucket
+        self._keys = set()  # (перевод в нижнем регистре, владелец)
+        self._ids = {}  # id слова -> перевод в нижнем регистре
+        self._hidden = OrderedDict()  # user_id -> id слов, удаленных пользователем
+
+        self.reloads = 0
+
+    def __len__(self):
+        return self._size
+
+    def load(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            for row in self.loader():
+                self._append(*row)
+            self._loaded = True
+            self._loaded_at = time.monotonic()
+
+    def _refresh(self):
+        """
+        Запускает перечитывание словаря в фоне, если индекс старше max_age
+        """
+        if self.loader is None or self.max_age <= 0:
+            return
+        with self._lock:
+            if self._reloading is not None or time.monotonic() - self._loaded_at <= self.max_age:
+                return
+            self._reloading = []
+        threading.Thread(target=self._reload, name="distractor-index", daemon=True).start()
+
+    def _reload(self):
+        fresh = DistractorIndex()
+        try:
+            for row in self.loader():
+                fresh._append(*row)
+        except Exception as e:
+            print(f"Варианты ответа: не удалось перечитать словарь: {e}")
+            with self._lock:
+                self._reloading = None
+                self._loaded_at = time.monotonic()
+            return
+        with self._lock:
+            # Слова, добавленные во время чтения, могли в него не попасть
+            for text, owner in self._reloading:
+                fresh._append(text, owner)
+            self._buckets, self._keys, self._ids, self._size = fresh._buckets, fresh._keys, fresh._ids, fresh._size
+            self._reloading = None
+            self._loaded_at = time.monotonic()
+            self.reloads += 1
+
+    def _append(self, text: str, owner=None, word_id=None):
+        text = text.strip()
+        owner = GLOBAL_OWNER if owner is None else owner
+        key = (text.lower(), owner)
+        if word_id is not None:
+            self._ids[word_id] = text.lower()
+        if not text or key in self._keys or (text.lower(), GLOBAL_OWNER) in self._keys:
+            return
+        bucket = self._buckets.get(len(text))
+        if bucket is None:
+            bucket = self._buckets[len(text)] = _Bucket()
+        bucket.append(vectorize(text), owner, text)
+        self._keys.add(key)
+        self._size += 1
+
+    def add(self, text: str, owner=None):
+        """
+        Добавляет перевод в индекс (owner – пользователь, чье это слово, None – общее).
+        Пока индекс не загружен, ничего не делает: слово прочитает loader
+        """
+        with self._lock:
+            if self._loaded:
+                self._append(text, owner)
+                if self._reloading is not None:
+                    self._reloading.append((text, owner))
+
+    def invalidate(self, user_id, word_id=None):
+        """
+        Слушатель изменений словаря (Storage.add_vocabulary_listener): перевод слова,
+        удаленного пользователем, больше не предлагается ему как вариант.
+        Свои слова добавляет add, когда их перевод известен
+        """
+        if word_id is None:
+            return
+        with self._lock:
+            hidden = self._hidden.get(user_id)
+            if hidden is None:
+                hidden = self._hidden[user_id] = set()
+            hidden.add(word_id)
+            self._hidden.move_to_end(user_id)
+            while len(self._hidden) > MAX_HIDDEN_USERS:
+                self._hidden.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"words": self._size, "reloads": self.reloads, "hidden_users": len(self._hidden)}
+
+    def _scored(self, vector, buckets, user_id):
+        """
+        До CANDIDATES лучших (похожесть, текст) из buckets
+        """
+        owner = GLOBAL_OWNER if user_id is None else user_id
+        scored = []
+        for vectors, owners, texts in buckets:
+            scores = vectors @ vector
+            # Слишком похожие на перевод и чужие слова не подходят
+            scores[scores > MAX_SIMILARITY] = -np.inf
+            scores[(owners != GLOBAL_OWNER) & (owners != owner)] = -np.inf
+            top = min(CANDIDATES, len(scores))
+            indexes = np.argpartition(-scores, top - 1)[:top] if top < len(scores) else range(len(scores))
+            scored.extend((scores[index], texts[index]) for index in indexes if np.isfinite(scores[index]))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored
+
+    def pick(self, target: str, user_id=None, count: int = 3, rng=random):
+        """
+        count неправильных вариантов для перевода target, видимых пользователю user_id.
+        Меньше count, если в словаре не хватает слов
+        """
+        self.load()
+        self._refresh()
+        target = target.strip()
+        with self._lock:
+            hidden = self._hidden.get(user_id, ())
+            excluded = {target.lower()} | {self._ids[word_id] for word_id in hidden if word_id in self._ids}
+            near = [bucket.snapshot() for length, bucket in self._buckets.items()
+                    if abs(length - len(target)) <= LENGTH_SPREAD]
+            others = [bucket.snapshot() for length, bucket in self._buckets.items()
+                      if abs(length - len(target)) > LENGTH_SPREAD]
+        vector = vectorize(target)
+        candidates = []
+        # Слов похожей длины мало (маленький словарь) – добираем из остальных
+        for buckets in (near, others):
+            for _, text in self._scored(vector, buckets, user_id):
+                if len(candidates) >= CANDIDATES:
+                    break
+                if text.lower() not in excluded:
+                    excluded.add(text.lower())
+                    candidates.append(text)
+            if len(candidates) >= CANDIDATES:
+                break
+        return rng.sample(candidates, min(count, len(candidates)))
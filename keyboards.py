@@ -0,0 +1,120 @@
+import itertools
+import json
+import random
+import threading
+from collections import OrderedDict
+
+from telebot import types
+
+# Клавиатуры бота, заранее сериализованные в JSON.
+# telebot передает reply_markup в запрос как markup.to_json(), поэтому готовая строка
+# избавляет каждый ответ от создания ReplyKeyboardMarkup/KeyboardButton и json.dumps.
+# Постоянные клавиатуры строятся один раз при импорте, клавиатуры вопроса – один раз
+# на пару (слово, порядок вариантов) и хранятся в ограниченном LRU-кэше.
+
+SKIP = 'Пропустить ⏩'
+MAIN_MENU = 'Главное меню 🏠'
+
+# Все порядки четырех вариантов ответа
+PERMUTATIONS = tuple(itertools.permutations(range(4)))
+
+# Сколько клавиатур вопросов хранить (до 24 на слово)
+QUIZ_CACHE_SIZE = 10000
+
+
+class SerializedKeyboard(types.JsonSerializable):
+    """
+    Клавиатура, уже сериализованная в JSON
+    """
+    __slots__ = ('json',)
+
+    def __init__(self, markup):
+        self.json = markup if isinstance(markup, str) else markup.to_json()
+
+    def to_json(self):
+        return self.json
+
+
+def _reply_keyboard(rows, row_width=2):
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=row_width)
+    for row in rows:
+        markup.add(*[types.KeyboardButton(text) for text in row])
+    return SerializedKeyboard(markup)
+
+
+# Главное меню
+MAIN = _reply_keyboard([('Новое слово 🆕', 'Добавить слово ➕', 'Удалить слово ❌')])
+# Что сделать с угаданным словом
+WORD_ACTION = _reply_keyboard([('Удалить слово ✅', 'Оставить слово 🔄', MAIN_MENU)])
+# Подтверждение удаления
+CONFIRM_DELETION = _reply_keyboard([('Да, удалить ✅', 'Нет, оставить ❎')], row_width=3)
+# Убрать клавиатуру (ввод слова с клавиатуры телефона)
+REMOVE = SerializedKeyboard(types.ReplyKeyboardRemove())
+
+# Хвост клавиатуры вопроса: варианты по одному в строке, затем "Пропустить" и "Главное меню"
+_QUIZ_TAIL = json.dumps([{'text': SKIP}, {'text': MAIN_MENU}], ensure_ascii=False)
+
+# Кнопки inline-режима вопроса (quiz mode = inline)
+INLINE_LEARNED = 'Удалить слово ✅'
+INLINE_KEEP = 'Оставить слово 🔄'
+INLINE_NEXT = 'Следующее слово ➡️'
+
+_quiz_cache = OrderedDict()  # (word_id, порядок) -> (варианты, клавиатура)
+_quiz_lock = threading.Lock()
+
+
+def random_permutation():
+    """
+    Случайный порядок вариантов ответа
+    """
+    return random.choice(PERMUTATIONS)
+
+
+def options_keyboard(options):
+    """
+    Клавиатура с вариантами ответов в заданном порядке, без кэширования
+    """
+    rows = ','.join('[{"text":%s}]' % json.dumps(option, ensure_ascii=False) for option in options)
+    return SerializedKeyboard('{"keyboard":[%s,%s],"resize_keyboard":true}' % (rows, _QUIZ_TAIL))
+
+
+def quiz_keyboard(word_id, options, permutation):
+    """
+    Клавиатура вопроса по слову word_id: options – (правильный перевод, три неправильных),
+    permutation – порядок их показа. Если перевод слова изменился, клавиатура строится заново
+    """
+    key = (word_id, permutation)
+    options = tuple(options)
+    with _quiz_lock:
+        cached = _quiz_cache.get(key)
+        if cached is not None and cached[0] == options:
+            _quiz_cache.move_to_end(key)
+            return cached[1]
+    keyboard = options_keyboard([options[index] for index in permutation])
+    with _quiz_lock:
+        _quiz_cache[key] = (options, keyboard)
+        _quiz_cache.move_to_end(key)
+        while len(_quiz_cache) > QUIZ_CACHE_SIZE:
+            _quiz_cache.popitem(last=False)
+    return keyboard
+
+
+def suggestions_keyboard(words):
+    """
+    Клавиатура подсказок при удалении слова: слова по одному в строке и "Главное меню"
+    """
+    rows = ','.join('[{"text":%s}]' % json.dumps(word, ensure_ascii=False) for word in words)
+    return SerializedKeyboard('{"keyboard":[%s,[{"text":%s}]],"resize_keyboard":true}' % (
+        rows, json.dumps(MAIN_MENU, ensure_ascii=False)))
+
+
+def inline_keyboard(rows):
+    """
+    Inline-клавиатура из строк кнопок (текст, callback_data), без кэширования:
+    данные кнопок подписаны для конкретного пользователя
+    """
+    return SerializedKeyboard('{"inline_keyboard":[%s]}' % ','.join(
+        '[%s]' % ','.join('{"text":%s,"callback_data":%s}' % (json.dumps(text, ensure_ascii=False), json.dumps(data))
+                          for text, data in row)
+        for row in rows
+    ))
@@ -1,68 +1,329 @@
 import telebot
-from telebot import types
-import database
-import random
-import re
-import configparser
-import psycopg2
- 
-config = configparser.ConfigParser()
-config.read('config.ini', encoding = 'utf-8')
- 
-TOKEN = config['configs']['token']
+import broadcast
+import callback_data
+import dispatcher
+import keyboards
+import metrics
+import prefetch
+import router
+import sender
+import spaced
+import storage
+import user_stats
+from bot_common import (config, TOKEN, RUNTIME, UPDATES, STATE_MAIN, STATE_ADD_WORD, STATE_DELETE_WORD,
+                        store, states, DISTRACTORS, distractor_index, word_search, quiz_options,
+                        complete_word_parts, main_keyboard, stats_text)
+
 password = config['configs']['password']
- 
- 
-bot = telebot.TeleBot(TOKEN)
- 
-# Состояния для FSM (Finite State Machine)
-STATE_MAIN = 0
-STATE_ADD_WORD = 1
-STATE_DELETE_WORD = 2
-user_states = {0: "STATE_MAIN", 1: "STATE_ADD_WORD", 2: "STATE_DELETE_WORD"}
-
-
-# Клавиатура главного меню
-def main_keyboard():
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-    markup.add(
-        types.KeyboardButton('Новое слово 🆕'),
-        types.KeyboardButton('Добавить слово ➕'),
-        types.KeyboardButton('Удалить слово ❌')
-    )
-    return markup
- 
- 
-# Клавиатура с вариантами ответов
-def options_keyboard(options):
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-    for option in options:
-        markup.add(types.KeyboardButton(option))
-    markup.add(types.KeyboardButton('Пропустить ⏩'), types.KeyboardButton('Главное меню 🏠'))
-    return markup
- 
+
+
+# Обработчики выполняются в пуле потоков: разные пользователи параллельно,
+# сообщения одного пользователя строго по порядку (см. dispatcher.py)
+bot = dispatcher.OrderedTeleBot(
+    TOKEN,
+    workers=config.getint('dispatcher', 'workers', fallback=4),
+    queue_size=config.getint('dispatcher', 'queue_size', fallback=10000),
+)
+
+# Ответы отправляются через очередь с ограничением частоты по чату и в целом (см. sender.py),
+# а не прямым вызовом bot.send_message из потока обработчика
+SENDER_WORKERS = config.getint('sender', 'workers', fallback=8)
+sender.configure_session(SENDER_WORKERS)
+outbox = sender.OutboundSender(
+    bot,
+    workers=SENDER_WORKERS,
+    global_rate=config.getfloat('sender', 'global_rate', fallback=30),
+    chat_rate=config.getfloat('sender', 'chat_rate', fallback=1),
+    chat_burst=config.getfloat('sender', 'chat_burst', fallback=3),
+    queue_size=config.getint('sender', 'queue_size', fallback=10000),
+    max_retries=config.getint('sender', 'max_retries', fallback=3),
+)
+
+# Маршруты сообщений: команды, кнопки по состоянию и шаги диалога (см. router.py)
+routes = router.Router()
+
+
+def get_state(message):
+    """
+    Состояние пользователя, прочитанное из хранилища один раз на сообщение
+    """
+    if not hasattr(message, 'conversation_state'):
+        message.conversation_state = states.get(message.from_user.id) or {}
+    return message.conversation_state
+
+
+# За одно сообщение состояние меняется несколько раз (route снимает ожидаемый шаг,
+# обработчик сохраняет следующий), а в хранилище попадает один раз в конце route:
+# последнее значение или удаление. user_id -> запись, None (удалить) или UNCHANGED.
+# Сообщения одного пользователя обрабатываются по очереди, поэтому запись у него одна
+UNCHANGED = object()
+pending_states = {}
+
+
+def save_state(user_id, state=STATE_MAIN, step=None, **data):
+    """
+    Сохраняет состояние пользователя и следующий шаг диалога с его данными.
+    Главное меню без ожидаемого шага не хранится
+    """
+    entry = None
+    if state != STATE_MAIN or step is not None:
+        entry = {"state": state, **data}
+        if step is not None:
+            entry["step"] = step
+    if user_id in pending_states:
+        pending_states[user_id] = entry
+    else:
+        write_state(user_id, entry)
+
+
+def write_state(user_id, entry):
+    if entry is None:
+        states.delete(user_id)
+    else:
+        states.set(user_id, entry)
+
+
+# Режим вопроса, секция [quiz]: reply – варианты на обычной клавиатуре, ответ и действие
+# со словом – шаги диалога; inline – варианты на inline-кнопках под вопросом. В режиме inline
+# слово, вариант и попытка закодированы в подписанных данных кнопки (см. callback_data.py),
+# поэтому состояние вопроса не хранится, а ответы изменяют сообщение с вопросом
+QUIZ_MODE = config.get('quiz', 'mode', fallback='reply')
+callbacks = callback_data.CallbackSigner.from_config(config, TOKEN)
+
+
+def question_text(russian_word):
+    return (f"📖 Слово: <b>{russian_word}</b>\n\n"
+            "Выбери правильный перевод:")
+
+
+def inline_quiz_keyboard(user_id, word_data, attempt=1):
+    """
+    Варианты ответа на inline-кнопках в случайном порядке: в данных кнопки
+    ID слова, номер варианта (0 – правильный, s – пропустить) и попытка
+    """
+    word_id, options = word_data[0], quiz_options(user_id, word_data)
+    rows = [[(options[index], callbacks.sign(user_id, 'q', word_id, index, attempt))]
+            for index in keyboards.random_permutation()]
+    rows.append([(keyboards.SKIP, callbacks.sign(user_id, 'q', word_id, 's', attempt))])
+    return keyboards.inline_keyboard(rows)
+
+
+def inline_next_keyboard(user_id):
+    return keyboards.inline_keyboard([[(keyboards.INLINE_NEXT, callbacks.sign(user_id, 'n'))]])
+
+
+def prepare_question(user_id):
+    """
+    Следующее слово пользователя (секция [quiz]) и клавиатура вопроса с вариантами в случайном порядке
+    """
+    word_data = store.get_next_user_word(user_id)
+    if not word_data:
+        return None
+    if QUIZ_MODE == 'inline':
+        return word_data, inline_quiz_keyboard(user_id, word_data)
+    # Клавиатура для пары (слово, порядок) берется из кэша
+    return word_data, keyboards.quiz_keyboard(word_data[0], quiz_options(user_id, word_data),
+                                              keyboards.random_permutation())
+
+
+# Следующий вопрос готовится в фоне, пока пользователь отвечает на текущий (см. prefetch.py).
+# Удаление слова или добавление своего сбрасывают подготовленные вопросы пользователя.
+# При интервальном повторении следующее слово зависит от ответа на текущее, поэтому
+# готовится один вопрос и только после ответа
+SPACED = store.selection == 'spaced'
+PREFETCH_DEPTH = config.getint('prefetch', 'depth', fallback=2)
+prefetcher = prefetch.Prefetcher(
+    prepare_question,
+    depth=min(PREFETCH_DEPTH, 1) if SPACED else PREFETCH_DEPTH,
+    max_users=config.getint('prefetch', 'max_users', fallback=10000),
+    workers=config.getint('prefetch', 'workers', fallback=2),
+    max_age=config.getfloat('prefetch', 'max_age', fallback=600),
+)
+store.add_vocabulary_listener(prefetcher.invalidate)
+
+# Метрики обработчиков, запросов к хранилищу, пула и очередей (см. metrics.py, секция [metrics]).
+# Показатели компонентов берутся из их stats() в момент чтения /metrics
+METRICS_ENABLED = config.getboolean('metrics', 'enabled', fallback=True)
+metrics.configure(
+    enabled=METRICS_ENABLED,
+    slow_requests=config.getint('metrics', 'slow_requests', fallback=20),
+    profile_rate=config.getfloat('metrics', 'profile_rate', fallback=0.0),
+)
+metrics.registry.add_stats('bot_dispatcher', bot.dispatcher.stats)
+metrics.registry.add_stats('bot_sender', lambda: outbox.stats())
+metrics.registry.add_stats('bot_prefetch', prefetcher.stats)
+metrics.registry.add_stats('bot_word_lookup', word_search.stats)
+metrics.registry.add_stats('bot_distractors', distractor_index.stats)
+metrics.registry.add_stats('bot_stats_reconciler', lambda: stats_reconciler.stats())
+metrics.registry.add_stats('bot_broadcast', lambda: broadcaster.stats())
+if isinstance(store, storage.PostgresStorage):
+    metrics.registry.add_stats('bot_db_pool', store.database.pool_stats)
+    metrics.registry.add_stats('bot_word_cache', store.database.words_cache.stats)
+    metrics.registry.add_stats('bot_write_behind', store.database.writes.stats)
+
+
+def start_metrics_server(offset=0):
+    """
+    HTTP-сервер метрик, если он включен в секции [metrics]. offset – сдвиг порта
+    для рабочих процессов supervisor.py
+    """
+    if not METRICS_ENABLED or not config.getint('metrics', 'port', fallback=9108):
+        return None
+    return metrics.MetricsServer(
+        host=config.get('metrics', 'host', fallback='127.0.0.1'),
+        port=config.getint('metrics', 'port', fallback=9108) + offset,
+    ).start()
+
+
+def start_services(metrics_offset=0):
+    """
+    Открывает хранилище и запускает фоновые потоки перед приемом обновлений
+    """
+    store.open()
+    stats_reconciler.start()
+    broadcaster.start()
+    start_metrics_server(metrics_offset)
+    if DISTRACTORS == 'generated':
+        # Индекс переводов строится при запуске, а не на первом вопросе
+        distractor_index.load()
+
+
+def stop_services():
+    """
+    Дожидается обработки принятых обновлений и отправки ответов, закрывает хранилище
+    """
+    bot.dispatcher.stop()
+    prefetcher.stop()
+    broadcaster.stop()
+    stats_reconciler.stop()
+    outbox.stop()
+    store.close()
+
+
+def share_rate_limits(workers):
+    """
+    Делит общие ограничения частоты отправки и рассылок между workers процессами:
+    ограничения по чату не меняются, все сообщения чата отправляет один процесс
+    """
+    for bucket in (outbox.global_bucket, broadcaster.bucket):
+        bucket.rate /= workers
+        bucket.capacity = max(bucket.capacity / workers, 1)
+        bucket.tokens = min(bucket.tokens, bucket.capacity)
+
+
+def run_worker(index, workers):
+    """
+    Рабочий процесс supervisor.py: запускает бота без приема обновлений,
+    обновления передает supervisor. Метрики – на порту [metrics] + index + 1
+    """
+    share_rate_limits(workers)
+    start_services(index + 1)
+    return bot, stop_services
+
+
+def answered(user_id, word_id, quality):
+    """
+    Окончательный ответ на вопрос: пересчет интервала повторения слова
+    """
+    store.record_review(user_id, word_id, quality)
+    if SPACED:
+        prefetcher.invalidate(user_id)
+        prefetcher.schedule(user_id)
+
+
+# Статистика /stats читается из счетчиков хранилища одним запросом, а счетчики
+# сверяются с таблицами в фоне, секция [stats] (см. user_stats.py)
+stats_reconciler = user_stats.StatsReconciler(
+    lambda limit: store.reconcile_stats(limit),
+    interval=config.getfloat('stats', 'reconcile_interval', fallback=60),
+    batch_size=config.getint('stats', 'reconcile_batch', fallback=200),
+)
+
+
+# Рассылки и ежедневные напоминания неактивным пользователям, секция [broadcast]:
+# отдельный поток читает получателей страницами и отправляет через outbox с низким
+# приоритетом и своим ограничением частоты (см. broadcast.py, python manage.py broadcast)
+broadcaster = broadcast.Broadcaster(
+    store,
+    lambda user_id, text: outbox.send_message(user_id, text, priority=sender.PRIORITY_BULK,
+                                              reply_markup=main_keyboard()),
+    rate=config.getfloat('broadcast', 'rate', fallback=20),
+    batch_size=config.getint('broadcast', 'batch_size', fallback=500),
+    max_in_flight=config.getint('broadcast', 'max_in_flight', fallback=100),
+    poll_interval=config.getfloat('broadcast', 'poll_interval', fallback=30),
+    remind_hour=config.getint('broadcast', 'remind_hour', fallback=-1),
+    remind_after_days=config.getfloat('broadcast', 'remind_after_days', fallback=1),
+    remind_max_days=config.getfloat('broadcast', 'remind_max_days', fallback=30),
+)
+
+
+# Единственный обработчик сообщений: состояние читается один раз,
+# а обработчик находится в таблице routes
+@bot.message_handler(content_types=['text'])
+def route(message):
+    user_id = message.from_user.id
+    with metrics.request(user_id=user_id) as current:
+        pending_states[user_id] = UNCHANGED
+        try:
+            dispatch(message, current)
+        finally:
+            entry = pending_states.pop(user_id)
+            # Пользователь без записи уже в главном меню
+            if entry is not UNCHANGED and (entry is not None or get_state(message)):
+                write_state(user_id, entry)
+
+
+def dispatch(message, current):
+    store.touch_user(message.from_user.id)
+    entry = dict(get_state(message))
+    step = entry.pop('step', None)
+    state = entry.pop('state', STATE_MAIN)
+    handler = routes.resolve(message.text, state, step)
+    if handler is not None:
+        current.handler = handler.__name__
+    if step is None:
+        if handler is not None:
+            handler(message)
+        return
+    # Следующий шаг диалога получает сохраненные для него данные, как при register_next_step_handler
+    save_state(message.from_user.id, state)
+    if handler is not None:
+        handler(message, **entry)
+
 
 # Кнопка старт 
-@bot.message_handler(commands=['start'])
+@routes.command('start')
 def start(message):
     user = message.from_user
-    database.add_user_if_not_exists(user.id, user.first_name)
-    user_states[user.id] = STATE_MAIN
+    store.add_user_if_not_exists(user.id, user.first_name)
+    save_state(user.id, STATE_MAIN)
+    prefetcher.schedule(user.id)
     
-    bot.send_message(
+    outbox.send_message(
         message.chat.id,
         f"👋 Привет, {user.first_name}!\n\n"
         "Я помогу тебе учить английские слова.\n"
-        "Используй кнопки ниже для управления:",
+        "Используй кнопки ниже для управления, а /stats покажет твой прогресс:",
         reply_markup=main_keyboard()
     )
  
 
+# Статистика пользователя
+@routes.command('stats')
+def show_stats(message):
+    outbox.send_message(
+        message.chat.id,
+        stats_text(store.get_user_stats(message.from_user.id)),
+        parse_mode='HTML',
+        reply_markup=main_keyboard()
+    )
+
+
 # Кнопла главное меню 
-@bot.message_handler(func=lambda m: m.text == 'Главное меню 🏠')
+@routes.button('Главное меню 🏠')
 def main_menu(message):
-    user_states[message.from_user.id] = STATE_MAIN
-    bot.send_message(
+    save_state(message.from_user.id, STATE_MAIN)
+    outbox.send_message(
         message.chat.id,
         "Главное меню:",
         reply_markup=main_keyboard()
@@ -70,51 +331,59 @@ def main_menu(message):
  
 
 # Новое слово 
-@bot.message_handler(func=lambda m: m.text == 'Новое слово 🆕' and user_states.get(m.from_user.id) == STATE_MAIN)
+@routes.button('Новое слово 🆕', STATE_MAIN)
 def new_word(message):
     user_id = message.from_user.id
-    word_data = database.get_random_user_word(user_id)
+    # Вопрос, подготовленный заранее, или сразу из БД, если буфер пуст
+    question = prefetcher.take(user_id) or prepare_question(user_id)
     
-    if word_data:
-        word_id, rus_word, target, opt1, opt2, opt3 = word_data
-        
-        # Создаем и перемешиваем варианты
-        options = [target, opt1, opt2, opt3]
-        random.shuffle(options)
+    if question:
+        word_data, quiz_keyboard = question
+        word_id, rus_word = word_data[:2]
         
-        # Сохраняем правильный ответ в callback data
-        msg = bot.send_message(
+        outbox.send_message(
             message.chat.id,
-            f"📖 Слово: <b>{rus_word}</b>\n\n"
-            "Выбери правильный перевод:",
-            reply_markup=options_keyboard(options),
+            question_text(rus_word),
+            reply_markup=quiz_keyboard,
             parse_mode='HTML'
         )
         
-        # Регистрируем следующий шаг
-        bot.register_next_step_handler(
-            msg, 
-            check_answer,
-            word_id=word_id,
-            correct_answer=target,
-            russian_word=rus_word,
-            attempt = 1
-        )
+        # Регистрируем следующий шаг; в режиме inline ответ придет нажатием кнопки
+        if QUIZ_MODE != 'inline':
+            save_state(user_id, STATE_MAIN, step='check_answer', word_id=word_id, attempt=1)
+        # Пока пользователь отвечает, готовим следующий вопрос
+        if not SPACED:
+            prefetcher.schedule(user_id)
     else:
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
             "🎉 Поздравляю! Ты выучил все слова!",
             reply_markup=main_keyboard()
         )
  
-def check_answer(message, word_id, correct_answer, russian_word, attempt=1):
+@routes.step()
+def check_answer(message, word_id, attempt=1):
     user_id = message.from_user.id
     
     if message.text == 'Главное меню 🏠':
         main_menu(message)
         return
-    elif message.text == 'Пропустить ⏩':
-        bot.send_message(
+    
+    # В состоянии хранится только ID слова, само слово берем из БД
+    word_data = store.get_word_by_id(word_id)
+    if not word_data:
+        outbox.send_message(
+            message.chat.id,
+            "⚠️ Ошибка при получении слова. Попробуйте другое слово.",
+            reply_markup=main_keyboard()
+        )
+        return
+    word_id, russian_word, correct_answer = word_data[:3]
+    
+    if message.text == 'Пропустить ⏩':
+        store.record_answer(user_id, word_id, False, attempt)
+        answered(user_id, word_id, spaced.QUALITY_SKIPPED)
+        outbox.send_message(
             message.chat.id,
             f"Правильный ответ: <b>{correct_answer}</b>",
             parse_mode='HTML',
@@ -122,67 +391,38 @@ def check_answer(message, word_id, correct_answer, russian_word, attempt=1):
         )
         return
     
-    if message.text == correct_answer:
-        # Создаем клавиатуру для выбора действия
-        markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-        markup.add(
-            types.KeyboardButton('Удалить слово ✅'),
-            types.KeyboardButton('Оставить слово 🔄'),
-            types.KeyboardButton('Главное меню 🏠')
-        )
-        
-        bot.send_message(
+    correct = message.text == correct_answer
+    store.record_answer(user_id, word_id, correct, attempt)
+    if correct or attempt >= 2:
+        answered(user_id, word_id, spaced.answer_quality(correct, attempt))
+    if correct:
+        outbox.send_message(
             message.chat.id,
             f"🎉 <b>Правильно!</b>\nЧто сделать со словом '{russian_word}'?",
             parse_mode='HTML',
-            reply_markup=markup
+            reply_markup=keyboards.WORD_ACTION
         )
         
         # Регистрируем следующий шаг для обработки выбора
-        bot.register_next_step_handler(
-            message, 
-            handle_word_action,
-            word_id=word_id,
-            russian_word=russian_word
-        )
+        save_state(user_id, STATE_MAIN, step='handle_word_action', word_id=word_id, word=russian_word)
     else:
         if attempt < 2:  # Даем 2 попытки
             # Формируем новый вопрос с тем же словом
-            word_data = database.get_word_by_id(word_id)
-            if word_data:
-                word_id, rus_word, target, opt1, opt2, opt3 = word_data
-                options = [target, opt1, opt2, opt3]
-                random.shuffle(options)
-                
-                markup = options_keyboard(options)
-                markup.add(types.KeyboardButton('Пропустить ⏩'))
-                
-                bot.send_message(
-                    message.chat.id,
-                    f"❌ Неправильно! Попытка {attempt} из 2.\n\n"
-                    f"Как переводится слово: <b>{rus_word}</b>?",
-                    parse_mode='HTML',
-                    reply_markup=markup
-                )
-                
-                # Повторно регистрируем обработчик с увеличением счетчика попыток
-                bot.register_next_step_handler(
-                    message, 
-                    check_answer,
-                    word_id=word_id,
-                    correct_answer=correct_answer,
-                    russian_word=russian_word,
-                    attempt=attempt+1
-                )
-            else:
-                bot.send_message(
-                    message.chat.id,
-                    "⚠️ Ошибка при получении слова. Попробуйте другое слово.",
-                    reply_markup=main_keyboard()
-                )
+            permutation = keyboards.random_permutation()
+            
+            outbox.send_message(
+                message.chat.id,
+                f"❌ Неправильно! Попытка {attempt} из 2.\n\n"
+                f"Как переводится слово: <b>{russian_word}</b>?",
+                parse_mode='HTML',
+                reply_markup=keyboards.quiz_keyboard(word_id, quiz_options(user_id, word_data), permutation)
+            )
+            
+            # Повторно регистрируем шаг с увеличением счетчика попыток
+            save_state(user_id, STATE_MAIN, step='check_answer', word_id=word_id, attempt=attempt+1)
         else:
             # После 2 неудачных попыток показываем правильный ответ
-            bot.send_message(
+            outbox.send_message(
                 message.chat.id,
                 f"❌ Неправильно! Правильный ответ: <b>{correct_answer}</b>",
                 parse_mode='HTML',
@@ -190,45 +430,164 @@ def check_answer(message, word_id, correct_answer, russian_word, attempt=1):
             )
  
 
-def handle_word_action(message, word_id, russian_word):
+@routes.step()
+def handle_word_action(message, word_id, word):
     user_id = message.from_user.id
     
     if message.text == 'Удалить слово ✅':
-        database.remove_user_word(user_id, word_id)
-        bot.send_message(
+        # Слово отвечено верно и убрано из списка – считаем его выученным
+        store.mark_word_learned(user_id, word_id)
+        outbox.send_message(
             message.chat.id,
-            f"🗑 Слово '{russian_word}' удалено из вашего списка для изучения.",
+            f"🗑 Слово '{word}' удалено из вашего списка для изучения.",
             reply_markup=main_keyboard()
         )
     elif message.text == 'Оставить слово 🔄':
-        bot.send_message(
+        store.keep_word(user_id, word_id)
+        outbox.send_message(
             message.chat.id,
-            f"🔄 Слово '{russian_word}' осталось в вашем списке для повторения.",
+            f"🔄 Слово '{word}' осталось в вашем списке для повторения.",
             reply_markup=main_keyboard()
         )
     else:
         main_menu(message)
  
 
-@bot.message_handler(func=lambda m: m.text == 'Добавить слово ➕' and user_states.get(m.from_user.id) == STATE_MAIN)
+# Нажатия inline-кнопок: данные проверяются подписью для нажавшего пользователя,
+# обработчик выбирается по первому полю (см. inline_quiz_keyboard)
+@bot.callback_query_handler(func=lambda call: True)
+def route_callback(call):
+    user_id = call.from_user.id
+    with metrics.request(user_id=user_id) as current:
+        store.touch_user(user_id)
+        fields = callbacks.verify(user_id, call.data)
+        handler = routes.callbacks.get(fields[0]) if fields else None
+        if handler is None or call.message is None:
+            answer_callback(call, "Кнопка устарела, нажми «Новое слово 🆕»")
+            return
+        current.handler = handler.__name__
+        answer_callback(call)
+        handler(call, *fields[1:])
+
+
+def answer_callback(call, text=None):
+    """
+    Убирает индикатор загрузки с нажатой кнопки, ошибка здесь не мешает обработке нажатия
+    """
+    try:
+        bot.answer_callback_query(call.id, text)
+    except Exception as e:
+        print(f"Ошибка при ответе на нажатие кнопки: {e}")
+
+
+def edit_quiz_message(call, text, reply_markup=None):
+    outbox.edit_message_text(
+        call.message.chat.id,
+        call.message.message_id,
+        text,
+        parse_mode='HTML',
+        reply_markup=reply_markup
+    )
+
+
+@routes.callback('q')
+def inline_answer(call, word_id, option, attempt):
+    user_id = call.from_user.id
+    attempt = int(attempt)
+    
+    word_data = store.get_word_by_id(int(word_id))
+    if not word_data:
+        edit_quiz_message(call, "⚠️ Ошибка при получении слова. Попробуйте другое слово.",
+                          inline_next_keyboard(user_id))
+        return
+    word_id, russian_word, correct_answer = word_data[:3]
+    
+    if option == 's':
+        store.record_answer(user_id, word_id, False, attempt)
+        answered(user_id, word_id, spaced.QUALITY_SKIPPED)
+        edit_quiz_message(call, f"📖 Слово: <b>{russian_word}</b>\nПравильный ответ: <b>{correct_answer}</b>",
+                          inline_next_keyboard(user_id))
+        return
+    
+    correct = option == '0'
+    store.record_answer(user_id, word_id, correct, attempt)
+    if correct or attempt >= 2:
+        answered(user_id, word_id, spaced.answer_quality(correct, attempt))
+    if correct:
+        edit_quiz_message(
+            call,
+            f"🎉 <b>Правильно!</b> {russian_word} – {correct_answer}\nЧто сделать со словом?",
+            keyboards.inline_keyboard([
+                [(keyboards.INLINE_LEARNED, callbacks.sign(user_id, 'w', word_id, 'l')),
+                 (keyboards.INLINE_KEEP, callbacks.sign(user_id, 'w', word_id, 'k'))],
+                [(keyboards.INLINE_NEXT, callbacks.sign(user_id, 'n'))],
+            ])
+        )
+    elif attempt < 2:  # Даем 2 попытки
+        edit_quiz_message(
+            call,
+            f"❌ Неправильно! Попытка {attempt} из 2.\n\n"
+            f"Как переводится слово: <b>{russian_word}</b>?",
+            inline_quiz_keyboard(user_id, word_data, attempt + 1)
+        )
+    else:
+        edit_quiz_message(
+            call,
+            f"❌ Неправильно! Правильный ответ: <b>{correct_answer}</b>",
+            inline_next_keyboard(user_id)
+        )
+
+
+@routes.callback('w')
+def inline_word_action(call, word_id, action):
+    user_id = call.from_user.id
+    word_id = int(word_id)
+    word_data = store.get_word_by_id(word_id)
+    word = word_data[1] if word_data else ''
+    
+    if action == 'l':
+        store.mark_word_learned(user_id, word_id)
+        text = f"🗑 Слово '{word}' удалено из вашего списка для изучения."
+    else:
+        store.keep_word(user_id, word_id)
+        text = f"🔄 Слово '{word}' осталось в вашем списке для повторения."
+    edit_quiz_message(call, text, inline_next_keyboard(user_id))
+
+
+@routes.callback('n')
+def inline_next(call):
+    user_id = call.from_user.id
+    question = prefetcher.take(user_id) or prepare_question(user_id)
+    
+    if question:
+        word_data, quiz_keyboard = question
+        edit_quiz_message(call, question_text(word_data[1]), quiz_keyboard)
+        if not SPACED:
+            prefetcher.schedule(user_id)
+    else:
+        edit_quiz_message(call, "🎉 Поздравляю! Ты выучил все слова!")
+ 
+
+@routes.button('Добавить слово ➕', STATE_MAIN)
 def add_word_start(message):
     user_id = message.from_user.id
-    user_states[user_id] = STATE_ADD_WORD
     
-    msg = bot.send_message(
+    outbox.send_message(
         message.chat.id,
         "📝 Введи новое слово в формате:\n"
-        "<b>Русское слово : Правильный перевод : Неправильный1 : Неправильный2 : Неправильный3</b>\n\n"
-        "Пример: <i>Яблоко : Apple : Orange : Banana : Pear</i>",
+        "<b>Русское слово : Правильный перевод</b> – неправильные варианты подберутся сами,\n"
+        "или <b>Русское слово : Правильный перевод : Неправильный1 : Неправильный2 : Неправильный3</b>\n\n"
+        "Пример: <i>Яблоко : Apple</i> или <i>Яблоко : Apple : Orange : Banana : Pear</i>",
         parse_mode='HTML',
-        reply_markup=types.ReplyKeyboardRemove()
+        reply_markup=keyboards.REMOVE
     )
     
-    bot.register_next_step_handler(msg, add_word_process)
+    save_state(user_id, STATE_ADD_WORD, step='add_word_process')
  
+@routes.step()
 def add_word_process(message):
     user_id = message.from_user.id
-    user_states[user_id] = STATE_MAIN
+    save_state(user_id, STATE_MAIN)
     
     if message.text == 'Главное меню 🏠':
         main_menu(message)
@@ -237,11 +596,14 @@ def add_word_process(message):
     # Парсим ввод с разделением по двоеточию
     parts = [part.strip() for part in message.text.split(':')]
     
+    # "Русское : Перевод" – неправильные варианты подбираются по словарю
+    parts = complete_word_parts(user_id, parts)
+    
     if len(parts) != 5:
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
-            "❌ Неправильный формат. Нужно 5 значений, разделенных двоеточиями.\n"
-            "Пример: <i>Яблоко : Apple : Orange : Banana : Pear</i>",
+            "❌ Неправильный формат. Нужно 2 или 5 значений, разделенных двоеточиями.\n"
+            "Пример: <i>Яблоко : Apple</i> или <i>Яблоко : Apple : Orange : Banana : Pear</i>",
             parse_mode='HTML',
             reply_markup=main_keyboard()
         )
@@ -251,22 +613,23 @@ def add_word_process(message):
     
     # Проверяем, что все поля заполнены
     if not all([russian, target, wrong1, wrong2, wrong3]):
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
             "❌ Все поля должны быть заполнены!",
             reply_markup=main_keyboard()
         )
         return
     
-    if database.add_custom_word(user_id, russian, target, wrong1, wrong2, wrong3):
-        bot.send_message(
+    if store.add_custom_word(user_id, russian, target, wrong1, wrong2, wrong3):
+        distractor_index.add(target, user_id)
+        outbox.send_message(
             message.chat.id,
             f"✅ Слово <b>{russian}</b> успешно добавлено!",
             parse_mode='HTML',
             reply_markup=main_keyboard()
         )
     else:
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
             f"❌ Слово <b>{russian}</b> уже существует!",
             parse_mode='HTML',
@@ -274,108 +637,126 @@ def add_word_process(message):
         )
 
  
-@bot.message_handler(func=lambda m: m.text == 'Удалить слово ❌' and user_states.get(m.from_user.id) == STATE_MAIN)
+@routes.button('Удалить слово ❌', STATE_MAIN)
 def delete_word_start(message):
     user_id = message.from_user.id
-    user_states[user_id] = STATE_DELETE_WORD
     
-    bot.send_message(
+    outbox.send_message(
         message.chat.id,
         "✏️ Введите русское слово, которое хотите удалить:",
-        reply_markup=types.ReplyKeyboardRemove()
+        reply_markup=keyboards.REMOVE
     )
     
-    bot.register_next_step_handler(message, process_word_deletion)
+    save_state(user_id, STATE_DELETE_WORD, step='process_word_deletion')
  
+@routes.step()
 def process_word_deletion(message):
     user_id = message.from_user.id
     word_to_delete = message.text.strip()
     
+    if message.text == 'Главное меню 🏠':
+        main_menu(message)
+        return
+    
     # Проверяем существование слова у пользователя
-    conn = psycopg2.connect(**database.DB_CONFIG)
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT w.id 
-            FROM words w
-            JOIN user_word uw ON w.id = uw.words_id
-            WHERE uw.user_id = %s AND w.russian_word = %s
-        """, (user_id, word_to_delete))
-        result = cur.fetchone()
+    word_id = store.find_user_word_id(user_id, word_to_delete)
     
-    if not result:
-        bot.send_message(
+    if word_id is None:
+        # Опечатка или неполное слово: предлагаем похожие слова, нажатие кнопки – новая попытка
+        suggestions = word_search.suggest(user_id, word_to_delete) if word_search.limit > 0 else []
+        if suggestions:
+            outbox.send_message(
+                message.chat.id,
+                f"⚠️ Слово '{word_to_delete}' не найдено в вашем словаре.\n"
+                "Возможно, вы имели в виду одно из этих слов:",
+                reply_markup=keyboards.suggestions_keyboard(suggestions)
+            )
+            save_state(user_id, STATE_DELETE_WORD, step='process_word_deletion')
+            return
+        outbox.send_message(
             message.chat.id,
             f"⚠️ Слово '{word_to_delete}' не найдено в вашем словаре.\n"
             "Проверьте правильность написания и попробуйте снова.",
             reply_markup=main_keyboard()
         )
-        user_states[user_id] = STATE_MAIN
+        save_state(user_id, STATE_MAIN)
         return
     
-    word_id = result[0]
-    
-    # Клавиатура подтверждения
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.add(
-        types.KeyboardButton('Да, удалить ✅'),
-        types.KeyboardButton('Нет, оставить ❎')
-    )
-    
-    # Сохраняем данные для следующего шага
-    global deletion_data
-    deletion_data[user_id] = {"word_id": word_id, "word": word_to_delete}
-    
-    bot.send_message(
+    outbox.send_message(
         message.chat.id,
         f"Вы точно хотите удалить слово '{word_to_delete}'?",
-        reply_markup=markup
+        reply_markup=keyboards.CONFIRM_DELETION
     )
     
-    bot.register_next_step_handler(message, confirm_deletion)
- 
-deletion_data = {}
+    # Сохраняем данные для следующего шага
+    save_state(user_id, STATE_DELETE_WORD, step='confirm_deletion', word_id=word_id, word=word_to_delete)
 
 
-def confirm_deletion(message):
+@routes.step()
+def confirm_deletion(message, word_id=None, word=None):
     user_id = message.from_user.id
-    data = deletion_data.get(user_id)
     
-    if not data:
-        bot.send_message(
+    if word_id is None:
+        outbox.send_message(
             message.chat.id,
             "⚠️ Сессия удаления истекла. Начните заново.",
             reply_markup=main_keyboard()
         )
-        user_states[user_id] = STATE_MAIN
+        save_state(user_id, STATE_MAIN)
         return
     
     if message.text == 'Нет, оставить ❎':
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
-            f"Слово '{data['word']}' осталось в вашем словаре.",
+            f"Слово '{word}' осталось в вашем словаре.",
             reply_markup=main_keyboard()
         )
     elif message.text == 'Да, удалить ✅':
-        if database.remove_user_word(user_id, data["word_id"]):
-            bot.send_message(
-                message.chat.id,
-                f"✅ Слово '{data['word']}' успешно удалено!",
-                reply_markup=main_keyboard()
-            )
-        else:
-            bot.send_message(
-                message.chat.id,
-                "⚠️ Ошибка при удалении. Попробуйте позже.",
-                reply_markup=main_keyboard()
-            )
-    
-    # Очищаем данные
-    if user_id in deletion_data:
-        del deletion_data[user_id]
+        store.remove_user_word(user_id, word_id)
+        outbox.send_message(
+            message.chat.id,
+            f"✅ Слово '{word}' успешно удалено!",
+            reply_markup=main_keyboard()
+        )
     
-    user_states[user_id] = STATE_MAIN
- 
- 
+    save_state(user_id, STATE_MAIN)
+
+
 if __name__ == "__main__":
-    database.create_database()
-    bot.polling()
\ No newline at end of file
+    if RUNTIME == 'async' and not isinstance(store, storage.PostgresStorage):
+        raise SystemExit("Режим runtime = async работает только с backend = postgres в секции [storage]")
+    if RUNTIME == 'async' and QUIZ_MODE == 'inline':
+        raise SystemExit("Режим mode = inline в секции [quiz] работает только с runtime = sync")
+    start_services()
+    if RUNTIME == 'async':
+        # Обработчики ходят в БД через асинхронный пул (database_async.py), а синхронный
+        # остается открытым: через него пишут пачки write_behind, сверка статистики, рассылки
+        # и поиск похожих слов. Оба пула закрывает main_async.run
+        import main_async
+        try:
+            main_async.run()
+        finally:
+            broadcaster.stop()
+            stats_reconciler.stop()
+            outbox.stop()
+    elif UPDATES == 'webhook':
+        import webhook
+        server = webhook.WebhookServer(
+            bot,
+            host=config.get('webhook', 'host', fallback='127.0.0.1'),
+            port=config.getint('webhook', 'port', fallback=8443),
+            path=config.get('webhook', 'path', fallback='/webhook'),
+            secret_token=config.get('webhook', 'secret_token', fallback=''),
+            queue_size=config.getint('webhook', 'queue_size', fallback=1000),
+            batch_size=config.getint('webhook', 'batch_size', fallback=20),
+        )
+        metrics.registry.add_stats('bot_webhook', server.stats)
+        try:
+            server.serve_forever(url=config.get('webhook', 'url', fallback=''))
+        finally:
+            stop_services()
+    else:
+        try:
+            bot.polling()
+        finally:
+            stop_services()
\ No newline at end of file
@@ -0,0 +1,464 @@
+import asyncio
+
+from telebot.async_telebot import AsyncTeleBot
+
+import database
+import database_async
+import keyboards
+import metrics
+import router
+import spaced
+from bot_common import (TOKEN, STATE_MAIN, STATE_ADD_WORD, STATE_DELETE_WORD, main_keyboard, states,
+                        complete_word_parts, distractor_index, quiz_options, stats_text, word_search)
+
+# Асинхронный режим бота (runtime = async в секции [bot] config.ini).
+# Обработчики повторяют main.py, но не блокируют друг друга: пока один пользователь
+# ждет ответа БД, остальные обслуживаются в том же процессе.
+
+bot = AsyncTeleBot(TOKEN)
+
+# Маршруты сообщений, как в main.py (см. router.py)
+routes = router.Router()
+
+# AsyncTeleBot запускает обработчики сообщений отдельными задачами, поэтому два быстрых
+# сообщения одного пользователя обрабатывались бы одновременно. Сообщения пользователя
+# ждут его блокировку и выполняются по очереди, разные пользователи – параллельно.
+# user_id -> [блокировка, сколько сообщений ее держат или ждут]
+user_locks = {}
+
+
+# Состояние диалога и следующий шаг хранятся в том же state_store (секция [state])
+# и в том же виде, что и в main.py: {"state": ..., "step": имя шага в routes, данные шага}.
+# Как и в main.py, изменения за сообщение записываются один раз в конце handle:
+# user_id -> запись, None (удалить) или UNCHANGED.
+# Хранилища SQLite и PostgreSQL блокируют, поэтому вызываются в потоке
+UNCHANGED = object()
+pending_states = {}
+
+
+async def load_state(user_id) -> dict:
+    return dict(await asyncio.to_thread(states.get, user_id) or {})
+
+
+async def save_state(user_id, state=STATE_MAIN, step=None, **data):
+    """
+    Сохраняет состояние пользователя и следующий шаг диалога с его данными.
+    Главное меню без ожидаемого шага не хранится
+    """
+    entry = None
+    if state != STATE_MAIN or step is not None:
+        entry = {"state": state, **data}
+        if step is not None:
+            entry["step"] = step
+    if user_id in pending_states:
+        pending_states[user_id] = entry
+    else:
+        await write_state(user_id, entry)
+
+
+async def write_state(user_id, entry):
+    if entry is None:
+        await asyncio.to_thread(states.delete, user_id)
+    else:
+        await asyncio.to_thread(states.set, user_id, entry)
+
+
+# Единственный обработчик сообщений: ожидаемый шаг проверяется первым,
+# как и next step handler в синхронном telebot, затем команды и кнопки
+@bot.message_handler(content_types=['text'])
+async def route(message):
+    user_id = message.from_user.id
+    entry = user_locks.setdefault(user_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            await handle(message)
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del user_locks[user_id]
+
+
+async def handle(message):
+    user_id = message.from_user.id
+    with metrics.request(user_id=user_id, profile=False) as current:
+        pending_states[user_id] = UNCHANGED
+        stored = {}
+        try:
+            database.touch_user(user_id)
+            stored = await load_state(user_id)
+            entry = dict(stored)
+            step = entry.pop('step', None)
+            state = entry.pop('state', STATE_MAIN)
+            handler = routes.resolve(message.text, state, step)
+            if handler is not None:
+                current.handler = handler.__name__
+            if step is None:
+                if handler is not None:
+                    await handler(message)
+                return
+            # Следующий шаг диалога получает сохраненные для него данные
+            await save_state(user_id, state)
+            if handler is not None:
+                await handler(message, **entry)
+        finally:
+            entry = pending_states.pop(user_id)
+            # Пользователь без записи уже в главном меню
+            if entry is not UNCHANGED and (entry is not None or stored):
+                await write_state(user_id, entry)
+
+
+# Кнопка старт
+@routes.command('start')
+async def start(message):
+    user = message.from_user
+    await database_async.add_user_if_not_exists(user.id, user.first_name)
+    await save_state(user.id, STATE_MAIN)
+
+    await bot.send_message(
+        message.chat.id,
+        f"👋 Привет, {user.first_name}!\n\n"
+        "Я помогу тебе учить английские слова.\n"
+        "Используй кнопки ниже для управления, а /stats покажет твой прогресс:",
+        reply_markup=main_keyboard()
+    )
+
+
+# Статистика пользователя
+@routes.command('stats')
+async def show_stats(message):
+    await bot.send_message(
+        message.chat.id,
+        stats_text(await database_async.get_user_stats(message.from_user.id)),
+        parse_mode='HTML',
+        reply_markup=main_keyboard()
+    )
+
+
+# Кнопка главное меню
+@routes.button('Главное меню 🏠')
+async def main_menu(message):
+    await save_state(message.from_user.id, STATE_MAIN)
+    await bot.send_message(
+        message.chat.id,
+        "Главное меню:",
+        reply_markup=main_keyboard()
+    )
+
+
+# Новое слово
+@routes.button('Новое слово 🆕', STATE_MAIN)
+async def new_word(message):
+    user_id = message.from_user.id
+    word_data = await database_async.get_next_user_word(user_id)
+
+    if word_data:
+        word_id, rus_word, target = word_data[:3]
+
+        # Варианты в случайном порядке, клавиатура для пары (слово, порядок) берется из кэша
+        permutation = keyboards.random_permutation()
+
+        await bot.send_message(
+            message.chat.id,
+            f"📖 Слово: <b>{rus_word}</b>\n\n"
+            "Выбери правильный перевод:",
+            reply_markup=keyboards.quiz_keyboard(word_id, quiz_options(user_id, word_data), permutation),
+            parse_mode='HTML'
+        )
+
+        # Регистрируем следующий шаг
+        await save_state(
+            user_id,
+            step='check_answer',
+            word_id=word_id,
+            correct_answer=target,
+            russian_word=rus_word,
+            attempt=1
+        )
+    else:
+        await bot.send_message(
+            message.chat.id,
+            "🎉 Поздравляю! Ты выучил все слова!",
+            reply_markup=main_keyboard()
+        )
+
+
+@routes.step()
+async def check_answer(message, word_id, correct_answer, russian_word, attempt=1):
+    user_id = message.from_user.id
+
+    if message.text == 'Главное меню 🏠':
+        await main_menu(message)
+        return
+    elif message.text == 'Пропустить ⏩':
+        database.record_answer(user_id, word_id, False, attempt)
+        await database_async.record_review(user_id, word_id, spaced.QUALITY_SKIPPED)
+        await bot.send_message(
+            message.chat.id,
+            f"Правильный ответ: <b>{correct_answer}</b>",
+            parse_mode='HTML',
+            reply_markup=main_keyboard()
+        )
+        return
+
+    correct = message.text == correct_answer
+    database.record_answer(user_id, word_id, correct, attempt)
+    if correct or attempt >= 2:
+        await database_async.record_review(user_id, word_id, spaced.answer_quality(correct, attempt))
+    if correct:
+        await bot.send_message(
+            message.chat.id,
+            f"🎉 <b>Правильно!</b>\nЧто сделать со словом '{russian_word}'?",
+            parse_mode='HTML',
+            reply_markup=keyboards.WORD_ACTION
+        )
+
+        # Регистрируем следующий шаг для обработки выбора
+        await save_state(
+            user_id,
+            step='handle_word_action',
+            word_id=word_id,
+            russian_word=russian_word
+        )
+    else:
+        if attempt < 2:  # Даем 2 попытки
+            # Формируем новый вопрос с тем же словом
+            word_data = await database_async.get_word_by_id(word_id)
+            if word_data:
+                word_id, rus_word, target = word_data[:3]
+                permutation = keyboards.random_permutation()
+
+                await bot.send_message(
+                    message.chat.id,
+                    f"❌ Неправильно! Попытка {attempt} из 2.\n\n"
+                    f"Как переводится слово: <b>{rus_word}</b>?",
+                    parse_mode='HTML',
+                    reply_markup=keyboards.quiz_keyboard(word_id, quiz_options(user_id, word_data), permutation)
+                )
+
+                # Повторно регистрируем обработчик с увеличением счетчика попыток
+                await save_state(
+                    user_id,
+                    step='check_answer',
+                    word_id=word_id,
+                    correct_answer=correct_answer,
+                    russian_word=russian_word,
+                    attempt=attempt+1
+                )
+            else:
+                await bot.send_message(
+                    message.chat.id,
+                    "⚠️ Ошибка при получении слова. Попробуйте другое слово.",
+                    reply_markup=main_keyboard()
+                )
+        else:
+            # После 2 неудачных попыток показываем правильный ответ
+            await bot.send_message(
+                message.chat.id,
+                f"❌ Неправильно! Правильный ответ: <b>{correct_answer}</b>",
+                parse_mode='HTML',
+                reply_markup=main_keyboard()
+            )
+
+
+@routes.step()
+async def handle_word_action(message, word_id, russian_word):
+    user_id = message.from_user.id
+
+    if message.text == 'Удалить слово ✅':
+        # Слово отвечено верно и убрано из списка – считаем его выученным
+        await database_async.mark_word_learned(user_id, word_id)
+        await bot.send_message(
+            message.chat.id,
+            f"🗑 Слово '{russian_word}' удалено из вашего списка для изучения.",
+            reply_markup=main_keyboard()
+        )
+    elif message.text == 'Оставить слово 🔄':
+        await database_async.keep_word(user_id, word_id)
+        await bot.send_message(
+            message.chat.id,
+            f"🔄 Слово '{russian_word}' осталось в вашем списке для повторения.",
+            reply_markup=main_keyboard()
+        )
+    else:
+        await main_menu(message)
+
+
+@routes.button('Добавить слово ➕', STATE_MAIN)
+async def add_word_start(message):
+    user_id = message.from_user.id
+
+    await bot.send_message(
+        message.chat.id,
+        "📝 Введи новое слово в формате:\n"
+        "<b>Русское слово : Правильный перевод</b> – неправильные варианты подберутся сами,\n"
+        "или <b>Русское слово : Правильный перевод : Неправильный1 : Неправильный2 : Неправильный3</b>\n\n"
+        "Пример: <i>Яблоко : Apple</i> или <i>Яблоко : Apple : Orange : Banana : Pear</i>",
+        parse_mode='HTML',
+        reply_markup=keyboards.REMOVE
+    )
+
+    await save_state(user_id, STATE_ADD_WORD, step='add_word_process')
+
+
+@routes.step()
+async def add_word_process(message):
+    user_id = message.from_user.id
+    await save_state(user_id, STATE_MAIN)
+
+    if message.text == 'Главное меню 🏠':
+        await main_menu(message)
+        return
+
+    # Парсим ввод с разделением по двоеточию
+    parts = [part.strip() for part in (message.text or '').split(':')]
+
+    # "Русское : Перевод" – неправильные варианты подбираются по словарю
+    parts = await asyncio.to_thread(complete_word_parts, user_id, parts)
+
+    if len(parts) != 5:
+        await bot.send_message(
+            message.chat.id,
+            "❌ Неправильный формат. Нужно 2 или 5 значений, разделенных двоеточиями.\n"
+            "Пример: <i>Яблоко : Apple</i> или <i>Яблоко : Apple : Orange : Banana : Pear</i>",
+            parse_mode='HTML',
+            reply_markup=main_keyboard()
+        )
+        return
+
+    russian, target, wrong1, wrong2, wrong3 = parts
+
+    # Проверяем, что все поля заполнены
+    if not all([russian, target, wrong1, wrong2, wrong3]):
+        await bot.send_message(
+            message.chat.id,
+            "❌ Все поля должны быть заполнены!",
+            reply_markup=main_keyboard()
+        )
+        return
+
+    if await database_async.add_custom_word(user_id, russian, target, wrong1, wrong2, wrong3):
+        distractor_index.add(target, user_id)
+        await bot.send_message(
+            message.chat.id,
+            f"✅ Слово <b>{russian}</b> успешно добавлено!",
+            parse_mode='HTML',
+            reply_markup=main_keyboard()
+        )
+    else:
+        await bot.send_message(
+            message.chat.id,
+            f"❌ Слово <b>{russian}</b> уже существует!",
+            parse_mode='HTML',
+            reply_markup=main_keyboard()
+        )
+
+
+@routes.button('Удалить слово ❌', STATE_MAIN)
+async def delete_word_start(message):
+    user_id = message.from_user.id
+
+    await bot.send_message(
+        message.chat.id,
+        "✏️ Введите русское слово, которое хотите удалить:",
+        reply_markup=keyboards.REMOVE
+    )
+
+    await save_state(user_id, STATE_DELETE_WORD, step='process_word_deletion')
+
+
+@routes.step()
+async def process_word_deletion(message):
+    user_id = message.from_user.id
+    word_to_delete = (message.text or '').strip()
+
+    if message.text == 'Главное меню 🏠':
+        await main_menu(message)
+        return
+
+    # Проверяем существование слова у пользователя
+    word_id = await database_async.find_user_word_id(user_id, word_to_delete)
+
+    if word_id is None:
+        # Индекс слов строится и ищет в потоке, не задерживая остальных пользователей
+        suggestions = []
+        if word_search.limit > 0:
+            suggestions = await asyncio.to_thread(word_search.suggest, user_id, word_to_delete)
+        if suggestions:
+            await bot.send_message(
+                message.chat.id,
+                f"⚠️ Слово '{word_to_delete}' не найдено в вашем словаре.\n"
+                "Возможно, вы имели в виду одно из этих слов:",
+                reply_markup=keyboards.suggestions_keyboard(suggestions)
+            )
+            await save_state(user_id, STATE_DELETE_WORD, step='process_word_deletion')
+            return
+        await bot.send_message(
+            message.chat.id,
+            f"⚠️ Слово '{word_to_delete}' не найдено в вашем словаре.\n"
+            "Проверьте правильность написания и попробуйте снова.",
+            reply_markup=main_keyboard()
+        )
+        await save_state(user_id, STATE_MAIN)
+        return
+
+    await bot.send_message(
+        message.chat.id,
+        f"Вы точно хотите удалить слово '{word_to_delete}'?",
+        reply_markup=keyboards.CONFIRM_DELETION
+    )
+
+    # Сохраняем данные для следующего шага
+    await save_state(user_id, STATE_DELETE_WORD, step='confirm_deletion', word_id=word_id, word=word_to_delete)
+
+
+@routes.step()
+async def confirm_deletion(message, word_id=None, word=None):
+    user_id = message.from_user.id
+
+    if word_id is None:
+        await bot.send_message(
+            message.chat.id,
+            "⚠️ Сессия удаления истекла. Начните заново.",
+            reply_markup=main_keyboard()
+        )
+        await save_state(user_id, STATE_MAIN)
+        return
+
+    if message.text == 'Нет, оставить ❎':
+        await bot.send_message(
+            message.chat.id,
+            f"Слово '{word}' осталось в вашем словаре.",
+            reply_markup=main_keyboard()
+        )
+    elif message.text == 'Да, удалить ✅':
+        await database_async.remove_user_word(user_id, word_id)
+        await bot.send_message(
+            message.chat.id,
+            f"✅ Слово '{word}' успешно удалено!",
+            reply_markup=main_keyboard()
+        )
+
+    await save_state(user_id, STATE_MAIN)
+
+
+async def main():
+    await database_async.init_pool()
+    # Синхронный пул (пачки write_behind, сверка, рассылки) уже зарегистрирован как bot_db_pool
+    metrics.registry.add_stats('bot_db_pool_async', database_async.pool_stats)
+    # Отложенные записи идут в БД из своего потока через синхронный пул
+    database.writes.start()
+    try:
+        await bot.polling(non_stop=True)
+    finally:
+        await asyncio.to_thread(database.writes.stop)
+        database.close_pool()
+        await database_async.close_pool()
+
+
+def run():
+    """
+    Запуск бота в асинхронном режиме. Схема БД к этому моменту уже создана,
+    а индекс вариантов загружен в main.start_services
+    """
+    asyncio.run(main())
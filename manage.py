@@ -0,0 +1,132 @@
+import argparse
+import csv
+import json
+import sys
+import time
+
+import broadcast
+import database
+import migrations
+import word_loader
+
+# Служебные команды бота, запускаются из каталога с config.ini:
+#   python manage.py migrate
+#   python manage.py load-words words.csv
+#   python manage.py reconcile-stats
+#   python manage.py broadcast "Текст объявления"
+
+
+def migrate(args):
+    try:
+        with database.get_pool().connection() as conn:
+            version = migrations.current_version(conn)
+            print(f"Текущая версия схемы: {version}, последняя: {migrations.LATEST_VERSION}")
+            if args.check:
+                return 0 if version >= migrations.LATEST_VERSION else 1
+            applied = migrations.migrate(
+                conn,
+                target=args.target or migrations.LATEST_VERSION,
+                on_apply=lambda number, description: print(f"Миграция {number}: {description}")
+            )
+    finally:
+        database.close_pool()
+    print(f"Применено миграций: {len(applied)}" if applied else "Схема актуальна")
+    return 0
+
+
+def load_words(args):
+    started = time.monotonic()
+    rejects_file = open(args.rejects, "w", encoding="utf-8", newline="") if args.rejects else None
+    rejects_writer = csv.writer(rejects_file) if rejects_file else None
+
+    def on_progress(stats):
+        print(f"Прочитано: {stats['read']}, загружено: {stats['loaded']}, "
+              f"пропущено: {stats['skipped']}, отклонено: {stats['rejected']}")
+
+    def on_reject(number, row, reason):
+        if rejects_writer:
+            # Для строк JSONL с ошибкой разбора исходной строки нет, есть только причина
+            raw = "" if isinstance(row, word_loader.RowError) else json.dumps(row, ensure_ascii=False)
+            rejects_writer.writerow([number, reason, raw])
+        else:
+            print(f"Строка {number} отклонена: {reason}", file=sys.stderr)
+
+    try:
+        with database.get_pool().connection() as conn:
+            stats = word_loader.load_words(
+                conn, args.path,
+                file_format=args.format,
+                chunk_size=args.chunk_size,
+                update=args.update,
+                delimiter=args.delimiter,
+                on_progress=on_progress,
+                on_reject=on_reject
+            )
+    finally:
+        if rejects_file:
+            rejects_file.close()
+        database.close_pool()
+
+    print(f"Готово за {time.monotonic() - started:.1f} с. Загружено: {stats['loaded']}, "
+          f"пропущено существующих: {stats['skipped']}, отклонено: {stats['rejected']}")
+    return 1 if stats["rejected"] else 0
+
+
+def reconcile_stats(args):
+    started = time.monotonic()
+    try:
+        users = database.reconcile_stats(args.limit)
+    finally:
+        database.close_pool()
+    print(f"Счетчики статистики сверены у {users} пользователей за {time.monotonic() - started:.1f} с")
+    return 0
+
+
+def create_broadcast(args):
+    active_before = time.time() - args.inactive_days * broadcast.DAY if args.inactive_days else None
+    try:
+        broadcast_id = database.create_broadcast(None, args.text, active_before=active_before)
+    finally:
+        database.close_pool()
+    print(f"Рассылка {broadcast_id} создана, ее отправит запущенный бот")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Служебные команды бота")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrator = commands.add_parser("migrate", help="Применить миграции схемы БД")
+    migrator.add_argument("--check", action="store_true",
+                          help="Только проверить версию схемы, код возврата 1 если она устарела")
+    migrator.add_argument("--target", type=int, help="Применить миграции только до этой версии")
+    migrator.set_defaults(handler=migrate)
+
+    loader = commands.add_parser("load-words", help="Загрузить общий словарь из CSV, JSON или JSONL")
+    loader.add_argument("path", help="Файл со строками: русское слово, перевод и три неправильных варианта")
+    loader.add_argument("--format", choices=("csv", "json", "jsonl"),
+                        help="Формат файла, по умолчанию определяется по расширению")
+    loader.add_argument("--delimiter", default=",", help="Разделитель столбцов CSV")
+    loader.add_argument("--chunk-size", type=int, default=10000, help="Строк в одной пачке COPY")
+    loader.add_argument("--update", action="store_true",
+                        help="Обновлять переводы уже существующих слов вместо пропуска")
+    loader.add_argument("--rejects", help="CSV-файл для отклоненных строк (номер, причина, строка)")
+    loader.set_defaults(handler=load_words)
+
+    reconciler = commands.add_parser("reconcile-stats", help="Пересчитать счетчики статистики пользователей")
+    reconciler.add_argument("--limit", type=int,
+                            help="Сколько давно не сверенных пользователей пересчитать, по умолчанию всех")
+    reconciler.set_defaults(handler=reconcile_stats)
+
+    broadcaster = commands.add_parser("broadcast", help="Создать рассылку всем пользователям")
+    broadcaster.add_argument("text", help="Текст сообщения")
+    broadcaster.add_argument("--inactive-days", type=float, default=0,
+                             help="Только тем, кто не заходил в бота столько дней")
+    broadcaster.set_defaults(handler=create_broadcast)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+import bisect
+import cProfile
+import functools
+import heapq
+import inspect
+import io
+import itertools
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Метрики бота: гистограммы задержки обработчиков и запросов к БД, счетчики ошибок
+# и показатели пула соединений и очередей. Отдаются в текстовом формате Prometheus
+# по HTTP (GET /metrics), самые медленные запросы – GET /slow.
+# Замер – два вызова perf_counter и одна короткая блокировка на гистограмму,
+# поэтому метрики можно не выключать в production.
+
+# Границы корзин гистограмм задержки, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Сколько строк профиля хранить для медленного запроса
+PROFILE_LINES = 25
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами, как histogram в Prometheus
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self):
+        """
+        (накопленные числа по корзинам, включая +Inf, сумма значений)
+        """
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        return list(itertools.accumulate(counts)), total
+
+
+class SlowLog:
+    """
+    size самых медленных запросов с момента запуска: (секунды, обработчик, пользователь, профиль).
+    Доля profile_rate запросов выполняется под cProfile, профиль сохраняется,
+    если запрос попал в список
+    """
+
+    def __init__(self, size: int = 20, profile_rate: float = 0.0):
+        self.size = size
+        self.profile_rate = profile_rate
+        self._heap = []  # (секунды, номер, запись), наверху самый быстрый из медленных
+        self._numbers = itertools.count()
+        self._lock = threading.Lock()
+
+    def threshold(self) -> float:
+        """
+        Быстрее этого запрос в список не попадет
+        """
+        heap = self._heap
+        return heap[0][0] if self.size and len(heap) >= self.size else 0.0
+
+    def add(self, seconds: float, handler: str, user_id=None, profile=None):
+        if not self.size or seconds <= self.threshold():
+            return
+        entry = (seconds, next(self._numbers),
+                 {"handler": handler, "user_id": user_id, "at": time.time(), "profile": profile})
+        with self._lock:
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, entry)
+            elif seconds > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def entries(self) -> list:
+        with self._lock:
+            return sorted(self._heap, reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._heap = []
+
+    def render(self) -> str:
+        lines = []
+        for seconds, _, entry in self.entries():
+            at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["at"]))
+            lines.append(f"{seconds * 1000:.1f} мс  {entry['handler']}  пользователь {entry['user_id']}  {at}")
+            if entry["profile"]:
+                lines.append(entry["profile"])
+        return "\n".join(lines) + "\n"
+
+
+class Registry:
+    """
+    Метрики процесса. Гистограммы и счетчики создаются при первом обращении по имени
+    и меткам, показатели (gauge) вычисляются при чтении из stats() компонентов
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.slow = SlowLog()
+        self._help = {}
+        self._histograms = {}  # (имя, метки) -> Histogram
+        self._counters = {}  # (имя, метки) -> число
+        self._stats = {}  # префикс -> функция, возвращающая dict
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, text: str):
+        self._help[name] = text
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        return histogram
+
+    def observe(self, name: str, seconds: float, **labels):
+        if self.enabled:
+            self.histogram(name, **labels).observe(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def add_stats(self, prefix: str, stats):
+        """
+        Числовые значения stats() становятся показателями prefix_<ключ>;
+        списки – с меткой index, словари – с меткой key
+        """
+        self._stats[prefix] = stats
+
+    def remove_stats(self, prefix: str):
+        self._stats.pop(prefix, None)
+
+    def render(self) -> str:
+        """
+        Все метрики в текстовом формате Prometheus
+        """
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        for (name, labels), histogram in histograms:
+            header(name, "histogram")
+            cumulative, total = histogram.snapshot()
+            for bound, count in zip(list(histogram.buckets) + ["+Inf"], cumulative):
+                lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative[-1]}")
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for prefix, stats in sorted(self._stats.items()):
+            try:
+                values = stats()
+            except Exception as e:
+                lines.append(f"# {prefix}: {e}")
+                continue
+            for key, value in values.items():
+                name = f"{prefix}_{key}"
+                if isinstance(value, dict):
+                    samples = [((("key", item),), number) for item, number in value.items()]
+                elif isinstance(value, (list, tuple)):
+                    samples = [((("index", index),), number) for index, number in enumerate(value)]
+                else:
+                    samples = [((), value)]
+                samples = [(labels, number) for labels, number in samples if isinstance(number, (int, float))]
+                if samples:
+                    header(name, "gauge")
+                    lines.extend(f"{name}{_labels(labels)} {float(number)}" for labels, number in samples)
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+registry = Registry()
+registry.describe("bot_handler_seconds", "Время обработки сообщения по обработчикам")
+registry.describe("bot_query_seconds", "Время запросов к хранилищу по именам")
+registry.describe("bot_errors_total", "Ошибки по месту возникновения")
+
+
+def configure(enabled: bool = True, slow_requests: int = 20, profile_rate: float = 0.0):
+    registry.enabled = enabled
+    registry.slow.size = slow_requests if enabled else 0
+    registry.slow.profile_rate = profile_rate if enabled else 0.0
+
+
+def error(source: str):
+    """
+    Учитывает ошибку в bot_errors_total{source=...}
+    """
+    registry.inc("bot_errors_total", source=source)
+
+
+def timed(name: str, **labels):
+    """
+    Декоратор: время каждого вызова попадает в гистограмму name с метками labels.
+    Работает и с async-функциями
+    """
+    def decorator(func):
+        # Метки постоянны, поэтому гистограмма находится один раз, а не при каждом вызове
+        histogram = registry.histogram(name, **labels)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    if registry.enabled:
+                        histogram.observe(time.perf_counter() - started)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if registry.enabled:
+                    histogram.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def query(name: str):
+    """
+    Декоратор функций хранилища: bot_query_seconds{query=name}
+    """
+    return timed("bot_query_seconds", query=name)
+
+
+class Request:
+    """
+    Замеряемая обработка сообщения; handler можно уточнить, когда обработчик найден
+    """
+    __slots__ = ("handler", "user_id")
+
+    def __init__(self, handler: str, user_id=None):
+        self.handler = handler
+        self.user_id = user_id
+
+
+@contextmanager
+def request(handler: str = "unrouted", user_id=None, profile: bool = True):
+    """
+    Замер обработки одного сообщения: bot_handler_seconds{handler=...}, ошибки
+    и список самых медленных запросов. profile=False – не профилировать
+    (в asyncio профиль захватил бы чужие задачи)
+    """
+    current = Request(handler, user_id)
+    if not registry.enabled:
+        yield current
+        return
+    slow = registry.slow
+    profiler = None
+    if profile and slow.profile_rate and random.random() < slow.profile_rate:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # С Python 3.12 профилировщик в процессе может быть только один
+            profiler = None
+    started = time.perf_counter()
+    try:
+        yield current
+    except Exception:
+        error(f"handler:{current.handler}")
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        if profiler is not None:
+            profiler.disable()
+        registry.observe("bot_handler_seconds", seconds, handler=current.handler)
+        if seconds > slow.threshold():
+            slow.add(seconds, current.handler, current.user_id,
+                     _profile_text(profiler) if profiler is not None else None)
+
+
+def _profile_text(profiler) -> str:
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(PROFILE_LINES)
+    return stream.getvalue()
+
+
+class MetricsServer:
+    """
+    HTTP-сервер метрик: GET /metrics – формат Prometheus, GET /slow – самые медленные
+    запросы (GET /slow?reset=1 очищает список)
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9108, registry: Registry = registry):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._httpd = None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path, _, query_string = self.path.partition("?")
+                if path == "/metrics":
+                    body = server.registry.render()
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif path == "/slow":
+                    body = server.registry.slow.render()
+                    if "reset=1" in query_string:
+                        server.registry.slow.reset()
+                    content_type = "text/plain; charset=utf-8"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name="metrics", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
@@ -0,0 +1,441 @@
+import csv
+import os
+
+from psycopg2 import errors
+from psycopg2.extras import execute_values
+
+# Версионные миграции схемы БД.
+# Каждая миграция – функция, которая получает курсор и приводит схему к своей версии.
+# Номер последней примененной версии хранится в schema_version, поэтому при обычном
+# запуске достаточно одного запроса: если версия актуальна, DDL не выполняется вовсе.
+# Миграции идемпотентны: БД, созданные до появления schema_version, проходят их все
+# и получают недостающие таблицы, столбцы и индексы, не теряя данных.
+# Миграция выполняется в одной транзакции на курсоре migrate() и не зависит от кода
+# других модулей: запросы, которые меняются вместе с ботом, копируются сюда как есть
+# на момент миграции, иначе старая миграция незаметно делала бы уже другое.
+
+# Ключ pg_advisory_lock: пока одна реплика применяет миграции, остальные ждут
+ADVISORY_LOCK_ID = 72_010_509
+
+# Начальный общий словарь
+INITIAL_WORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'initial_words.csv')
+
+
+class SchemaOutdated(Exception):
+    """
+    Схема БД старее кода, а автоматическое применение миграций выключено
+    """
+
+
+def create_base_tables(cur):
+    """
+    Пользователи, слова, удаленные пользователями слова и история
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS users(
+        id BIGINT PRIMARY KEY,
+        name VARCHAR(100),
+        created_at TIMESTAMP DEFAULT NOW(),
+        last_active TIMESTAMP DEFAULT NOW()
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS words(
+        id SERIAL PRIMARY KEY,
+        russian_word VARCHAR(50) NOT NULL,
+        target_word VARCHAR(50) NOT NULL,
+        other_word_1 VARCHAR(50) NOT NULL,
+        other_word_2 VARCHAR(50) NOT NULL,
+        other_word_3 VARCHAR(50) NOT NULL,
+        user_id BIGINT,
+        added_at TIMESTAMP DEFAULT NOW(),
+        CONSTRAINT unique_word_per_user UNIQUE (russian_word, user_id)
+        );
+    """)
+    # В самых старых БД у words не было user_id и ограничения уникальности
+    cur.execute("ALTER TABLE words ADD COLUMN IF NOT EXISTS user_id BIGINT;")
+    cur.execute("SELECT 1 FROM pg_constraint WHERE conname = 'unique_word_per_user' AND conrelid = 'words'::regclass")
+    if not cur.fetchone():
+        cur.execute("ALTER TABLE words ADD CONSTRAINT unique_word_per_user UNIQUE (russian_word, user_id);")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS deleted_words(
+        user_id BIGINT NOT NULL,
+        words_id INTEGER NOT NULL,
+        deleted_at TIMESTAMP DEFAULT NOW(),
+        PRIMARY KEY (user_id, words_id),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (words_id) REFERENCES words(id) ON DELETE CASCADE
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS learned_words(
+        user_id BIGINT NOT NULL,
+        words_id INTEGER NOT NULL,
+        learned_at TIMESTAMP DEFAULT NOW(),
+        PRIMARY KEY (user_id, words_id),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (words_id) REFERENCES words(id) ON DELETE CASCADE
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_deleted_words_user_id ON deleted_words(user_id);")
+
+
+def migrate_to_lazy_vocabulary(cur):
+    """
+    Переход со старой схемы, где /start копировал каждое общее слово в user_word.
+    После /start в user_word лежали все общие и свои слова пользователя, кроме
+    deleted_words, то есть ровно тот набор, который теперь вычисляется без копий.
+    Поэтому таблица больше не читается: она переименовывается в user_word_legacy,
+    чтобы данные можно было сверить или удалить вручную.
+    """
+    cur.execute("SELECT to_regclass('user_word') IS NOT NULL, to_regclass('user_word_legacy') IS NOT NULL")
+    has_user_word, has_legacy = cur.fetchone()
+    if has_user_word and not has_legacy:
+        cur.execute("ALTER TABLE user_word RENAME TO user_word_legacy;")
+
+
+def add_rand_key(cur):
+    """
+    Случайный ключ слова для выбора случайного слова по индексу (см. get_random_user_word)
+    """
+    cur.execute("ALTER TABLE words ADD COLUMN IF NOT EXISTS rand_key DOUBLE PRECISION NOT NULL DEFAULT random();")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_words_global_rand_key ON words(rand_key) WHERE user_id IS NULL;")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_words_user_rand_key ON words(user_id, rand_key);")
+
+
+def create_conversation_state(cur):
+    """
+    Состояние диалога пользователей для state_store с backend = postgres
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_state(
+        user_id BIGINT PRIMARY KEY,
+        data JSONB NOT NULL,
+        expires_at TIMESTAMP NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_conversation_state_expires_at ON conversation_state(expires_at);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_conversation_state_updated_at ON conversation_state(updated_at);")
+
+
+def unique_global_words(cur):
+    """
+    Общее слово уникально среди общих слов (у своих слов пользователя – unique_word_per_user).
+    NULL в user_id не конфликтует в unique_word_per_user, поэтому повторные запуски старого
+    create_database могли создать дубли. Они схлопываются в слово с меньшим id, а удаления
+    и история пользователей переносятся на него.
+    """
+    cur.execute("""
+        CREATE TEMP TABLE duplicate_words ON COMMIT DROP AS
+        SELECT id, MIN(id) OVER (PARTITION BY russian_word) AS keep_id
+        FROM words
+        WHERE user_id IS NULL;
+        DELETE FROM duplicate_words WHERE id = keep_id;
+    """)
+    for table, column in (("deleted_words", "deleted_at"), ("learned_words", "learned_at")):
+        cur.execute(f"""
+            INSERT INTO {table} (user_id, words_id, {column})
+            SELECT t.user_id, d.keep_id, t.{column}
+            FROM {table} t
+            JOIN duplicate_words d ON d.id = t.words_id
+            ON CONFLICT (user_id, words_id) DO NOTHING;
+        """)
+    cur.execute("DELETE FROM words WHERE id IN (SELECT id FROM duplicate_words);")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS unique_global_word ON words(russian_word) WHERE user_id IS NULL;")
+
+
+def seed_initial_words(cur):
+    """
+    Начальный набор слов из data/initial_words.csv, уже существующие слова пропускаются.
+    Строки не из пяти непустых слов пропускаются
+    """
+    with open(INITIAL_WORDS_PATH, encoding='utf-8-sig', newline='') as file:
+        rows = [tuple(value.strip() for value in row) for row in list(csv.reader(file))[1:]]
+    rows = [row for row in rows if len(row) == 5 and all(row)]
+    execute_values(cur, """
+        INSERT INTO words (russian_word, target_word, other_word_1, other_word_2, other_word_3)
+        VALUES %s
+        ON CONFLICT (russian_word) WHERE user_id IS NULL DO NOTHING
+    """, rows)
+
+
+def notify_words_changed(cur):
+    """
+    Уведомление words_changed с id слова при его изменении или удалении,
+    по нему процессы бота сбрасывают слово из кэша (см. word_cache.py)
+    """
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION notify_words_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('words_changed', OLD.id::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    cur.execute("DROP TRIGGER IF EXISTS words_changed ON words;")
+    cur.execute("""
+        CREATE TRIGGER words_changed
+        AFTER UPDATE OR DELETE ON words
+        FOR EACH ROW EXECUTE PROCEDURE notify_words_changed();
+    """)
+
+
+def create_answer_events(cur):
+    """
+    История ответов на вопросы, пишется пачками через write_behind.py
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS answer_events(
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        words_id INTEGER NOT NULL,
+        correct BOOLEAN NOT NULL,
+        attempt SMALLINT NOT NULL DEFAULT 1,
+        answered_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (words_id) REFERENCES words(id) ON DELETE CASCADE
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_answer_events_user_id ON answer_events(user_id, answered_at);")
+
+
+def create_word_progress(cur):
+    """
+    Прогресс интервального повторения (см. spaced.py). Следующее слово к повторению
+    берется из индекса (user_id, due_at), новые слова – по возрастанию id из индексов words
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS word_progress(
+        user_id BIGINT NOT NULL,
+        words_id INTEGER NOT NULL,
+        repetitions INTEGER NOT NULL DEFAULT 0,
+        interval_days REAL NOT NULL DEFAULT 0,
+        ease REAL NOT NULL DEFAULT 2.5,
+        due_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        reviewed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (user_id, words_id),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (words_id) REFERENCES words(id) ON DELETE CASCADE
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_word_progress_due ON word_progress(user_id, due_at);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_words_global_id ON words(id) WHERE user_id IS NULL;")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_words_user_id ON words(user_id, id);")
+
+
+def create_normalized_word_index(cur):
+    """
+    Поиск слова без учета регистра, пробелов по краям и ё (см. word_lookup.normalize)
+    по индексу на выражении normalize_word(russian_word). Индекс (user_id, ...) обслуживает
+    и общие слова (user_id IS NULL), и слова пользователя
+    """
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION normalize_word(word TEXT) RETURNS TEXT AS $$
+            SELECT replace(lower(btrim(word)), 'ё', 'е');
+        $$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE;
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_words_normalized ON words(user_id, normalize_word(russian_word));")
+
+
+# Пересчет счетчиков user_stats для миграции 11 – копия user_stats.RECONCILE_SQL
+# на момент миграции. LIMIT NULL – все пользователи
+USER_STATS_RECONCILE_SQL = """
+    WITH targets AS (
+        SELECT user_id FROM user_stats
+        ORDER BY reconciled_at NULLS FIRST
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    ),
+    custom AS (
+        SELECT w.user_id, COUNT(*) AS n
+        FROM words w JOIN targets t ON t.user_id = w.user_id
+        GROUP BY w.user_id
+    ),
+    deleted AS (
+        SELECT dw.user_id, COUNT(*) AS n
+        FROM deleted_words dw JOIN targets t ON t.user_id = dw.user_id
+        GROUP BY dw.user_id
+    ),
+    learned AS (
+        SELECT lw.user_id, COUNT(*) AS n
+        FROM learned_words lw JOIN targets t ON t.user_id = lw.user_id
+        GROUP BY lw.user_id
+    ),
+    answers AS (
+        SELECT a.user_id, COUNT(*) AS n, COUNT(*) FILTER (WHERE a.correct) AS correct
+        FROM answer_events a JOIN targets t ON t.user_id = a.user_id
+        GROUP BY a.user_id
+    ),
+    runs AS (
+        -- У дней одной серии разность даты и номера дня по порядку одинакова
+        SELECT user_id, COUNT(*) AS length, MAX(day) AS last_day
+        FROM (
+            SELECT user_id, day, day - (ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY day))::integer AS series
+            FROM (
+                SELECT DISTINCT a.user_id, a.answered_at::date AS day
+                FROM answer_events a JOIN targets t ON t.user_id = a.user_id
+            ) days
+        ) numbered
+        GROUP BY user_id, series
+    ),
+    streaks AS (
+        SELECT user_id, MAX(length) AS best, (ARRAY_AGG(length ORDER BY last_day DESC))[1] AS current,
+               MAX(last_day) AS last_day
+        FROM runs
+        GROUP BY user_id
+    )
+    UPDATE user_stats s
+    SET custom_words = COALESCE(c.n, 0),
+        deleted_words = COALESCE(d.n, 0),
+        learned_words = COALESCE(l.n, 0),
+        answers = COALESCE(a.n, 0),
+        correct_answers = COALESCE(a.correct, 0),
+        streak_days = COALESCE(r.current, 0),
+        best_streak = COALESCE(r.best, 0),
+        last_answer_date = r.last_day,
+        reconciled_at = NOW()
+    FROM targets t
+    LEFT JOIN custom c ON c.user_id = t.user_id
+    LEFT JOIN deleted d ON d.user_id = t.user_id
+    LEFT JOIN learned l ON l.user_id = t.user_id
+    LEFT JOIN answers a ON a.user_id = t.user_id
+    LEFT JOIN streaks r ON r.user_id = t.user_id
+    WHERE s.user_id = t.user_id
+"""
+
+
+def create_user_stats(cur):
+    """
+    Счетчики статистики пользователей (см. user_stats.py). Для уже существующих
+    пользователей счетчики сразу пересчитываются по таблицам
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats(
+        user_id BIGINT PRIMARY KEY,
+        custom_words INTEGER NOT NULL DEFAULT 0,
+        deleted_words INTEGER NOT NULL DEFAULT 0,
+        learned_words INTEGER NOT NULL DEFAULT 0,
+        answers INTEGER NOT NULL DEFAULT 0,
+        correct_answers INTEGER NOT NULL DEFAULT 0,
+        streak_days INTEGER NOT NULL DEFAULT 0,
+        best_streak INTEGER NOT NULL DEFAULT 0,
+        last_answer_date DATE,
+        reconciled_at TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_user_stats_reconciled ON user_stats(reconciled_at NULLS FIRST);")
+    cur.execute("INSERT INTO user_stats (user_id) SELECT id FROM users ON CONFLICT (user_id) DO NOTHING;")
+    cur.execute(USER_STATS_RECONCILE_SQL, {"limit": None})
+
+
+def create_broadcasts(cur):
+    """
+    Рассылки и напоминания (см. broadcast.py). Получатели читаются по возрастанию id
+    с фильтром по last_active: в индексе (id, last_active) фильтр проверяется без чтения
+    строк таблицы, поэтому страница стоит одинаково в начале и в конце списка
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS broadcasts(
+        id SERIAL PRIMARY KEY,
+        name VARCHAR(100) UNIQUE,
+        text TEXT NOT NULL,
+        active_after TIMESTAMP NOT NULL DEFAULT '-infinity',
+        active_before TIMESTAMP NOT NULL DEFAULT 'infinity',
+        last_user_id BIGINT NOT NULL DEFAULT 0,
+        sent INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        finished_at TIMESTAMP
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_broadcasts_unfinished ON broadcasts(id) WHERE finished_at IS NULL;")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_id_last_active ON users(id, last_active);")
+
+
+# Порядок менять нельзя, новые миграции добавляются только в конец
+MIGRATIONS = [
+    (1, "Базовые таблицы", create_base_tables),
+    (2, "Общий словарь без копирования в user_word", migrate_to_lazy_vocabulary),
+    (3, "Случайный ключ слова rand_key", add_rand_key),
+    (4, "Таблица conversation_state", create_conversation_state),
+    (5, "Уникальность общих слов", unique_global_words),
+    (6, "Начальный набор слов", seed_initial_words),
+    (7, "Уведомления об изменении слов", notify_words_changed),
+    (8, "История ответов answer_events", create_answer_events),
+    (9, "Интервальное повторение word_progress", create_word_progress),
+    (10, "Индекс нормализованного написания слов", create_normalized_word_index),
+    (11, "Счетчики статистики user_stats", create_user_stats),
+    (12, "Рассылки broadcasts", create_broadcasts),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn) -> int:
+    """
+    Последняя примененная версия схемы, 0 для пустой БД или БД без schema_version
+    """
+    with conn.cursor() as cur:
+        try:
+            cur.execute("SELECT MAX(version) FROM schema_version")
+        except errors.UndefinedTable:
+            conn.rollback()
+            return 0
+        version = cur.fetchone()[0] or 0
+    conn.rollback()
+    return version
+
+
+def migrate(conn, target: int = LATEST_VERSION, on_apply=None) -> list:
+    """
+    Применяет недостающие миграции до версии target, каждую в своей транзакции.
+    Реплики, запущенные одновременно, выстраиваются в очередь на advisory lock,
+    и каждая перечитывает версию уже под блокировкой. Возвращает номера примененных миграций
+    """
+    applied = []
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s)", (ADVISORY_LOCK_ID,))
+        try:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version(
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+                );
+            """)
+            conn.commit()
+            version = current_version(conn)
+            for number, description, step in MIGRATIONS:
+                if number <= version or number > target:
+                    continue
+                if on_apply:
+                    on_apply(number, description)
+                step(cur)
+                cur.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                            (number, description))
+                conn.commit()
+                applied.append(number)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (ADVISORY_LOCK_ID,))
+            conn.commit()
+    return applied
+
+
+def ensure_schema(conn, auto_migrate: bool = True) -> list:
+    """
+    Проверка схемы при запуске бота: один запрос, если схема актуальна.
+    Иначе применяет миграции или, при auto_migrate = False, бросает SchemaOutdated
+    """
+    version = current_version(conn)
+    if version >= LATEST_VERSION:
+        return []
+    if not auto_migrate:
+        raise SchemaOutdated(
+            f"Схема БД версии {version}, нужна {LATEST_VERSION}. Выполните: python manage.py migrate"
+        )
+    return migrate(conn)
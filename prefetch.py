@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Заранее подготовленные вопросы для пользователей.
+# Пока вопрос на экране, в фоне выбирается и готовится следующее слово (строка слова
+# и готовая клавиатура), и нажатие "Новое слово" отвечает из памяти без запроса к БД.
+# Всего хранится не больше max_users пользователей по depth вопросов, давно не
+# спрашивавшие вытесняются. Вопросы старше max_age секунд не используются.
+
+
+class Prefetcher:
+    """
+    Буферы подготовленных вопросов по пользователям.
+    prepare(user_id) возвращает вопрос (первый элемент – строка слова) или None, если слов нет
+    """
+
+    def __init__(self, prepare, depth: int = 2, max_users: int = 10000, workers: int = 2,
+                 max_age: float = 600):
+        self.prepare = prepare
+        self.depth = depth
+        self.max_users = max_users
+        self.max_age = max_age
+
+        self._lock = threading.Lock()
+        self._buffers = OrderedDict()  # user_id -> deque((подготовлен в, вопрос))
+        self._generations = {}  # user_id -> номер, растет при каждом сбросе буфера
+        self._in_flight = set()
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="prefetch") if depth > 0 else None
+
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+
+    def take(self, user_id):
+        """
+        Готовый вопрос для пользователя или None
+        """
+        now = time.monotonic()
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            while buffer:
+                prepared_at, question = buffer.popleft()
+                if now - prepared_at <= self.max_age:
+                    self.hits += 1
+                    return question
+                self.discarded += 1
+            self.misses += 1
+            return None
+
+    def schedule(self, user_id):
+        """
+        Запускает фоновую подготовку вопросов, если буфер пользователя не полон
+        """
+        if self._executor is None:
+            return
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            if user_id in self._in_flight or (buffer is not None and len(buffer) >= self.depth):
+                return
+            # Не даем очереди фоновых задач расти без ограничения
+            if len(self._in_flight) >= self.max_users:
+                return
+            self._in_flight.add(user_id)
+            generation = self._generations.get(user_id, 0)
+        self._executor.submit(self._fill, user_id, generation)
+
+    def _fill(self, user_id, generation):
+        try:
+            while True:
+                question = self.prepare(user_id)
+                with self._lock:
+                    if question is None or self._generations.get(user_id, 0) != generation:
+                        # Слов нет или набор слов изменился, пока готовили вопрос
+                        return
+                    buffer = self._buffers.get(user_id)
+                    if buffer is None:
+                        buffer = self._buffers[user_id] = deque()
+                    self._buffers.move_to_end(user_id)
+                    buffer.append((time.monotonic(), question))
+                    while len(self._buffers) > self.max_users:
+                        evicted_id, _ = self._buffers.popitem(last=False)
+                        self._generations.pop(evicted_id, None)
+                    if len(buffer) >= self.depth:
+                        return
+        except Exception as e:
+            print(f"Ошибка при подготовке вопроса: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(user_id)
+                if user_id not in self._buffers:
+                    self._generations.pop(user_id, None)
+
+    def invalidate(self, user_id, word_id=None):
+        """
+        Сбрасывает подготовленные вопросы: со словом word_id или все, если оно не задано.
+        Вопросы, которые готовятся в этот момент, тоже будут отброшены
+        """
+        with self._lock:
+            if user_id not in self._buffers and user_id not in self._in_flight:
+                return
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            buffer = self._buffers.get(user_id)
+            if not buffer:
+                return
+            if word_id is None:
+                self.discarded += len(buffer)
+                del self._buffers[user_id]
+                if user_id not in self._in_flight:
+                    self._generations.pop(user_id, None)
+                return
+            kept = deque(item for item in buffer if item[1][0][0] != word_id)
+            self.discarded += len(buffer) - len(kept)
+            self._buffers[user_id] = kept
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "users": len(self._buffers),
+                "questions": sum(len(buffer) for buffer in self._buffers.values()),
+                "in_flight": len(self._in_flight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "discarded": self.discarded,
+            }
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
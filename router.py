@@ -0,0 +1,67 @@
+from telebot import util
+
+# Таблица маршрутов бота: каждому сообщению обработчик находится одним поиском в словаре,
+# а не перебором фильтров всех @bot.message_handler по очереди.
+# Порядок проверки тот же, что был у обработчиков:
+#   1. ожидаемый шаг диалога (бывший register_next_step_handler),
+#   2. команда (/start),
+#   3. кнопка в текущем состоянии, затем кнопка, доступная в любом состоянии.
+# Нажатия inline-кнопок (callback_query) находятся по виду кнопки в callbacks.
+
+# Кнопка доступна в любом состоянии
+ANY_STATE = object()
+
+
+class Router:
+    """
+    Маршруты по командам, (состояние, текст кнопки) и именам шагов диалога
+    """
+
+    def __init__(self):
+        self.commands = {}  # имя команды без "/" -> обработчик
+        self.buttons = {}  # (состояние, текст) -> обработчик
+        self.steps = {}  # имя шага -> обработчик
+        self.callbacks = {}  # вид inline-кнопки (первое поле callback_data) -> обработчик
+
+    def command(self, *names):
+        def decorator(handler):
+            for name in names:
+                self.commands[name] = handler
+            return handler
+        return decorator
+
+    def button(self, text, state=ANY_STATE):
+        def decorator(handler):
+            self.buttons[(state, text)] = handler
+            return handler
+        return decorator
+
+    def step(self, name=None):
+        def decorator(handler):
+            self.steps[name or handler.__name__] = handler
+            return handler
+        return decorator
+
+    def callback(self, kind):
+        def decorator(handler):
+            self.callbacks[kind] = handler
+            return handler
+        return decorator
+
+    def resolve(self, text, state, step=None):
+        """
+        Обработчик сообщения с текстом text от пользователя в состоянии state,
+        у которого ожидается шаг step. None, если сообщение ни к чему не относится
+        """
+        if step is not None:
+            return self.steps.get(step)
+        if text is None:
+            return None
+        if text.startswith('/'):
+            handler = self.commands.get(util.extract_command(text))
+            if handler is not None:
+                return handler
+        handler = self.buttons.get((state, text))
+        if handler is None:
+            handler = self.buttons.get((ANY_STATE, text))
+        return handler
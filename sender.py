@@ -0,0 +1,284 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+from telebot import apihelper
+
+# Очередь исходящих сообщений с учетом ограничений Telegram.
+# Telegram принимает примерно одно сообщение в секунду в один чат (с небольшим запасом)
+# и около 30 сообщений в секунду от бота в целом, а сверх этого отвечает 429 с retry_after.
+# Сообщения ставятся в очередь чата и отправляются рабочими потоками, когда в ведре
+# токенов чата и в общем ведре есть токен. Сообщения одного чата уходят строго по порядку,
+# ответы на вопросы (PRIORITY_INTERACTIVE) обгоняют рассылки (PRIORITY_BULK).
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# Сколько последних замеров задержки в очереди хранить для статистики
+LATENCY_SAMPLES = 10000
+
+
+def configure_session(pool_size: int = 8):
+    """
+    Одна HTTP-сессия с пулом соединений для всех потоков: без нее telebot заводит
+    сессию на каждый поток, и каждая открывает собственное TLS-соединение
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    apihelper.session = session
+    return session
+
+
+class TokenBucket:
+    """
+    Ведро токенов: rate токенов в секунду, не больше capacity про запас
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now) -> float:
+        """
+        Через сколько секунд появится токен, 0 если он есть сейчас
+        """
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+    def pause(self, now, seconds: float):
+        """
+        Запрет отправки на seconds секунд (после 429)
+        """
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class _Chat:
+    __slots__ = ("chat_id", "jobs", "bucket", "scheduled")
+
+    def __init__(self, chat_id, bucket):
+        self.chat_id = chat_id
+        self.jobs = deque()  # (приоритет, поставлено в очередь, попытка, метод бота, args, kwargs, future)
+        self.bucket = bucket
+        self.scheduled = False  # чат в одной из куч или его сообщение отправляется
+
+
+class OutboundSender:
+    """
+    Отправка сообщений через bot.send_message из пула потоков с ограничением частоты.
+    send_message возвращает Future с отправленным Message
+    """
+
+    def __init__(self, bot, workers: int = 8, global_rate: float = 30, chat_rate: float = 1,
+                 chat_burst: float = 3, queue_size: int = 10000, max_retries: int = 3):
+        self.bot = bot
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+
+        self._cond = threading.Condition()
+        self._chats = {}  # chat_id -> _Chat, пока у чата есть сообщения или он на паузе
+        self._ready = []  # куча (приоритет первого сообщения, номер, chat_id)
+        self._delayed = []  # куча (когда можно отправлять, номер, chat_id)
+        self._seq = itertools.count()
+        self._queued = 0
+        self._threads = []
+        self._stopping = False
+
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._sent = 0
+        self._retried = 0
+        self._failed = 0
+
+    def start(self):
+        with self._cond:
+            if self._threads:
+                return
+            self._stopping = False
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"sender-{number}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def send_message(self, chat_id, text, priority: int = PRIORITY_INTERACTIVE, **kwargs) -> Future:
+        """
+        Ставит сообщение в очередь чата. Если очередь заполнена, ждет свободного места
+        """
+        return self._enqueue(chat_id, priority, "send_message", (chat_id, text), kwargs)
+
+    def edit_message_text(self, chat_id, message_id, text, priority: int = PRIORITY_INTERACTIVE,
+                          **kwargs) -> Future:
+        """
+        Ставит в очередь чата изменение текста (и клавиатуры) отправленного сообщения:
+        оно подчиняется тем же ограничениям и порядку, что и новые сообщения
+        """
+        return self._enqueue(chat_id, priority, "edit_message_text", (text, chat_id, message_id), kwargs)
+
+    def _enqueue(self, chat_id, priority, method, args, kwargs) -> Future:
+        if not self._threads:
+            self.start()
+        future = Future()
+        with self._cond:
+            while self._queued >= self.queue_size and not self._stopping:
+                self._cond.wait()
+            if self._stopping:
+                raise RuntimeError("Очередь отправки остановлена")
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                chat = self._chats[chat_id] = _Chat(chat_id, TokenBucket(self.chat_rate, self.chat_burst))
+            chat.jobs.append((priority, time.monotonic(), 0, method, args, kwargs, future))
+            self._queued += 1
+            if not chat.scheduled:
+                chat.scheduled = True
+                heapq.heappush(self._ready, (priority, next(self._seq), chat_id))
+            self._cond.notify()
+        return future
+
+    def _next_job(self):
+        """
+        Ждет чат, которому можно отправить сообщение, и забирает его первое сообщение
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, _, chat_id = heapq.heappop(self._delayed)
+                    chat = self._chats[chat_id]
+                    if chat.jobs:
+                        heapq.heappush(self._ready, (chat.jobs[0][0], next(self._seq), chat_id))
+                    else:
+                        chat.scheduled = False
+                        del self._chats[chat_id]
+                if self._stopping and not self._queued:
+                    return None
+                if not self._ready:
+                    timeout = self._delayed[0][0] - now if self._delayed else None
+                    self._cond.wait(timeout)
+                    continue
+                global_delay = self.global_bucket.delay(now)
+                if global_delay > 0:
+                    self._cond.wait(global_delay)
+                    continue
+                _, _, chat_id = heapq.heappop(self._ready)
+                chat = self._chats[chat_id]
+                chat_delay = chat.bucket.delay(now)
+                if chat_delay > 0:
+                    heapq.heappush(self._delayed, (now + chat_delay, next(self._seq), chat_id))
+                    continue
+                self.global_bucket.consume()
+                chat.bucket.consume()
+                return chat, chat.jobs.popleft()
+
+    def _finish(self, chat, retry_job=None, retry_after: float = 0.0):
+        """
+        Возвращает чат в очередь после отправки: сразу, после паузы или удаляет, если сообщений нет
+        """
+        with self._cond:
+            now = time.monotonic()
+            if retry_job is not None:
+                chat.jobs.appendleft(retry_job)
+                chat.bucket.pause(now, retry_after)
+                heapq.heappush(self._delayed, (now + retry_after, next(self._seq), chat.chat_id))
+            else:
+                self._queued -= 1
+                if chat.jobs:
+                    heapq.heappush(self._ready, (chat.jobs[0][0], next(self._seq), chat.chat_id))
+                elif chat.bucket.delay(now) > 0:
+                    # Чат держим, пока ведро не наполнится, иначе новое сообщение обойдет ограничение
+                    heapq.heappush(self._delayed, (now + chat.bucket.delay(now), next(self._seq), chat.chat_id))
+                else:
+                    chat.scheduled = False
+                    del self._chats[chat.chat_id]
+            self._cond.notify_all()
+
+    def _worker(self):
+        while True:
+            item = self._next_job()
+            if item is None:
+                return
+            chat, job = item
+            priority, queued_at, attempt, method, args, kwargs, future = job
+            if attempt == 0:
+                with self._cond:
+                    self._latencies.append(time.monotonic() - queued_at)
+            try:
+                result = getattr(self.bot, method)(*args, **kwargs)
+            except apihelper.ApiTelegramException as e:
+                if e.error_code == 429 and attempt < self.max_retries:
+                    retry_after = (e.result_json.get("parameters") or {}).get("retry_after", 1)
+                    with self._cond:
+                        self._retried += 1
+                    self._finish(chat, (priority, queued_at, attempt + 1, method, args, kwargs, future), retry_after)
+                    continue
+                self._fail(chat, future, e)
+                continue
+            except Exception as e:
+                self._fail(chat, future, e)
+                continue
+            with self._cond:
+                self._sent += 1
+            self._finish(chat)
+            future.set_result(result)
+
+    def _fail(self, chat, future, error):
+        with self._cond:
+            self._failed += 1
+        print(f"Ошибка при отправке сообщения в чат {chat.chat_id}: {error}")
+        self._finish(chat)
+        future.set_exception(error)
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Дожидается отправки уже поставленных сообщений и останавливает потоки
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def stats(self) -> dict:
+        with self._cond:
+            latencies = sorted(self._latencies)
+            queued_by_priority = {}
+            for chat in self._chats.values():
+                for job in chat.jobs:
+                    queued_by_priority[job[0]] = queued_by_priority.get(job[0], 0) + 1
+            counters = {
+                "queue_depth": self._queued,
+                "queued_by_priority": queued_by_priority,
+                "chats": len(self._chats),
+                "sent": self._sent,
+                "retried_429": self._retried,
+                "failed": self._failed,
+            }
+
+        def percentile(share):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * share))] if latencies else 0.0
+
+        return {
+            **counters,
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+            "latency_max": latencies[-1] if latencies else 0.0,
+        }
@@ -0,0 +1,48 @@
+# Интервальное повторение по алгоритму SM-2.
+# Для каждой пары (пользователь, слово) хранятся число успешных повторений подряд,
+# интервал в днях и коэффициент легкости ease. После ответа по его качеству
+# вычисляются новые значения и время следующего показа due_at.
+
+DAY = 24 * 60 * 60
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+# Интервалы после первого и второго успешного повторения, дней
+FIRST_INTERVAL = 1
+SECOND_INTERVAL = 6
+# Через сколько секунд снова показать слово после ошибки
+RELEARN_DELAY = 10 * 60
+# "Оставить слово" возвращает слово не позже чем через столько секунд
+KEEP_DELAY = DAY
+
+# Качество ответа по шкале SM-2 (0–5)
+QUALITY_FIRST_TRY = 5
+QUALITY_SECOND_TRY = 3
+QUALITY_WRONG = 1
+QUALITY_SKIPPED = 0
+
+
+def answer_quality(correct: bool, attempt: int) -> int:
+    """
+    Качество окончательного ответа: верно с первой попытки, со второй или неверно
+    """
+    if not correct:
+        return QUALITY_WRONG
+    return QUALITY_FIRST_TRY if attempt <= 1 else QUALITY_SECOND_TRY
+
+
+def review(repetitions: int, interval: float, ease: float, quality: int):
+    """
+    Новые (repetitions, interval, ease) и через сколько секунд показать слово снова
+    """
+    if quality < 3:
+        # Слово забыто: повторения начинаются заново, показываем его скоро
+        return 0, 0.0, max(MIN_EASE, ease - 0.2), RELEARN_DELAY
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    if repetitions == 0:
+        interval = FIRST_INTERVAL
+    elif repetitions == 1:
+        interval = SECOND_INTERVAL
+    else:
+        interval = interval * ease
+    return repetitions + 1, float(interval), ease, interval * DAY
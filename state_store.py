@@ -0,0 +1,236 @@
+import contextlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Хранилище состояния диалога пользователя: текущее состояние меню и ожидаемый
+# следующий шаг (например {"state": 0, "step": "check_answer", "word_id": 5, "attempt": 1}).
+# Записи живут не дольше ttl секунд, а их число ограничено max_entries: при переполнении
+# вытесняются записи, которые дольше всего не обновлялись.
+
+# Как часто (раз в сколько записей) долговременные хранилища удаляют устаревшие записи
+CLEANUP_EVERY = 1000
+
+
+class MemoryStateStore:
+    """
+    Состояние в памяти процесса, LRU с ограничением по времени жизни записи
+    """
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # user_id -> (истекает в, значение)
+
+    def get(self, user_id, default=None):
+        with self._lock:
+            item = self._data.get(user_id)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[user_id]
+                return default
+            self._data.move_to_end(user_id)
+            return value
+
+    def set(self, user_id, value):
+        now = time.monotonic()
+        with self._lock:
+            self._data[user_id] = (now + self.ttl, value)
+            self._data.move_to_end(user_id)
+            # Сначала выбрасываем истекшие записи из начала, затем лишние по LRU
+            while self._data:
+                oldest_id, (expires_at, _) = next(iter(self._data.items()))
+                if expires_at > now and len(self._data) <= self.max_entries:
+                    break
+                del self._data[oldest_id]
+
+    def delete(self, user_id):
+        with self._lock:
+            self._data.pop(user_id, None)
+
+    def pop(self, user_id, default=None):
+        with self._lock:
+            item = self._data.pop(user_id, None)
+        if item is None or item[0] <= time.monotonic():
+            return default
+        return item[1]
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class SQLiteStateStore:
+    """
+    Состояние в локальном файле SQLite: переживает перезапуск и доступно
+    нескольким процессам на одной машине
+    """
+
+    def __init__(self, path: str = "state.db", ttl: float = 3600, max_entries: int = 100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS conversation_state(
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_conversation_state_updated_at ON conversation_state(updated_at)")
+
+    def get(self, user_id, default=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM conversation_state WHERE user_id = ? AND expires_at > ?",
+                (user_id, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, user_id, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO conversation_state (user_id, data, expires_at, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE
+                SET data = excluded.data, expires_at = excluded.expires_at, updated_at = excluded.updated_at
+            """, (user_id, json.dumps(value), now + self.ttl, now))
+            self._writes += 1
+            if self._writes % CLEANUP_EVERY == 0:
+                self._cleanup(now)
+
+    def _cleanup(self, now):
+        self._conn.execute("DELETE FROM conversation_state WHERE expires_at <= ?", (now,))
+        self._conn.execute("""
+            DELETE FROM conversation_state WHERE user_id IN (
+                SELECT user_id FROM conversation_state
+                ORDER BY updated_at DESC
+                LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+
+    def delete(self, user_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM conversation_state WHERE user_id = ?", (user_id,))
+
+    def pop(self, user_id, default=None):
+        with self._lock:
+            row = self._conn.execute(
+                "DELETE FROM conversation_state WHERE user_id = ? RETURNING data, expires_at > ?",
+                (user_id, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row and row[1] else default
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM conversation_state").fetchone()[0]
+
+
+class PostgresStateStore:
+    """
+    Состояние в таблице conversation_state основной БД: общее для всех процессов бота.
+    Запросы выполняются в режиме autocommit, без отдельных BEGIN и COMMIT, а main.py
+    записывает состояние один раз за сообщение (см. save_state)
+    """
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _cursor():
+        import database
+        with database.get_pool().connection() as conn:
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cur:
+                    yield cur
+            finally:
+                if not conn.closed:
+                    conn.autocommit = False
+
+    def get(self, user_id, default=None):
+        with self._cursor() as cur:
+            cur.execute("""
+                SELECT data FROM conversation_state
+                WHERE user_id = %s AND expires_at > NOW()
+            """, (user_id,))
+            row = cur.fetchone()
+        return row[0] if row else default
+
+    def set(self, user_id, value):
+        with self._cursor() as cur:
+            cur.execute("""
+                INSERT INTO conversation_state (user_id, data, expires_at, updated_at)
+                VALUES (%s, %s::jsonb, NOW() + %s * INTERVAL '1 second', NOW())
+                ON CONFLICT (user_id) DO UPDATE
+                SET data = EXCLUDED.data, expires_at = EXCLUDED.expires_at, updated_at = EXCLUDED.updated_at
+            """, (user_id, json.dumps(value), self.ttl))
+            with self._lock:
+                self._writes += 1
+                cleanup = self._writes % CLEANUP_EVERY == 0
+            if cleanup:
+                cur.execute("DELETE FROM conversation_state WHERE expires_at <= NOW()")
+                cur.execute("""
+                    DELETE FROM conversation_state WHERE user_id IN (
+                        SELECT user_id FROM conversation_state
+                        ORDER BY updated_at DESC
+                        OFFSET %s
+                    )
+                """, (self.max_entries,))
+
+    def delete(self, user_id):
+        with self._cursor() as cur:
+            cur.execute("DELETE FROM conversation_state WHERE user_id = %s", (user_id,))
+
+    def pop(self, user_id, default=None):
+        with self._cursor() as cur:
+            cur.execute("""
+                DELETE FROM conversation_state WHERE user_id = %s
+                RETURNING data, expires_at > NOW()
+            """, (user_id,))
+            row = cur.fetchone()
+        return row[0] if row and row[1] else default
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def __len__(self):
+        with self._cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM conversation_state")
+            return cur.fetchone()[0]
+
+
+def from_config(config):
+    """
+    Создает хранилище по секции [state] config.ini
+    """
+    backend = config.get('state', 'backend', fallback='memory')
+    ttl = config.getfloat('state', 'ttl', fallback=3600)
+    max_entries = config.getint('state', 'max_entries', fallback=100000)
+    if backend == 'memory':
+        return MemoryStateStore(ttl, max_entries)
+    if backend == 'sqlite':
+        return SQLiteStateStore(config.get('state', 'sqlite_path', fallback='state.db'), ttl, max_entries)
+    if backend == 'postgres':
+        return PostgresStateStore(ttl, max_entries)
+    raise ValueError(f"Неизвестное хранилище состояния: {backend}")
@@ -0,0 +1,820 @@
+import bisect
+import contextlib
+import datetime
+import heapq
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import spaced
+import user_stats
+import word_loader
+import word_lookup
+
+# Хранилище слов и прогресса пользователей за одним интерфейсом (секция [storage]):
+# postgres – основная БД (функции database.py), sqlite – локальный файл, memory – память процесса.
+# sqlite и memory не требуют сервера PostgreSQL: на них бот и нагрузочные тесты запускаются
+# без внешних зависимостей и быстро стартуют. Общий словарь в них берется из того же
+# data/initial_words.csv, что и в миграции seed_initial_words.
+
+INITIAL_WORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'initial_words.csv')
+
+# Сколько кандидатов брать при выборе случайного слова (как database.RANDOM_WORD_SAMPLE)
+RANDOM_WORD_SAMPLE = 8
+
+# Сколько последних ответов хранит memory
+ANSWER_HISTORY = 100000
+
+
+def initial_words(path: str = INITIAL_WORDS_PATH):
+    """
+    Строки начального словаря (russian_word, target_word, other_word_1..3)
+    """
+    for _, row in word_loader.iter_rows(path):
+        yield word_loader.validate_row(row)
+
+
+class Storage:
+    """
+    Операции со словами, которые использует бот. selection – режим выбора слова
+    из секции [quiz] (random или spaced, см. spaced.py)
+    """
+
+    OPERATIONS = (
+        "add_user_if_not_exists", "touch_user",
+        "get_next_user_word", "get_random_user_word", "get_word_by_id", "find_user_word_id",
+        "add_custom_word", "remove_user_word", "mark_word_learned",
+        "record_answer", "record_review", "keep_word", "get_target_words", "get_user_vocabulary",
+        "get_user_stats", "reconcile_stats",
+        "create_broadcast", "next_broadcast", "claim_broadcast_page", "save_broadcast_progress",
+    )
+
+    def __init__(self, selection: str = 'random'):
+        self.selection = selection
+        self._listeners = []
+
+    def add_vocabulary_listener(self, listener):
+        """
+        listener(user_id, word_id) после удаления слова, listener(user_id, None) после добавления своего
+        """
+        self._listeners.append(listener)
+
+    def notify_vocabulary_changed(self, user_id, word_id=None):
+        for listener in self._listeners:
+            listener(user_id, word_id)
+
+    def open(self):
+        """
+        Подготовка к работе при запуске бота
+        """
+
+    def close(self):
+        """
+        Запись накопленного и освобождение ресурсов при остановке
+        """
+
+    def get_next_user_word(self, user_id: int):
+        if self.selection != 'spaced':
+            return self.get_random_user_word(user_id)
+        return self._next_spaced_word(user_id)
+
+    def mark_word_learned(self, user_id: int, word_id: int):
+        self._save_learned(user_id, word_id)
+        self.remove_user_word(user_id, word_id)
+
+    def record_review(self, user_id: int, word_id: int, quality: int):
+        if self.selection != 'spaced':
+            return
+        progress = self._load_progress(user_id, word_id) or (0, 0.0, spaced.DEFAULT_EASE)
+        repetitions, interval, ease, delay = spaced.review(*progress, quality)
+        self._save_progress(user_id, word_id, repetitions, interval, ease, time.time() + delay)
+
+
+class PostgresStorage(Storage):
+    """
+    Основная БД: операции выполняют функции database.py
+    """
+
+    def __init__(self, selection: str = 'random'):
+        super().__init__(selection)
+        import database
+        self.database = database
+        for name in self.OPERATIONS:
+            setattr(self, name, getattr(database, name))
+        database.add_vocabulary_listener(self.notify_vocabulary_changed)
+
+    def open(self):
+        self.database.create_database()
+        self.database.start_cache_listener()
+        self.database.writes.start()
+
+    def close(self):
+        self.database.writes.stop()
+        self.database.stop_cache_listener()
+        self.database.close_pool()
+
+
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users(
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    created_at REAL NOT NULL,
+    last_active REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS words(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    russian_word TEXT NOT NULL,
+    target_word TEXT NOT NULL,
+    other_word_1 TEXT NOT NULL,
+    other_word_2 TEXT NOT NULL,
+    other_word_3 TEXT NOT NULL,
+    user_id INTEGER,
+    rand_key REAL NOT NULL,
+    UNIQUE (russian_word, user_id)
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS unique_global_word ON words(russian_word) WHERE user_id IS NULL;
+    CREATE INDEX IF NOT EXISTS idx_words_global_rand_key ON words(rand_key) WHERE user_id IS NULL;
+    CREATE INDEX IF NOT EXISTS idx_words_user_rand_key ON words(user_id, rand_key);
+    CREATE INDEX IF NOT EXISTS idx_words_global_id ON words(id) WHERE user_id IS NULL;
+    CREATE INDEX IF NOT EXISTS idx_words_user_id ON words(user_id, id);
+    CREATE INDEX IF NOT EXISTS idx_words_normalized ON words(user_id, normalize_word(russian_word));
+    CREATE TABLE IF NOT EXISTS deleted_words(
+    user_id INTEGER NOT NULL,
+    words_id INTEGER NOT NULL,
+    deleted_at REAL NOT NULL,
+    PRIMARY KEY (user_id, words_id)
+    );
+    CREATE TABLE IF NOT EXISTS learned_words(
+    user_id INTEGER NOT NULL,
+    words_id INTEGER NOT NULL,
+    learned_at REAL NOT NULL,
+    PRIMARY KEY (user_id, words_id)
+    );
+    CREATE TABLE IF NOT EXISTS answer_events(
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    words_id INTEGER NOT NULL,
+    correct INTEGER NOT NULL,
+    attempt INTEGER NOT NULL,
+    answered_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS word_progress(
+    user_id INTEGER NOT NULL,
+    words_id INTEGER NOT NULL,
+    repetitions INTEGER NOT NULL,
+    interval_days REAL NOT NULL,
+    ease REAL NOT NULL,
+    due_at REAL NOT NULL,
+    PRIMARY KEY (user_id, words_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_word_progress_due ON word_progress(user_id, due_at);
+    CREATE INDEX IF NOT EXISTS idx_answer_events_user_id ON answer_events(user_id, answered_at);
+    CREATE TABLE IF NOT EXISTS user_stats(
+    user_id INTEGER PRIMARY KEY,
+    custom_words INTEGER NOT NULL DEFAULT 0,
+    deleted_words INTEGER NOT NULL DEFAULT 0,
+    learned_words INTEGER NOT NULL DEFAULT 0,
+    answers INTEGER NOT NULL DEFAULT 0,
+    correct_answers INTEGER NOT NULL DEFAULT 0,
+    streak_days INTEGER NOT NULL DEFAULT 0,
+    best_streak INTEGER NOT NULL DEFAULT 0,
+    last_answer_day INTEGER,
+    reconciled_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_user_stats_reconciled ON user_stats(reconciled_at);
+    CREATE INDEX IF NOT EXISTS idx_users_id_last_active ON users(id, last_active);
+    CREATE TABLE IF NOT EXISTS broadcasts(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE,
+    text TEXT NOT NULL,
+    active_after REAL,
+    active_before REAL,
+    last_user_id INTEGER NOT NULL DEFAULT 0,
+    sent INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    finished_at REAL
+    );
+"""
+
+# Те же запросы, что в database.py, в синтаксисе SQLite
+SQLITE_WORD_COLUMNS = "w.id, w.russian_word, w.target_word, w.other_word_1, w.other_word_2, w.other_word_3"
+
+SQLITE_NOT_DELETED = """
+    NOT EXISTS (SELECT 1 FROM deleted_words dw WHERE dw.user_id = :user_id AND dw.words_id = w.id)
+"""
+
+SQLITE_RANDOM_WORD_SQL = f"""
+    SELECT id, russian_word, target_word, other_word_1, other_word_2, other_word_3
+    FROM (
+        SELECT * FROM (
+            SELECT {SQLITE_WORD_COLUMNS}, w.rand_key FROM words w
+            WHERE w.user_id IS NULL AND w.rand_key >= :threshold AND {SQLITE_NOT_DELETED}
+            ORDER BY w.rand_key LIMIT :limit
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT {SQLITE_WORD_COLUMNS}, w.rand_key FROM words w
+            WHERE w.user_id = :user_id AND w.rand_key >= :threshold AND {SQLITE_NOT_DELETED}
+            ORDER BY w.rand_key LIMIT :limit
+        )
+    )
+    ORDER BY rand_key
+    LIMIT :limit
+"""
+
+SQLITE_NEXT_DUE_WORD_SQL = f"""
+    SELECT {SQLITE_WORD_COLUMNS}, p.due_at <= :now
+    FROM word_progress p
+    JOIN words w ON w.id = p.words_id
+    WHERE p.user_id = :user_id
+    ORDER BY p.due_at
+    LIMIT 1
+"""
+
+SQLITE_NEW_WORD_SQL = f"""
+    SELECT id, russian_word, target_word, other_word_1, other_word_2, other_word_3
+    FROM (
+        SELECT * FROM (
+            SELECT {SQLITE_WORD_COLUMNS} FROM words w
+            WHERE w.user_id IS NULL
+            AND w.id > (SELECT COALESCE(MAX(words_id), 0) FROM word_progress WHERE user_id = :user_id)
+            AND {SQLITE_NOT_DELETED}
+            ORDER BY w.id LIMIT 1
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT {SQLITE_WORD_COLUMNS} FROM words w
+            WHERE w.user_id = :user_id
+            AND w.id > (SELECT COALESCE(MAX(words_id), 0) FROM word_progress WHERE user_id = :user_id)
+            AND {SQLITE_NOT_DELETED}
+            ORDER BY w.id LIMIT 1
+        )
+    )
+    ORDER BY id
+    LIMIT 1
+"""
+
+
+class SQLiteStorage(Storage):
+    """
+    Слова и прогресс в локальном файле SQLite (":memory:" – в памяти), схема как у PostgreSQL
+    """
+
+    def __init__(self, path: str = "words.db", selection: str = 'random'):
+        super().__init__(selection)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        # Функция индекса idx_words_normalized, без нее файл не открыть этим же кодом
+        self._conn.create_function("normalize_word", 1, word_lookup.normalize, deterministic=True)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SQLITE_SCHEMA)
+        self._global_words = None  # число общих слов для статистики, обновляется при сверке
+
+    def open(self):
+        with self._lock:
+            with self._transaction():
+                self._conn.executemany("""
+                    INSERT OR IGNORE INTO words (russian_word, target_word, other_word_1, other_word_2, other_word_3,
+                                                 rand_key)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, ((*row, random.random()) for row in initial_words()))
+                # Пользователи из файла, созданного до user_stats: счетчики сверяются сразу
+                missing = self._conn.execute("INSERT OR IGNORE INTO user_stats (user_id) SELECT id FROM users").rowcount
+        self.reconcile_stats(missing)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _fetchone(self, query, params=()):
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()
+
+    def _execute(self, query, params=()):
+        with self._lock:
+            return self._conn.execute(query, params)
+
+    @contextlib.contextmanager
+    def _transaction(self, begin="BEGIN"):
+        """
+        Транзакция, вызывается под self._lock: COMMIT в конце блока, ROLLBACK при ошибке,
+        иначе незавершенная транзакция ломает все следующие записи соединения
+        """
+        self._conn.execute(begin)
+        try:
+            yield
+            self._conn.execute("COMMIT")
+        except BaseException:
+            if self._conn.in_transaction:
+                self._conn.execute("ROLLBACK")
+            raise
+
+    def _count(self, user_id: int, column: str, delta: int = 1):
+        """
+        Увеличивает счетчик user_stats, вызывается под self._lock в транзакции изменения
+        """
+        self._conn.execute(f"""
+            INSERT INTO user_stats (user_id, {column}) VALUES (?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET {column} = {column} + excluded.{column}
+        """, (user_id, delta))
+
+    def add_user_if_not_exists(self, user_id: int, username: str):
+        now = time.time()
+        with self._lock:
+            with self._transaction():
+                self._conn.execute("""
+                    INSERT INTO users (id, name, created_at, last_active) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (id) DO UPDATE SET name = excluded.name, last_active = excluded.last_active
+                """, (user_id, username, now, now))
+                self._conn.execute("INSERT OR IGNORE INTO user_stats (user_id, reconciled_at) VALUES (?, ?)",
+                                   (user_id, now))
+
+    def touch_user(self, user_id: int):
+        self._execute("UPDATE users SET last_active = ? WHERE id = ?", (time.time(), user_id))
+
+    def get_random_user_word(self, user_id: int):
+        params = {"user_id": user_id, "threshold": random.random(), "limit": RANDOM_WORD_SAMPLE}
+        with self._lock:
+            words = self._conn.execute(SQLITE_RANDOM_WORD_SQL, params).fetchall()
+            if len(words) < RANDOM_WORD_SAMPLE:
+                # Дошли до конца индекса, добираем кандидатов с его начала
+                params.update(threshold=0.0, limit=RANDOM_WORD_SAMPLE - len(words))
+                seen = {word[0] for word in words}
+                words += [word for word in self._conn.execute(SQLITE_RANDOM_WORD_SQL, params) if word[0] not in seen]
+        return random.choice(words) if words else None
+
+    def _next_spaced_word(self, user_id: int):
+        params = {"user_id": user_id, "now": time.time()}
+        with self._lock:
+            due = self._conn.execute(SQLITE_NEXT_DUE_WORD_SQL, params).fetchone()
+            word = due[:-1] if due else None
+            if due is None or not due[-1]:
+                word = self._conn.execute(SQLITE_NEW_WORD_SQL, params).fetchone() or word
+        return word
+
+    def get_word_by_id(self, word_id):
+        return self._fetchone("""
+            SELECT id, russian_word, target_word, other_word_1, other_word_2, other_word_3
+            FROM words WHERE id = ?
+        """, (word_id,))
+
+    def get_target_words(self):
+        with self._lock:
+            return self._conn.execute("""
+                SELECT w.target_word, w.user_id, w.id FROM words w
+                WHERE w.user_id IS NULL
+                OR NOT EXISTS (SELECT 1 FROM deleted_words dw WHERE dw.user_id = w.user_id AND dw.words_id = w.id)
+            """).fetchall()
+
+    def find_user_word_id(self, user_id: int, russian_word: str):
+        row = self._fetchone(f"""
+            SELECT w.id FROM words w
+            WHERE (w.user_id IS NULL OR w.user_id = :user_id)
+            AND normalize_word(w.russian_word) = :key
+            AND {SQLITE_NOT_DELETED}
+            ORDER BY w.user_id IS NULL, w.russian_word <> :russian_word, w.id
+            LIMIT 1
+        """, {"user_id": user_id, "russian_word": russian_word, "key": word_lookup.normalize(russian_word)})
+        return row[0] if row else None
+
+    def get_user_vocabulary(self, user_id: int):
+        with self._lock:
+            return self._conn.execute(f"""
+                SELECT w.id, w.russian_word FROM words w
+                WHERE (w.user_id IS NULL OR w.user_id = :user_id) AND {SQLITE_NOT_DELETED}
+            """, {"user_id": user_id}).fetchall()
+
+    def add_custom_word(self, user_id: int, russian: str, target_word: str, wrong1: str, wrong2: str, wrong3: str):
+        with self._lock:
+            with self._transaction():
+                added = self._conn.execute("""
+                    INSERT OR IGNORE INTO words (russian_word, target_word, other_word_1, other_word_2, other_word_3,
+                                                 user_id, rand_key)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (russian, target_word, wrong1, wrong2, wrong3, user_id, random.random())).rowcount
+                if added:
+                    self._count(user_id, "custom_words")
+        if not added:
+            return False
+        self.notify_vocabulary_changed(user_id)
+        return True
+
+    def remove_user_word(self, user_id: int, word_id: int):
+        with self._lock:
+            with self._transaction():
+                if self._conn.execute("""
+                    INSERT OR IGNORE INTO deleted_words (user_id, words_id, deleted_at) VALUES (?, ?, ?)
+                """, (user_id, word_id, time.time())).rowcount:
+                    self._count(user_id, "deleted_words")
+                self._conn.execute("DELETE FROM word_progress WHERE user_id = ? AND words_id = ?", (user_id, word_id))
+        self.notify_vocabulary_changed(user_id, word_id)
+
+    def _save_learned(self, user_id: int, word_id: int):
+        with self._lock:
+            with self._transaction():
+                if self._conn.execute("""
+                    INSERT OR IGNORE INTO learned_words (user_id, words_id, learned_at) VALUES (?, ?, ?)
+                """, (user_id, word_id, time.time())).rowcount:
+                    self._count(user_id, "learned_words")
+
+    def record_answer(self, user_id: int, word_id: int, correct: bool, attempt: int = 1):
+        now = time.time()
+        day = user_stats.day_of(now)
+        with self._lock:
+            with self._transaction():
+                self._conn.execute("""
+                    INSERT INTO answer_events (user_id, words_id, correct, attempt, answered_at) VALUES (?, ?, ?, ?, ?)
+                """, (user_id, word_id, int(correct), attempt, now))
+                row = self._conn.execute("SELECT streak_days, last_answer_day FROM user_stats WHERE user_id = ?",
+                                         (user_id,)).fetchone()
+                self._conn.execute("""
+                    INSERT INTO user_stats (user_id, answers, correct_answers, streak_days, best_streak, last_answer_day)
+                    VALUES (:user_id, 1, :correct, :streak, :streak, :day)
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET answers = answers + 1,
+                        correct_answers = correct_answers + excluded.correct_answers,
+                        streak_days = excluded.streak_days,
+                        best_streak = MAX(best_streak, excluded.streak_days),
+                        last_answer_day = MAX(COALESCE(last_answer_day, 0), excluded.last_answer_day)
+                """, {"user_id": user_id, "correct": int(correct), "day": day,
+                      "streak": user_stats.next_streak(*(row or (0, None)), day)})
+
+    def get_user_stats(self, user_id: int):
+        with self._lock:
+            if self._global_words is None:
+                self._global_words = self._conn.execute("SELECT COUNT(*) FROM words WHERE user_id IS NULL").fetchone()[0]
+            row = self._conn.execute("""
+                SELECT custom_words, deleted_words, learned_words, answers, correct_answers,
+                       CASE WHEN last_answer_day >= ? THEN streak_days ELSE 0 END, best_streak
+                FROM user_stats WHERE user_id = ?
+            """, (user_stats.today() - 1, user_id)).fetchone()
+            return user_stats.summary(self._global_words, row)
+
+    def reconcile_stats(self, limit=None):
+        """
+        Пересчитывает счетчики limit давно не сверенных пользователей (None – всех)
+        """
+        if limit is not None and limit <= 0:
+            return 0
+        with self._lock:
+            self._global_words = self._conn.execute("SELECT COUNT(*) FROM words WHERE user_id IS NULL").fetchone()[0]
+            users = [row[0] for row in self._conn.execute(
+                "SELECT user_id FROM user_stats ORDER BY reconciled_at LIMIT ?", (-1 if limit is None else limit,))]
+            with self._transaction():
+                for user_id in users:
+                    counts = self._conn.execute("""
+                        SELECT (SELECT COUNT(*) FROM words WHERE user_id = :user_id),
+                               (SELECT COUNT(*) FROM deleted_words WHERE user_id = :user_id),
+                               (SELECT COUNT(*) FROM learned_words WHERE user_id = :user_id),
+                               COUNT(*), COALESCE(SUM(correct), 0)
+                        FROM answer_events WHERE user_id = :user_id
+                    """, {"user_id": user_id}).fetchone()
+                    streak, best, last_day = user_stats.streaks(
+                        datetime.date.fromisoformat(day).toordinal() for (day,) in self._conn.execute(
+                            "SELECT DISTINCT date(answered_at, 'unixepoch', 'localtime') FROM answer_events "
+                            "WHERE user_id = ?", (user_id,)))
+                    self._conn.execute("""
+                        UPDATE user_stats
+                        SET custom_words = ?, deleted_words = ?, learned_words = ?, answers = ?, correct_answers = ?,
+                            streak_days = ?, best_streak = ?, last_answer_day = ?, reconciled_at = ?
+                        WHERE user_id = ?
+                    """, (*counts, streak, best, last_day, time.time(), user_id))
+        return len(users)
+
+    def create_broadcast(self, name, text: str, active_after=None, active_before=None):
+        cursor = self._execute("""
+            INSERT OR IGNORE INTO broadcasts (name, text, active_after, active_before, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (name, text, active_after, active_before, time.time()))
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def next_broadcast(self):
+        return self._fetchone("SELECT id, text FROM broadcasts WHERE finished_at IS NULL ORDER BY id LIMIT 1")
+
+    def claim_broadcast_page(self, broadcast_id: int, limit: int):
+        with self._lock:
+            with self._transaction("BEGIN IMMEDIATE"):
+                broadcast = self._conn.execute("""
+                    SELECT last_user_id, active_after, active_before FROM broadcasts
+                    WHERE id = ? AND finished_at IS NULL
+                """, (broadcast_id,)).fetchone()
+                if broadcast is None:
+                    return []
+                users = [row[0] for row in self._conn.execute("""
+                    SELECT id FROM users
+                    WHERE id > :after_id
+                    AND (:active_after IS NULL OR last_active >= :active_after)
+                    AND (:active_before IS NULL OR last_active < :active_before)
+                    ORDER BY id
+                    LIMIT :limit
+                """, dict(zip(("after_id", "active_after", "active_before"), broadcast), limit=limit))]
+                if users:
+                    self._conn.execute("UPDATE broadcasts SET last_user_id = ? WHERE id = ?", (users[-1], broadcast_id))
+                else:
+                    self._conn.execute("UPDATE broadcasts SET finished_at = ? WHERE id = ?", (time.time(), broadcast_id))
+        return users
+
+    def save_broadcast_progress(self, broadcast_id: int, sent: int, failed: int, claimed_until=None, resume_from=None):
+        self._execute("""
+            UPDATE broadcasts
+            SET sent = sent + :sent,
+                failed = failed + :failed,
+                last_user_id = CASE WHEN last_user_id = :claimed_until THEN :resume_from - 1 ELSE last_user_id END
+            WHERE id = :broadcast_id
+        """, {"broadcast_id": broadcast_id, "sent": sent, "failed": failed,
+              "claimed_until": claimed_until, "resume_from": resume_from})
+
+    def _load_progress(self, user_id: int, word_id: int):
+        return self._fetchone("SELECT repetitions, interval_days, ease FROM word_progress WHERE user_id = ? AND words_id = ?",
+                              (user_id, word_id))
+
+    def _save_progress(self, user_id, word_id, repetitions, interval, ease, due_at):
+        self._execute("""
+            INSERT INTO word_progress (user_id, words_id, repetitions, interval_days, ease, due_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, words_id) DO UPDATE
+            SET repetitions = excluded.repetitions, interval_days = excluded.interval_days,
+                ease = excluded.ease, due_at = excluded.due_at
+        """, (user_id, word_id, repetitions, interval, ease, due_at))
+
+    def keep_word(self, user_id: int, word_id: int):
+        if self.selection != 'spaced':
+            return
+        self._execute("UPDATE word_progress SET due_at = MIN(due_at, ?) WHERE user_id = ? AND words_id = ?",
+                      (time.time() + spaced.KEEP_DELAY, user_id, word_id))
+
+
+class _MemoryUser:
+    __slots__ = ("name", "last_active", "words", "deleted", "learned", "progress", "due", "introduced",
+                 "answers", "correct", "streak", "best_streak", "last_day")
+
+    def __init__(self, name):
+        self.name = name
+        self.last_active = time.time()
+        self.words = []  # id своих слов по возрастанию
+        self.deleted = set()
+        self.learned = {}  # word_id -> время
+        self.progress = {}  # word_id -> (repetitions, interval, ease, due_at)
+        self.due = []  # куча (due_at, word_id), устаревшие записи пропускаются
+        self.introduced = 0  # наибольший id слова, по которому есть прогресс
+        # Счетчики статистики: ответы, правильные ответы и серия дней (см. user_stats.py)
+        self.answers = 0
+        self.correct = 0
+        self.streak = 0
+        self.best_streak = 0
+        self.last_day = None
+
+
+class MemoryStorage(Storage):
+    """
+    Все в памяти процесса, без файлов и сервера. Данные теряются при перезапуске
+    """
+
+    def __init__(self, selection: str = 'random'):
+        super().__init__(selection)
+        self._lock = threading.Lock()
+        self._words = {}  # id -> строка слова
+        self._global = []  # id общих слов по возрастанию
+        self._by_text = {}  # (user_id или None, russian_word) -> id
+        self._by_key = {}  # (user_id или None, нормализованное написание) -> id слов по возрастанию
+        self._users = {}
+        self._user_ids = []  # id пользователей по возрастанию, для страниц рассылок
+        self._broadcasts = {}  # id -> рассылка
+        self._broadcast_names = {}  # имя рассылки -> id
+        self._next_id = 1
+        self.answers = deque(maxlen=ANSWER_HISTORY)  # (user_id, word_id, correct, attempt, время)
+
+    def open(self):
+        with self._lock:
+            for row in initial_words():
+                if (None, row[0]) not in self._by_text:
+                    self._insert_word(None, row)
+
+    def _insert_word(self, user_id, row):
+        word_id = self._next_id
+        self._next_id += 1
+        self._words[word_id] = (word_id, *row)
+        self._by_text[(user_id, row[0])] = word_id
+        self._by_key.setdefault((user_id, word_lookup.normalize(row[0])), []).append(word_id)
+        (self._global if user_id is None else self._user(user_id).words).append(word_id)
+        return word_id
+
+    def _user(self, user_id):
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = _MemoryUser(None)
+            bisect.insort(self._user_ids, user_id)
+        return user
+
+    def add_user_if_not_exists(self, user_id: int, username: str):
+        with self._lock:
+            user = self._user(user_id)
+            user.name = username
+            user.last_active = time.time()
+
+    def touch_user(self, user_id: int):
+        with self._lock:
+            self._user(user_id).last_active = time.time()
+
+    def get_random_user_word(self, user_id: int):
+        with self._lock:
+            user = self._user(user_id)
+            total = len(self._global) + len(user.words)
+            if not total:
+                return None
+            # Случайная позиция с повтором, если слово удалено; если удалено почти все – перебор
+            for _ in range(RANDOM_WORD_SAMPLE):
+                index = random.randrange(total)
+                word_id = self._global[index] if index < len(self._global) else user.words[index - len(self._global)]
+                if word_id not in user.deleted:
+                    return self._words[word_id]
+            candidates = [word_id for word_id in self._global + user.words if word_id not in user.deleted]
+            return self._words[random.choice(candidates)] if candidates else None
+
+    def _next_spaced_word(self, user_id: int):
+        with self._lock:
+            user = self._user(user_id)
+            while user.due and user.progress.get(user.due[0][1], (None,) * 4)[3] != user.due[0][0]:
+                heapq.heappop(user.due)
+            due = user.due[0] if user.due else None
+            if due is not None and due[0] <= time.time():
+                return self._words[due[1]]
+            # Новое слово – наименьший id больше уже начатых, среди общих и своих слов
+            new_ids = []
+            for ids in (self._global, user.words):
+                index = bisect.bisect_right(ids, user.introduced)
+                while index < len(ids) and ids[index] in user.deleted:
+                    index += 1
+                if index < len(ids):
+                    new_ids.append(ids[index])
+            if new_ids:
+                return self._words[min(new_ids)]
+            return self._words[due[1]] if due else None
+
+    def get_word_by_id(self, word_id):
+        return self._words.get(word_id)
+
+    def get_target_words(self):
+        with self._lock:
+            return ([(self._words[word_id][2], None, word_id) for word_id in self._global]
+                    + [(self._words[word_id][2], user_id, word_id)
+                       for user_id, user in self._users.items() for word_id in user.words
+                       if word_id not in user.deleted])
+
+    def find_user_word_id(self, user_id: int, russian_word: str):
+        key = word_lookup.normalize(russian_word)
+        with self._lock:
+            deleted = self._user(user_id).deleted
+            for owner in (user_id, None):
+                word_ids = [word_id for word_id in self._by_key.get((owner, key), ()) if word_id not in deleted]
+                if word_ids:
+                    # Точное совпадение написания важнее
+                    return min(word_ids, key=lambda word_id: self._words[word_id][1] != russian_word)
+        return None
+
+    def get_user_vocabulary(self, user_id: int):
+        with self._lock:
+            user = self._user(user_id)
+            return [self._words[word_id][:2] for word_id in self._global + user.words
+                    if word_id not in user.deleted]
+
+    def add_custom_word(self, user_id: int, russian: str, target_word: str, wrong1: str, wrong2: str, wrong3: str):
+        with self._lock:
+            if (user_id, russian) in self._by_text:
+                return False
+            self._insert_word(user_id, (russian, target_word, wrong1, wrong2, wrong3))
+        self.notify_vocabulary_changed(user_id)
+        return True
+
+    def remove_user_word(self, user_id: int, word_id: int):
+        with self._lock:
+            user = self._user(user_id)
+            user.deleted.add(word_id)
+            user.progress.pop(word_id, None)
+        self.notify_vocabulary_changed(user_id, word_id)
+
+    def _save_learned(self, user_id: int, word_id: int):
+        with self._lock:
+            self._user(user_id).learned.setdefault(word_id, time.time())
+
+    def record_answer(self, user_id: int, word_id: int, correct: bool, attempt: int = 1):
+        now = time.time()
+        day = user_stats.day_of(now)
+        with self._lock:
+            self.answers.append((user_id, word_id, correct, attempt, now))
+            user = self._user(user_id)
+            user.answers += 1
+            user.correct += bool(correct)
+            user.streak = user_stats.next_streak(user.streak, user.last_day, day)
+            user.best_streak = max(user.best_streak, user.streak)
+            user.last_day = max(day, user.last_day or day)
+
+    def get_user_stats(self, user_id: int):
+        with self._lock:
+            user = self._user(user_id)
+            streak = user.streak if user.last_day is not None and user.last_day >= user_stats.today() - 1 else 0
+            return user_stats.summary(len(self._global), (
+                len(user.words), len(user.deleted), len(user.learned),
+                user.answers, user.correct, streak, user.best_streak,
+            ))
+
+    def reconcile_stats(self, limit=None):
+        """
+        Счетчики в памяти меняются вместе с данными и расходиться не могут
+        """
+        return 0
+
+    def create_broadcast(self, name, text: str, active_after=None, active_before=None):
+        with self._lock:
+            if name is not None and name in self._broadcast_names:
+                return None
+            broadcast_id = len(self._broadcasts) + 1
+            self._broadcasts[broadcast_id] = {
+                "text": text, "active_after": active_after, "active_before": active_before,
+                "last_user_id": 0, "sent": 0, "failed": 0, "finished": False,
+            }
+            if name is not None:
+                self._broadcast_names[name] = broadcast_id
+            return broadcast_id
+
+    def next_broadcast(self):
+        with self._lock:
+            for broadcast_id, broadcast in self._broadcasts.items():
+                if not broadcast["finished"]:
+                    return broadcast_id, broadcast["text"]
+        return None
+
+    def claim_broadcast_page(self, broadcast_id: int, limit: int):
+        with self._lock:
+            broadcast = self._broadcasts.get(broadcast_id)
+            if broadcast is None or broadcast["finished"]:
+                return []
+            active_after = broadcast["active_after"] if broadcast["active_after"] is not None else float("-inf")
+            active_before = broadcast["active_before"] if broadcast["active_before"] is not None else float("inf")
+            users = []
+            position = bisect.bisect_right(self._user_ids, broadcast["last_user_id"])
+            while len(users) < limit and position < len(self._user_ids):
+                user_id = self._user_ids[position]
+                position += 1
+                if active_after <= self._users[user_id].last_active < active_before:
+                    users.append(user_id)
+            if users:
+                broadcast["last_user_id"] = users[-1]
+            else:
+                broadcast["finished"] = True
+            return users
+
+    def save_broadcast_progress(self, broadcast_id: int, sent: int, failed: int, claimed_until=None, resume_from=None):
+        with self._lock:
+            broadcast = self._broadcasts[broadcast_id]
+            broadcast["sent"] += sent
+            broadcast["failed"] += failed
+            if claimed_until is not None and broadcast["last_user_id"] == claimed_until:
+                broadcast["last_user_id"] = resume_from - 1
+
+    def _load_progress(self, user_id: int, word_id: int):
+        with self._lock:
+            progress = self._user(user_id).progress.get(word_id)
+        return progress[:3] if progress else None
+
+    def _save_progress(self, user_id, word_id, repetitions, interval, ease, due_at):
+        with self._lock:
+            user = self._user(user_id)
+            user.progress[word_id] = (repetitions, interval, ease, due_at)
+            user.introduced = max(user.introduced, word_id)
+            heapq.heappush(user.due, (due_at, word_id))
+            if len(user.due) > 2 * len(user.progress) + 16:
+                # Слишком много устаревших записей – перестраиваем кучу
+                user.due = [(progress[3], word_id) for word_id, progress in user.progress.items()]
+                heapq.heapify(user.due)
+
+    def keep_word(self, user_id: int, word_id: int):
+        if self.selection != 'spaced':
+            return
+        with self._lock:
+            progress = self._user(user_id).progress.get(word_id)
+        if progress is None:
+            return
+        repetitions, interval, ease, due_at = progress
+        self._save_progress(user_id, word_id, repetitions, interval, ease, min(due_at, time.time() + spaced.KEEP_DELAY))
+
+
+def from_config(config):
+    """
+    Создает хранилище по секции [storage] config.ini
+    """
+    backend = config.get('storage', 'backend', fallback='postgres')
+    selection = config.get('quiz', 'selection', fallback='random')
+    if backend == 'postgres':
+        return PostgresStorage(selection)
+    if backend == 'sqlite':
+        return SQLiteStorage(config.get('storage', 'sqlite_path', fallback='words.db'), selection)
+    if backend == 'memory':
+        return MemoryStorage(selection)
+    raise ValueError(f"Неизвестное хранилище слов: {backend}")
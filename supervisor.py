@@ -0,0 +1,518 @@
+"""
+Несколько процессов бота: один процесс принимает обновления (polling или webhook)
+и раздает их рабочим процессам по ID пользователя.
+
+Запуск из корня проекта вместо python main.py (секция [supervisor] в config.ini):
+    python supervisor.py
+
+Один токен может опрашивать только один процесс, а состояние бота лежит в глобальных
+переменных main.py, поэтому бот в одном процессе упирается в одно ядро (GIL).
+Supervisor получает обновления сам и не импортирует main.py: его импортирует каждый
+рабочий процесс, и у каждого свои потоки обработчиков, очередь отправки и пул соединений
+с БД. Все обновления одного пользователя попадают в один процесс и обрабатываются там
+по порядку (dispatcher.py), поэтому шаги диалогов, кэши пользователя и ограничение
+частоты по чату работают как в одном процессе.
+
+Процесс пользователя выбирается rendezvous-хешированием: у пары (пользователь, процесс)
+есть вес, пользователь достается живому процессу с наибольшим весом. Если процесс упал,
+обновления из его очереди и непрочитанные из канала раздаются остальным (переходят только
+его пользователи), а процесс перезапускается с растущей паузой. Перешедшие пользователи
+остаются у временного процесса и после перезапуска, пока он не обработает все переданные
+ему обновления: рабочий процесс сообщает, сколько обновлений обработал, когда его диспетчер
+пуст. Иначе новое сообщение пользователя могло бы обогнать в перезапущенном процессе
+предыдущее, которое еще обрабатывается во временном. Состояние диалогов при этом должно
+быть общим для процессов (sqlite или postgres в секции [state]). Пачку, которую упавший
+процесс уже прочитал, но не обработал, восстановить нельзя.
+"""
+import configparser
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import wait
+
+from telebot import apihelper, types
+
+import webhook
+
+RUNNING = "running"
+STOPPING = "stopping"
+DEAD = "dead"
+
+# Процесс, проживший меньше стольких секунд, считается падающим при запуске: пауза удваивается
+STABLE_AFTER = 60
+
+# Как часто рабочий процесс проверяет, обработаны ли полученные обновления, секунд
+ACK_INTERVAL = 0.05
+
+
+def update_user_id(update: dict):
+    """
+    ID пользователя из обновления в виде JSON, как dispatcher.update_user_id
+    """
+    for kind in ("message", "edited_message", "callback_query"):
+        event = update.get(kind)
+        if event and event.get("from"):
+            return event["from"]["id"]
+    return None
+
+
+def shard_key(update: dict):
+    user_id = update_user_id(update)
+    return user_id if user_id is not None else ("update", update.get("update_id"))
+
+
+def weight(key, index: int) -> int:
+    digest = hashlib.blake2b(f"{key}:{index}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def load_factory(path: str):
+    """
+    Функция по строке "модуль:функция"
+    """
+    module, _, name = path.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def idle(bot) -> bool:
+    """
+    Все переданные боту обновления обработаны (у OrderedTeleBot – диспетчер пуст)
+    """
+    dispatcher = getattr(bot, "dispatcher", None)
+    return dispatcher is None or dispatcher.stats()["queue_depth"] == 0
+
+
+def serve(index: int, reader, acks, factory: str, args: tuple):
+    """
+    Рабочий процесс: factory(index, *args) возвращает (бот, функция остановки),
+    пачки обновлений из канала передаются в bot.process_new_updates. Когда все
+    полученные обновления обработаны, в acks отправляется их общее число.
+    None или закрытый канал – остановка после обработки уже полученных обновлений
+    """
+    # Ctrl+C и SIGTERM получает supervisor и сам останавливает рабочие процессы
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    bot, stop = load_factory(factory)(index, *args)
+    received = acked = 0
+    try:
+        while True:
+            # Пока есть неподтвержденные обновления, канал проверяется с таймаутом
+            if reader.poll(ACK_INTERVAL if received != acked else None):
+                try:
+                    batch = reader.recv()
+                except EOFError:
+                    break
+                if batch is None:
+                    break
+                bot.process_new_updates([types.Update.de_json(update) for update in batch])
+                received += len(batch)
+            if received != acked and idle(bot):
+                try:
+                    acks.send(received)
+                except OSError:
+                    pass
+                acked = received
+    finally:
+        stop()
+
+
+class _Worker:
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.reader = None  # копия читающего конца канала: после падения из нее забираются пачки
+        self.acks = None  # канал, в котором процесс сообщает число обработанных обновлений
+        self.feeder = None
+        self.pending = deque()  # обновления, еще не переданные в канал
+        self.sent = 0  # обновлений передано в канал с запуска процесса
+        self.acked = 0  # из них обработано
+        self.state = DEAD
+        self.routable = False
+        self.restarts = 0
+        self.restart_delay = 0.0
+        self.restart_at = None
+        self.started_at = 0.0
+
+    def drained(self) -> bool:
+        """
+        Процесс обработал все, что ему передано
+        """
+        return self.state == RUNNING and not self.pending and self.acked == self.sent
+
+
+class Supervisor:
+    """
+    Рабочие процессы и раздача им обновлений. factory – "модуль:функция", которая
+    в рабочем процессе создает бота (см. main.run_worker), args – ее аргументы после номера процесса.
+    У каждого процесса своя очередь не больше queue_size обновлений, поток-кормилец
+    передает их в канал пачками до batch_size
+    """
+
+    def __init__(self, factory: str, args: tuple = (), workers: int = 2, queue_size: int = 1000,
+                 batch_size: int = 50, restart_delay: float = 1, max_restart_delay: float = 30,
+                 shutdown_timeout: float = 30):
+        self.factory = factory
+        self.args = args
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.shutdown_timeout = shutdown_timeout
+        self.workers = [_Worker(index) for index in range(workers)]
+        self._context = multiprocessing.get_context("spawn")
+        self._cond = threading.Condition()
+        # Пользователи упавшего процесса, которые остаются у временного процесса, пока тот
+        # не обработает их обновления: ключ пользователя -> процесс
+        self._borrowed = {}
+        self._monitor = None
+        self._stopping = False
+
+        self.routed = 0
+        self.rejected = 0
+        self.rerouted = 0
+        self.crashes = 0
+
+    def start(self):
+        with self._cond:
+            for worker in self.workers:
+                self._spawn(worker)
+        self._monitor = threading.Thread(target=self._watch, name="supervisor-monitor", daemon=True)
+        self._monitor.start()
+        return self
+
+    def _spawn(self, worker: _Worker):
+        reader, writer = self._context.Pipe(duplex=False)
+        acks, ack_writer = self._context.Pipe(duplex=False)
+        worker.process = self._context.Process(target=serve,
+                                               args=(worker.index, reader, ack_writer, self.factory, self.args),
+                                               name=f"bot-worker-{worker.index}", daemon=True)
+        worker.process.start()
+        ack_writer.close()
+        worker.reader = reader
+        worker.acks = acks
+        worker.sent = worker.acked = 0
+        worker.state = RUNNING
+        worker.routable = True
+        worker.restart_at = None
+        worker.started_at = time.monotonic()
+        worker.feeder = threading.Thread(target=self._feed, args=(worker, writer),
+                                         name=f"supervisor-feeder-{worker.index}", daemon=True)
+        worker.feeder.start()
+
+    def _target(self, key) -> _Worker:
+        """
+        Процесс для ключа пользователя, вызывается под self._cond. Если процесс с наибольшим
+        весом не принимает обновления, пользователь переходит к другому и остается у него
+        до _release
+        """
+        borrowed = self._borrowed.get(key)
+        if borrowed is not None:
+            if borrowed.routable:
+                return borrowed
+            del self._borrowed[key]
+        candidates = [worker for worker in self.workers if worker.routable] or self.workers
+        worker = max(candidates, key=lambda worker: weight(key, worker.index))
+        if not max(self.workers, key=lambda worker: weight(key, worker.index)).routable and worker.routable:
+            self._borrowed[key] = worker
+        return worker
+
+    def _release(self):
+        """
+        Возвращает пользователей их процессам, если временный процесс обработал все, что
+        ему передано. Вызывается под self._cond
+        """
+        drained = {worker.index for worker in self.workers if worker.drained()}
+        for key, worker in list(self._borrowed.items()):
+            if worker.index in drained and max(self.workers, key=lambda other: weight(key, other.index)).routable:
+                del self._borrowed[key]
+
+    def route(self, update: dict, block: bool = True) -> bool:
+        """
+        Ставит обновление в очередь процесса его пользователя. Если очередь заполнена,
+        ждет места, а с block=False возвращает False
+        """
+        key = shard_key(update)
+        with self._cond:
+            while True:
+                if self._stopping:
+                    raise RuntimeError("Supervisor остановлен")
+                worker = self._target(key)
+                if len(worker.pending) < self.queue_size:
+                    break
+                if not block:
+                    self.rejected += 1
+                    return False
+                self._cond.wait(1)
+            worker.pending.append(update)
+            self.routed += 1
+            self._cond.notify_all()
+        return True
+
+    def route_nowait(self, update: dict) -> bool:
+        return self.route(update, block=False)
+
+    def _feed(self, worker: _Worker, writer):
+        """
+        Передает очередь процесса в канал. При остановке досылает очередь и сигнал None
+        """
+        while True:
+            with self._cond:
+                while not worker.pending and worker.state == RUNNING:
+                    self._cond.wait()
+                if worker.state == DEAD:
+                    break
+                if not worker.pending:
+                    batch = None
+                else:
+                    batch = [worker.pending.popleft() for _ in range(min(self.batch_size, len(worker.pending)))]
+                    worker.sent += len(batch)
+                    self._cond.notify_all()
+            try:
+                writer.send(batch)
+            except OSError:
+                with self._cond:
+                    if batch:
+                        worker.pending.extendleft(reversed(batch))
+                break
+            if batch is None:
+                break
+        writer.close()
+
+    def _watch(self):
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                running = {worker.process.sentinel: worker for worker in self.workers if worker.state == RUNNING}
+                due = [worker for worker in self.workers
+                       if worker.state == DEAD and worker.restart_at is not None
+                       and worker.restart_at <= time.monotonic()]
+                for worker in due:
+                    self._spawn(worker)
+                    worker.restarts += 1
+                    print(f"Рабочий процесс {worker.index} перезапущен")
+                if due:
+                    self._release()
+                acks = {worker.acks: worker for worker in running.values()}
+            for ready in wait(list(running) + list(acks), timeout=0.5):
+                if ready in acks:
+                    self._acknowledge(acks[ready])
+                else:
+                    self._recover(running[ready])
+
+    def _acknowledge(self, worker: _Worker):
+        try:
+            acked = worker.acks.recv()
+        except (EOFError, OSError):
+            # Процесс завершился, его обработает _recover
+            return
+        with self._cond:
+            if worker.state == RUNNING:
+                worker.acked = acked
+                self._release()
+
+    def _recover(self, worker: _Worker):
+        """
+        Раздает обновления упавшего процесса остальным и назначает перезапуск
+        """
+        with self._cond:
+            if worker.state != RUNNING or self._stopping:
+                return
+            worker.state = DEAD
+            worker.routable = False
+            self.crashes += 1
+            self._cond.notify_all()
+        # Кормилец может ждать места в канале: читаем, пока он не увидит DEAD и не закроет канал
+        leftovers = []
+        while True:
+            try:
+                if worker.reader.poll(0.05):
+                    leftovers.extend(worker.reader.recv() or [])
+                elif not worker.feeder.is_alive():
+                    break
+            except (EOFError, OSError):
+                break
+        worker.reader.close()
+        worker.acks.close()
+        exitcode = worker.process.exitcode
+        lived = time.monotonic() - worker.started_at
+        with self._cond:
+            updates = leftovers + list(worker.pending)
+            worker.pending.clear()
+            # Пользователи, которых этот процесс временно обслуживал, выбираются заново
+            for key in [key for key, other in self._borrowed.items() if other is worker]:
+                del self._borrowed[key]
+            moved = 0
+            if any(other.routable for other in self.workers):
+                for update in updates:
+                    self._target(shard_key(update)).pending.append(update)
+                moved = len(updates)
+                self.rerouted += moved
+            else:
+                # Других процессов нет: обновления ждут перезапуска
+                worker.pending.extend(updates)
+            if lived < STABLE_AFTER and worker.restart_delay:
+                worker.restart_delay = min(worker.restart_delay * 2, self.max_restart_delay)
+            else:
+                worker.restart_delay = self.restart_delay
+            worker.restart_at = time.monotonic() + worker.restart_delay
+            self._cond.notify_all()
+        print(f"Рабочий процесс {worker.index} завершился с кодом {exitcode}, передано другим обновлений: "
+              f"{moved}, перезапуск через {worker.restart_delay:.0f} с")
+
+    def stop(self):
+        """
+        Досылает рабочим процессам принятые обновления и ждет, пока они их обработают.
+        Вызывается после остановки приема обновлений
+        """
+        with self._cond:
+            if self._stopping:
+                return
+            self._stopping = True
+            for worker in self.workers:
+                if worker.state == RUNNING:
+                    worker.state = STOPPING
+            self._cond.notify_all()
+        if self._monitor is not None:
+            self._monitor.join()
+        deadline = time.monotonic() + self.shutdown_timeout
+        for worker in self.workers:
+            if worker.feeder is not None:
+                worker.feeder.join(max(deadline - time.monotonic(), 0))
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            worker.process.join(max(deadline - time.monotonic(), 0))
+            if worker.process.is_alive():
+                print(f"Рабочий процесс {worker.index} не остановился за {self.shutdown_timeout} с")
+                worker.process.terminate()
+                worker.process.join(5)
+            worker.reader.close()
+            worker.acks.close()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "workers": len(self.workers),
+                "alive": sum(worker.state == RUNNING for worker in self.workers),
+                "routed": self.routed,
+                "rejected": self.rejected,
+                "rerouted": self.rerouted,
+                "borrowed": len(self._borrowed),
+                "crashes": self.crashes,
+                "queue_depth": [len(worker.pending) for worker in self.workers],
+                "restarts": [worker.restarts for worker in self.workers],
+            }
+
+
+def poll(supervisor: Supervisor, token: str, stopping: threading.Event, timeout: int = 20, limit: int = 100):
+    """
+    Получает обновления через getUpdates и раздает их, пока не установлен stopping
+    """
+    offset = None
+    try:
+        while not stopping.is_set():
+            try:
+                updates = apihelper.get_updates(token, offset, limit, long_polling_timeout=timeout)
+            except Exception as e:
+                print(f"Ошибка при получении обновлений: {e}")
+                stopping.wait(3)
+                continue
+            for update in updates:
+                supervisor.route(update)
+                offset = update["update_id"] + 1
+    except KeyboardInterrupt:
+        pass
+    if offset is not None:
+        # Подтверждаем Telegram последние розданные обновления, иначе после перезапуска придут снова
+        try:
+            apihelper.get_updates(token, offset, 1, long_polling_timeout=1)
+        except Exception as e:
+            print(f"Ошибка при подтверждении обновлений: {e}")
+
+
+class WebhookIngress(webhook.WebhookServer):
+    """
+    Webhook, который не обрабатывает обновления сам, а раздает их рабочим процессам.
+    Если очередь процесса пользователя заполнена, Telegram получает 503 и повторит доставку
+    """
+
+    consume = False
+
+    def __init__(self, supervisor: Supervisor, bot, **kwargs):
+        super().__init__(bot, **kwargs)
+        self.supervisor = supervisor
+
+    def parse(self, body: bytes):
+        update = json.loads(body)
+        if not isinstance(update, dict) or "update_id" not in update:
+            raise ValueError("Не обновление Telegram")
+        return update
+
+    def submit(self, update) -> bool:
+        accepted = self.supervisor.route_nowait(update)
+        with self._lock:
+            if accepted:
+                self._accepted += 1
+            else:
+                self._rejected += 1
+        return accepted
+
+
+if __name__ == "__main__":
+    import telebot
+
+    import metrics
+
+    config = configparser.ConfigParser()
+    config.read('config.ini', encoding='utf-8')
+    token = config['configs']['token']
+    if config.get('bot', 'runtime', fallback='sync') != 'sync':
+        raise SystemExit("Supervisor работает только с runtime = sync в секции [bot]")
+    # Пользователь переходит между процессами, поэтому диалоги и слова должны быть общими
+    if config.get('state', 'backend', fallback='memory') == 'memory':
+        raise SystemExit("Supervisor работает только с backend = sqlite или postgres в секции [state]")
+    if config.get('storage', 'backend', fallback='postgres') == 'memory':
+        raise SystemExit("Supervisor работает только с backend = postgres или sqlite в секции [storage]")
+    workers = config.getint('supervisor', 'workers', fallback=0) or os.cpu_count() or 1
+    supervisor = Supervisor(
+        "main:run_worker", (workers,),
+        workers=workers,
+        queue_size=config.getint('supervisor', 'queue_size', fallback=1000),
+        batch_size=config.getint('supervisor', 'batch_size', fallback=50),
+        restart_delay=config.getfloat('supervisor', 'restart_delay', fallback=1),
+        max_restart_delay=config.getfloat('supervisor', 'max_restart_delay', fallback=30),
+        shutdown_timeout=config.getfloat('supervisor', 'shutdown_timeout', fallback=30),
+    )
+    # Метрики supervisor на порту из [metrics], рабочих процессов – на следующих портах
+    metrics.registry.add_stats('bot_supervisor', supervisor.stats)
+    if config.getboolean('metrics', 'enabled', fallback=True) and config.getint('metrics', 'port', fallback=9108):
+        metrics.MetricsServer(
+            host=config.get('metrics', 'host', fallback='127.0.0.1'),
+            port=config.getint('metrics', 'port', fallback=9108),
+        ).start()
+    supervisor.start()
+    stopping = threading.Event()
+    try:
+        if config.get('bot', 'updates', fallback='polling') == 'webhook':
+            server = WebhookIngress(
+                supervisor,
+                telebot.TeleBot(token),
+                host=config.get('webhook', 'host', fallback='127.0.0.1'),
+                port=config.getint('webhook', 'port', fallback=8443),
+                path=config.get('webhook', 'path', fallback='/webhook'),
+                secret_token=config.get('webhook', 'secret_token', fallback=''),
+            )
+            signal.signal(signal.SIGTERM, lambda signum, frame: server.shutdown())
+            server.serve_forever(url=config.get('webhook', 'url', fallback=''))
+        else:
+            signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+            poll(supervisor, token, stopping)
+    finally:
+        supervisor.stop()
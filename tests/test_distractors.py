@@ -0,0 +1,64 @@
+"""
+Индекс неправильных вариантов distractors.py: удаленные и загруженные позже слова.
+
+Запуск из корня проекта (сеть и БД не нужны):
+    python -m unittest discover -s tests -t .
+"""
+import random
+import time
+import unittest
+
+import distractors
+
+USER_ID = 1
+
+
+class DistractorIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.rows = [("Cat", None, 1), ("Cot", None, 2), ("Cut", None, 3), ("Coat", None, 4)]
+        self.index = distractors.DistractorIndex(lambda: list(self.rows))
+
+    def pick(self, user_id=USER_ID):
+        return set(self.index.pick("Cap", user_id, count=10, rng=random.Random(1)))
+
+    def test_deleted_word_is_hidden_for_its_user(self):
+        self.assertEqual(self.pick(), {"Cat", "Cot", "Cut", "Coat"})
+        self.index.invalidate(USER_ID, 2)
+        # Добавление своего слова (word_id None) ничего не скрывает
+        self.index.invalidate(USER_ID)
+        self.assertEqual(self.pick(), {"Cat", "Cut", "Coat"})
+        self.assertEqual(self.pick(USER_ID + 1), {"Cat", "Cot", "Cut", "Coat"})
+
+    def test_reload_picks_up_loaded_words(self):
+        self.index.max_age = 0.01
+        self.assertNotIn("Cab", self.pick())
+        self.rows.append(("Cab", None, 5))
+        time.sleep(0.02)
+        # Перечитывание идет в фоне, пока выбор идет по старому индексу
+        self.pick()
+        for _ in range(100):
+            if self.index.stats()["reloads"]:
+                break
+            time.sleep(0.01)
+        self.assertIn("Cab", self.pick())
+
+    def test_word_added_during_reload_is_kept(self):
+        def load():
+            rows = list(self.rows)
+            if len(self.index):
+                # Свое слово добавлено после того, как словарь прочитан
+                self.index.add("Cup", USER_ID)
+            return rows
+
+        self.index = distractors.DistractorIndex(load, max_age=0.01)
+        self.index.load()
+        time.sleep(0.02)
+        self.pick()
+        for _ in range(100):
+            if self.index.stats()["reloads"]:
+                break
+            time.sleep(0.01)
+        self.assertIn("Cup", self.pick())
+
+if __name__ == "__main__":
+    unittest.main()
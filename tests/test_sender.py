@@ -0,0 +1,97 @@
+"""
+Очередь отправки sender.py против локального fake Bot API (tools/fake_bot_api.py).
+
+Запуск из корня проекта (сеть и БД не нужны):
+    python -m unittest discover -s tests -t .
+"""
+import unittest
+
+import telebot
+from telebot import apihelper
+
+import sender
+from tools.fake_bot_api import FakeBotAPI
+
+NO_LIMIT = 1e9
+
+
+class AlwaysLimitedAPI(FakeBotAPI):
+    """
+    Fake API, который на каждое сообщение отвечает 429 с retry_after 1
+    """
+
+    def _limit(self, chat_id):
+        with self._lock:
+            self.rejected += 1
+        return 0.1
+
+
+class OutboundSenderTest(unittest.TestCase):
+    def start_api(self, api):
+        self.api = api.start()
+        self.addCleanup(self.api.stop)
+        api_url = apihelper.API_URL
+        apihelper.API_URL = self.api.api_url
+        self.addCleanup(setattr, apihelper, "API_URL", api_url)
+        return self.api
+
+    def start_outbox(self, **kwargs):
+        outbox = sender.OutboundSender(telebot.TeleBot("1:test"), **kwargs)
+        self.addCleanup(outbox.stop)
+        return outbox
+
+    def texts(self, chat_id):
+        return [text for chat, text, _ in self.api.messages if chat == chat_id]
+
+    def test_chat_order_under_burst(self):
+        self.start_api(FakeBotAPI(chat_rate=0, global_rate=0))
+        outbox = self.start_outbox(workers=8, global_rate=NO_LIMIT, chat_rate=NO_LIMIT, chat_burst=NO_LIMIT)
+        futures = [outbox.send_message(chat_id, f"{chat_id}:{number}")
+                   for number in range(30) for chat_id in (1, 2, 3)]
+        for future in futures:
+            future.result(timeout=10)
+        for chat_id in (1, 2, 3):
+            self.assertEqual(self.texts(chat_id), [f"{chat_id}:{number}" for number in range(30)])
+
+    def test_retry_after_429(self):
+        api = self.start_api(FakeBotAPI(chat_rate=1, chat_burst=1, global_rate=0))
+        # Ограничение чата в очереди снято, поэтому Telegram отвечает 429
+        outbox = self.start_outbox(workers=2, global_rate=NO_LIMIT, chat_rate=NO_LIMIT, chat_burst=NO_LIMIT,
+                                   max_retries=5)
+        futures = [outbox.send_message(7, f"message {number}") for number in range(3)]
+        for future in futures:
+            self.assertEqual(future.result(timeout=15).chat.id, 7)
+        self.assertEqual(self.texts(7), ["message 0", "message 1", "message 2"])
+        self.assertGreater(api.rejected, 0)
+        self.assertGreater(outbox.stats()["retried_429"], 0)
+        self.assertEqual(outbox.stats()["failed"], 0)
+
+    def test_interactive_overtakes_bulk(self):
+        self.start_api(FakeBotAPI(chat_rate=0, global_rate=0))
+        outbox = self.start_outbox(workers=1, global_rate=5, chat_rate=NO_LIMIT, chat_burst=NO_LIMIT)
+        bulk = [outbox.send_message(chat_id, "bulk", priority=sender.PRIORITY_BULK) for chat_id in range(100, 115)]
+        interactive = outbox.send_message(1, "reply")
+        interactive.result(timeout=10)
+        for future in bulk:
+            future.result(timeout=10)
+        chats = [chat for chat, _, _ in self.api.messages]
+        # Бюджет общего ведра (5 сообщений) мог уйти на рассылку до постановки ответа в очередь
+        self.assertLessEqual(chats.index(1), 5)
+        self.assertEqual(len(chats), 16)
+
+    def test_dropped_after_max_retries(self):
+        api = self.start_api(AlwaysLimitedAPI(chat_rate=0, global_rate=0))
+        outbox = self.start_outbox(workers=1, global_rate=NO_LIMIT, chat_rate=NO_LIMIT, chat_burst=NO_LIMIT,
+                                   max_retries=2)
+        future = outbox.send_message(5, "lost")
+        with self.assertRaises(apihelper.ApiTelegramException) as error:
+            future.result(timeout=10)
+        self.assertEqual(error.exception.error_code, 429)
+        self.assertEqual(api.rejected, 3)
+        self.assertEqual(api.messages, [])
+        stats = outbox.stats()
+        self.assertEqual((stats["retried_429"], stats["failed"], stats["queue_depth"]), (2, 1, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+"""
+Одинаковое поведение хранилищ storage.py без сервера PostgreSQL: SQLite в памяти и memory.
+
+Запуск из корня проекта (сеть и БД не нужны):
+    python -m unittest discover -s tests -t .
+"""
+import unittest
+from unittest import mock
+
+import spaced
+import storage
+
+GLOBAL_WORDS = [row[0] for row in storage.initial_words()]
+USER_ID = 1
+
+
+class StorageParity:
+    """
+    Общие проверки, make_storage создает хранилище проверяемого вида
+    """
+
+    def make_storage(self, selection):
+        raise NotImplementedError
+
+    def open_storage(self, selection='random'):
+        store = self.make_storage(selection)
+        store.open()
+        store.add_user_if_not_exists(USER_ID, "user")
+        self.changes = []
+        store.add_vocabulary_listener(lambda user_id, word_id: self.changes.append((user_id, word_id)))
+        return store
+
+    def word_id(self, store, russian_word):
+        word_id = store.find_user_word_id(USER_ID, russian_word)
+        self.assertIsNotNone(word_id, russian_word)
+        return word_id
+
+    def test_random_word_skips_deleted(self):
+        store = self.open_storage()
+        for russian_word in GLOBAL_WORDS[1:]:
+            store.remove_user_word(USER_ID, self.word_id(store, russian_word))
+        self.assertTrue(store.add_custom_word(USER_ID, "Кит", "Whale", "A", "B", "C"))
+
+        seen = {store.get_random_user_word(USER_ID)[1] for _ in range(200)}
+        self.assertEqual(seen, {GLOBAL_WORDS[0], "Кит"})
+
+        store.remove_user_word(USER_ID, self.word_id(store, GLOBAL_WORDS[0]))
+        store.remove_user_word(USER_ID, self.word_id(store, "Кит"))
+        self.assertIsNone(store.get_random_user_word(USER_ID))
+
+    def test_add_and_remove_custom_word(self):
+        store = self.open_storage()
+        self.assertTrue(store.add_custom_word(USER_ID, "Кит", "Whale", "A", "B", "C"))
+        self.assertFalse(store.add_custom_word(USER_ID, "Кит", "Orca", "A", "B", "C"))
+        word_id = self.word_id(store, "Кит")
+        self.assertEqual(tuple(store.get_word_by_id(word_id)), (word_id, "Кит", "Whale", "A", "B", "C"))
+        self.assertIn((word_id, "Кит"), [tuple(row) for row in store.get_user_vocabulary(USER_ID)])
+        self.assertIn(("Whale", USER_ID, word_id), [tuple(row) for row in store.get_target_words()])
+        # Свое слово видно только его автору
+        self.assertIsNone(store.find_user_word_id(USER_ID + 1, "Кит"))
+
+        store.remove_user_word(USER_ID, word_id)
+        self.assertIsNone(store.find_user_word_id(USER_ID, "Кит"))
+        self.assertNotIn(word_id, [row[0] for row in store.get_user_vocabulary(USER_ID)])
+        # Удаленное свое слово больше не подбирается в неправильные варианты
+        self.assertNotIn(("Whale", USER_ID, word_id), [tuple(row) for row in store.get_target_words()])
+        self.assertEqual(self.changes, [(USER_ID, None), (USER_ID, word_id)])
+
+    def test_find_user_word_id(self):
+        store = self.open_storage()
+        word_id = self.word_id(store, GLOBAL_WORDS[0])
+        # Написание сравнивается без регистра и пробелов по краям
+        self.assertEqual(store.find_user_word_id(USER_ID, f"  {GLOBAL_WORDS[0].upper()} "), word_id)
+        self.assertIsNone(store.find_user_word_id(USER_ID, "Нет такого слова"))
+
+        # Свое слово с тем же написанием важнее общего
+        store.add_custom_word(USER_ID, GLOBAL_WORDS[0], "Mine", "A", "B", "C")
+        own_id = self.word_id(store, GLOBAL_WORDS[0])
+        self.assertNotEqual(own_id, word_id)
+        self.assertEqual(store.find_user_word_id(USER_ID + 1, GLOBAL_WORDS[0]), word_id)
+
+        # Удаленное слово больше не находится, но у других пользователей остается
+        store.remove_user_word(USER_ID, own_id)
+        store.remove_user_word(USER_ID, word_id)
+        self.assertIsNone(store.find_user_word_id(USER_ID, GLOBAL_WORDS[0]))
+        self.assertEqual(store.find_user_word_id(USER_ID + 1, GLOBAL_WORDS[0]), word_id)
+
+    def test_spaced_next_word(self):
+        store = self.open_storage('spaced')
+        first = store.get_next_user_word(USER_ID)
+        self.assertEqual(first[1], GLOBAL_WORDS[0])
+
+        # Верный ответ откладывает слово на день, следующим идет новое слово
+        store.record_review(USER_ID, first[0], spaced.QUALITY_FIRST_TRY)
+        second = store.get_next_user_word(USER_ID)
+        self.assertEqual(second[1], GLOBAL_WORDS[1])
+
+        # Удаленное слово не становится новым
+        store.remove_user_word(USER_ID, self.word_id(store, GLOBAL_WORDS[2]))
+        store.record_review(USER_ID, second[0], spaced.QUALITY_FIRST_TRY)
+        self.assertEqual(store.get_next_user_word(USER_ID)[1], GLOBAL_WORDS[3])
+
+        # Слово, которое пора повторить, важнее нового
+        with mock.patch.object(spaced, "RELEARN_DELAY", 0):
+            store.record_review(USER_ID, second[0], spaced.QUALITY_WRONG)
+        self.assertEqual(store.get_next_user_word(USER_ID)[0], second[0])
+
+    def test_stats_counters(self):
+        store = self.open_storage()
+        self.assertTrue(store.add_custom_word(USER_ID, "Кит", "Whale", "A", "B", "C"))
+        learned_id = self.word_id(store, GLOBAL_WORDS[0])
+        deleted_id = self.word_id(store, GLOBAL_WORDS[1])
+        store.record_answer(USER_ID, learned_id, True, 1)
+        store.record_answer(USER_ID, deleted_id, False, 1)
+        store.mark_word_learned(USER_ID, learned_id)
+        store.remove_user_word(USER_ID, deleted_id)
+        # Повторное удаление не считается второй раз
+        store.remove_user_word(USER_ID, deleted_id)
+
+        expected = {
+            "in_study": len(GLOBAL_WORDS) + 1 - 2,
+            "learned": 1,
+            "deleted": 1,
+            "answers": 2,
+            "accuracy": 0.5,
+            "streak": 1,
+            "best_streak": 1,
+        }
+        self.assertEqual(store.get_user_stats(USER_ID), expected)
+        # Сверка с таблицами счетчики не меняет
+        store.reconcile_stats()
+        self.assertEqual(store.get_user_stats(USER_ID), expected)
+
+        self.assertEqual(store.get_user_stats(USER_ID + 1)["in_study"], len(GLOBAL_WORDS))
+
+
+class SQLiteStorageTest(StorageParity, unittest.TestCase):
+    def make_storage(self, selection):
+        store = storage.SQLiteStorage(":memory:", selection)
+        self.addCleanup(store.close)
+        return store
+
+
+class MemoryStorageTest(StorageParity, unittest.TestCase):
+    def make_storage(self, selection):
+        return storage.MemoryStorage(selection)
+
+
+if __name__ == "__main__":
+    unittest.main()
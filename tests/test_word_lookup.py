@@ -0,0 +1,56 @@
+"""
+Индекс подсказок word_lookup.py: изменения словаря во время построения индекса.
+
+Запуск из корня проекта (сеть и БД не нужны):
+    python -m unittest discover -s tests -t .
+"""
+import unittest
+
+from word_lookup import WordLookup
+
+USER_ID = 1
+
+
+class WordLookupTest(unittest.TestCase):
+    def setUp(self):
+        self.words = {1: "Кошка", 2: "Кошелек", 3: "Собака"}
+        self.during_load = None
+        self.lookup = WordLookup(self.load)
+
+    def load(self, user_id):
+        words = list(self.words.items())
+        if self.during_load:
+            self.during_load()
+            self.during_load = None
+        return words
+
+    def test_removed_word_is_not_suggested(self):
+        self.assertEqual(self.lookup.suggest(USER_ID, "кош"), ["Кошка", "Кошелек"])
+        del self.words[1]
+        self.lookup.invalidate(USER_ID, 1)
+        self.assertEqual(self.lookup.suggest(USER_ID, "кош"), ["Кошелек"])
+
+    def test_removal_during_build_is_kept(self):
+        def remove():
+            del self.words[1]
+            self.lookup.invalidate(USER_ID, 1)
+
+        # Индекс по словарю, прочитанному до удаления, не сохраняется
+        self.during_load = remove
+        self.lookup.suggest(USER_ID, "кош")
+        self.assertEqual(self.lookup.stats()["users"], 0)
+        self.assertEqual(self.lookup.suggest(USER_ID, "кош"), ["Кошелек"])
+        self.assertEqual(self.lookup.stats(), {"users": 1, "hits": 0, "misses": 2})
+
+    def test_added_word_during_build(self):
+        def add():
+            self.words[4] = "Кошма"
+            self.lookup.invalidate(USER_ID)
+
+        self.during_load = add
+        self.lookup.suggest(USER_ID, "кош")
+        self.assertIn("Кошма", self.lookup.suggest(USER_ID, "кош"))
+
+
+if __name__ == "__main__":
+    unittest.main()
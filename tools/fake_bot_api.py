@@ -0,0 +1,204 @@
+"""
+Локальная замена Telegram Bot API для проверки бота без сети.
+
+Поддерживает getMe, sendMessage, editMessageText, answerCallbackQuery, getUpdates (обновления
+добавляются через push_update), deleteWebhook и ограничивает частоту sendMessage
+и editMessageText так же, как Telegram: по чату и в целом, отвечая 429 с retry_after. Все принятые сообщения сохраняются в messages, а если передан
+on_message, он вызывается для каждого принятого сообщения с (chat_id, параметры, время приема).
+
+Запуск отдельным процессом:
+    python -m tools.fake_bot_api --port 8081
+и в боте: apihelper.API_URL = "http://127.0.0.1:8081/bot{0}/{1}"
+"""
+import argparse
+import itertools
+import json
+import math
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from sender import TokenBucket
+
+
+class FakeBotAPI:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, chat_rate: float = 1, chat_burst: float = 3,
+                 global_rate: float = 30, latency: float = 0.0, on_message=None, keep_messages: bool = True):
+        self.host = host
+        self.port = port
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.global_rate = global_rate
+        self.latency = latency
+        self.on_message = on_message
+        self.keep_messages = keep_messages
+
+        self._lock = threading.Lock()
+        self._updates_ready = threading.Condition(self._lock)
+        self._global_bucket = TokenBucket(global_rate, global_rate) if global_rate else None
+        self._chat_buckets = {}
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._updates = deque()
+        self._httpd = None
+
+        self.messages = []  # (chat_id, text, время приема)
+        self.requests = 0
+        self.rejected = 0
+
+    @property
+    def api_url(self) -> str:
+        """
+        Шаблон для telebot.apihelper.API_URL
+        """
+        return f"http://{self.host}:{self.port}/bot{{0}}/{{1}}"
+
+    def _limit(self, chat_id):
+        """
+        0, если сообщение можно принять, иначе через сколько секунд повторить
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is None and self.chat_rate:
+                bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            delays = [b.delay(now) for b in (bucket, self._global_bucket) if b is not None]
+            if any(delays):
+                self.rejected += 1
+                return max(delays)
+            for b in (bucket, self._global_bucket):
+                if b is not None:
+                    b.consume()
+            return 0
+
+    def push_update(self, update: dict):
+        """
+        Добавляет обновление для getUpdates, update_id проставляется автоматически
+        """
+        with self._updates_ready:
+            update = dict(update, update_id=next(self._update_ids))
+            self._updates.append(update)
+            self._updates_ready.notify_all()
+            return update["update_id"]
+
+    def _get_updates(self, params):
+        offset = int(params.get("offset", 0) or 0)
+        limit = int(params.get("limit", 100) or 100)
+        deadline = time.monotonic() + float(params.get("timeout", 0) or 0)
+        with self._updates_ready:
+            while self._updates and self._updates[0]["update_id"] < offset:
+                self._updates.popleft()
+            while not self._updates and time.monotonic() < deadline:
+                self._updates_ready.wait(deadline - time.monotonic())
+            return list(itertools.islice(self._updates, limit))
+
+    def handle(self, method: str, params: dict):
+        """
+        Выполняет метод API, возвращает (HTTP-код, ответ)
+        """
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if method == "getMe":
+            return 200, {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "fake", "username": "fake_bot"}}
+        if method in ("deleteWebhook", "setWebhook"):
+            return 200, {"ok": True, "result": True}
+        if method == "getUpdates":
+            return 200, {"ok": True, "result": self._get_updates(params)}
+        if method == "answerCallbackQuery":
+            return 200, {"ok": True, "result": True}
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = int(params["chat_id"])
+            retry_after = self._limit(chat_id)
+            if retry_after:
+                retry_after = math.ceil(retry_after)
+                return 429, {"ok": False, "error_code": 429,
+                             "description": f"Too Many Requests: retry after {retry_after}",
+                             "parameters": {"retry_after": retry_after}}
+            received_at = time.monotonic()
+            with self._lock:
+                message_id = int(params["message_id"]) if method == "editMessageText" else next(self._message_ids)
+                if self.keep_messages:
+                    self.messages.append((chat_id, params.get("text", ""), received_at))
+            if self.on_message is not None:
+                self.on_message(chat_id, params, received_at)
+            return 200, {"ok": True, "result": {
+                "message_id": message_id, "date": int(time.time()), "text": params.get("text", ""),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "fake"},
+            }}
+        return 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Заголовки и тело ответа пишутся отдельно, без TCP_NODELAY каждый ответ ждет ~40 мс
+            disable_nagle_algorithm = True
+
+            def _serve(self):
+                url = urlsplit(self.path)
+                params = dict(parse_qsl(url.query))
+                length = int(self.headers.get("Content-Length", 0))
+                if length:
+                    body = self.rfile.read(length).decode("utf-8")
+                    if self.headers.get("Content-Type", "").startswith("application/json"):
+                        params.update(json.loads(body))
+                    else:
+                        params.update(parse_qsl(body))
+                code, payload = api.handle(url.path.rsplit("/", 1)[-1], params)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = _serve
+            do_POST = _serve
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name="fake-bot-api", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--chat-rate", type=float, default=1, help="сообщений в секунду в один чат, 0 – без ограничения")
+    parser.add_argument("--chat-burst", type=float, default=3)
+    parser.add_argument("--global-rate", type=float, default=30, help="сообщений в секунду всего, 0 – без ограничения")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, секунд")
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.host, args.port, args.chat_rate, args.chat_burst, args.global_rate, args.latency).start()
+    print(f"Fake Bot API: {api.api_url}")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"Запросов: {api.requests}, сообщений: {len(api.messages)}, 429: {api.rejected}")
+    except KeyboardInterrupt:
+        api.stop()
+
+
+if __name__ == "__main__":
+    main()
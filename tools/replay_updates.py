@@ -0,0 +1,83 @@
+"""
+Отправка записанных обновлений Telegram на локальный webhook, как это делает сам Telegram.
+
+Файл с записью – JSONL, по одному объекту Update на строку (см. tools/sample_updates.jsonl).
+Запуск из корня проекта, когда бот запущен с updates = webhook:
+    python -m tools.replay_updates tools/sample_updates.jsonl --url http://127.0.0.1:8443/webhook
+
+Ответ 503 (очередь бота заполнена) повторяется после паузы из Retry-After.
+"""
+import argparse
+import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def load_updates(path: str, repeat: int = 1):
+    with open(path, encoding="utf-8") as file:
+        updates = [json.loads(line) for line in file if line.strip()]
+    # При повторах сдвигаем update_id и пользователей, чтобы получить независимые диалоги
+    for round_number in range(repeat):
+        for update in updates:
+            update = json.loads(json.dumps(update))
+            update["update_id"] += round_number * 1_000_000
+            message = update.get("message")
+            if message and round_number:
+                message["from"]["id"] += round_number * 1_000_000
+                message["chat"]["id"] += round_number * 1_000_000
+            yield update
+
+
+def post_update(session, url: str, update: dict, secret: str, statuses: Counter, lock):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    while True:
+        response = session.post(url, json=update, headers=headers, timeout=10)
+        with lock:
+            statuses[response.status_code] += 1
+        if response.status_code != 503:
+            return
+        time.sleep(float(response.headers.get("Retry-After", 1)))
+
+
+def replay(url: str, updates, secret: str = "", concurrency: int = 1):
+    """
+    Отправляет обновления и возвращает счетчик кодов ответа и время отправки.
+    При concurrency = 1 обновления приходят строго по порядку
+    """
+    statuses = Counter()
+    lock = threading.Lock()
+    local = threading.local()
+
+    def send(update):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        post_update(local.session, url, update, secret, statuses, lock)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, updates))
+    return statuses, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", help="JSONL с обновлениями")
+    parser.add_argument("--url", default="http://127.0.0.1:8443/webhook")
+    parser.add_argument("--secret", default="", help="значение secret_token из config.ini")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=1, help="сколько раз повторить запись с новыми пользователями")
+    args = parser.parse_args()
+
+    statuses, elapsed = replay(args.url, load_updates(args.file, args.repeat), args.secret, args.concurrency)
+    total = sum(statuses.values())
+    print(f"Отправлено запросов: {total} за {elapsed:.2f} с ({total / elapsed:.0f} в секунду)")
+    for code, count in sorted(statuses.items()):
+        print(f"  HTTP {code}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import datetime
+import threading
+import time
+
+# Статистика пользователя для /stats: слова в изучении, выученные и удаленные, точность
+# ответов и серия дней подряд с ответами.
+# Считать ее по запросу – COUNT(*) по deleted_words, learned_words, answer_events и словам
+# пользователя, то есть тем дольше, чем больше словарь и история. Поэтому счетчики лежат
+# в одной строке user_stats и меняются в тех же транзакциях, что и записи, которые они
+# считают: добавление своего слова, запись удалений, выученных слов и ответов (в PostgreSQL
+# это пачки write_behind.py). Запрос статистики читает одну строку по первичному ключу.
+# Если счетчики разошлись с таблицами (сбой между процессами, удаление слов из словаря,
+# ручные правки БД), их исправляет StatsReconciler: в фоне пересчитывает счетчики
+# нескольких давно не сверенных пользователей за раз.
+
+# Сверка в PostgreSQL: строки user_stats пользователей, которых давно не сверяли, блокируются
+# (занятые другим процессом или пачкой write_behind пропускаются), и счетчики пересчитываются
+# тем же запросом. Пачка, которая записала строки после начала запроса, ждет блокировку
+# и прибавляет свои записи уже к пересчитанным значениям, поэтому они не теряются.
+# LIMIT NULL – сверка всех пользователей (миграция, manage.py reconcile-stats).
+RECONCILE_SQL = """
+    WITH targets AS (
+        SELECT user_id FROM user_stats
+        ORDER BY reconciled_at NULLS FIRST
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    ),
+    custom AS (
+        SELECT w.user_id, COUNT(*) AS n
+        FROM words w JOIN targets t ON t.user_id = w.user_id
+        GROUP BY w.user_id
+    ),
+    deleted AS (
+        SELECT dw.user_id, COUNT(*) AS n
+        FROM deleted_words dw JOIN targets t ON t.user_id = dw.user_id
+        GROUP BY dw.user_id
+    ),
+    learned AS (
+        SELECT lw.user_id, COUNT(*) AS n
+        FROM learned_words lw JOIN targets t ON t.user_id = lw.user_id
+        GROUP BY lw.user_id
+    ),
+    answers AS (
+        SELECT a.user_id, COUNT(*) AS n, COUNT(*) FILTER (WHERE a.correct) AS correct
+        FROM answer_events a JOIN targets t ON t.user_id = a.user_id
+        GROUP BY a.user_id
+    ),
+    runs AS (
+        -- У дней одной серии разность даты и номера дня по порядку одинакова
+        SELECT user_id, COUNT(*) AS length, MAX(day) AS last_day
+        FROM (
+            SELECT user_id, day, day - (ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY day))::integer AS series
+            FROM (
+                SELECT DISTINCT a.user_id, a.answered_at::date AS day
+                FROM answer_events a JOIN targets t ON t.user_id = a.user_id
+            ) days
+        ) numbered
+        GROUP BY user_id, series
+    ),
+    streaks AS (
+        SELECT user_id, MAX(length) AS best, (ARRAY_AGG(length ORDER BY last_day DESC))[1] AS current,
+               MAX(last_day) AS last_day
+        FROM runs
+        GROUP BY user_id
+    )
+    UPDATE user_stats s
+    SET custom_words = COALESCE(c.n, 0),
+        deleted_words = COALESCE(d.n, 0),
+        learned_words = COALESCE(l.n, 0),
+        answers = COALESCE(a.n, 0),
+        correct_answers = COALESCE(a.correct, 0),
+        streak_days = COALESCE(r.current, 0),
+        best_streak = COALESCE(r.best, 0),
+        last_answer_date = r.last_day,
+        reconciled_at = NOW()
+    FROM targets t
+    LEFT JOIN custom c ON c.user_id = t.user_id
+    LEFT JOIN deleted d ON d.user_id = t.user_id
+    LEFT JOIN learned l ON l.user_id = t.user_id
+    LEFT JOIN answers a ON a.user_id = t.user_id
+    LEFT JOIN streaks r ON r.user_id = t.user_id
+    WHERE s.user_id = t.user_id
+"""
+
+
+def today() -> int:
+    """
+    Номер сегодняшнего дня (date.toordinal) для серий в SQLite и памяти
+    """
+    return datetime.date.today().toordinal()
+
+
+def day_of(timestamp: float) -> int:
+    return datetime.date.fromtimestamp(timestamp).toordinal()
+
+
+def next_streak(streak: int, last_day, day: int) -> int:
+    """
+    Серия после ответа в день day, если последний ответ был в last_day
+    """
+    if last_day is not None and last_day >= day:
+        return streak
+    if last_day == day - 1:
+        return streak + 1
+    return 1
+
+
+def streaks(days) -> tuple:
+    """
+    (текущая серия, лучшая серия, последний день) по номерам дней с ответами
+    """
+    current = best = 0
+    last_day = None
+    for day in sorted(set(days)):
+        current = current + 1 if last_day == day - 1 else 1
+        best = max(best, current)
+        last_day = day
+    return current, best, last_day
+
+
+def summary(global_words: int, row=None) -> dict:
+    """
+    Статистика для /stats из счетчиков row: (своих слов, удаленных, выученных, ответов,
+    правильных ответов, текущая серия, лучшая серия). Удаленные включают выученные.
+    В PostgreSQL счетчики меняет пачка write_behind, поэтому /stats может отставать
+    от действий пользователя на один интервал записи (flush_interval)
+    """
+    custom, deleted, learned, answers, correct, streak, best = row or (0,) * 7
+    return {
+        "in_study": max(global_words + custom - deleted, 0),
+        "learned": learned,
+        "deleted": max(deleted - learned, 0),
+        "answers": answers,
+        "accuracy": correct / answers if answers else None,
+        "streak": streak,
+        "best_streak": best,
+    }
+
+
+class StatsReconciler:
+    """
+    Поток сверки счетчиков: раз в interval секунд вызывает reconcile(batch_size),
+    который пересчитывает счетчики batch_size давно не сверенных пользователей
+    и возвращает их число. interval = 0 – без сверки
+    """
+
+    def __init__(self, reconcile, interval: float = 60, batch_size: int = 200):
+        self.reconcile = reconcile
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stopping = threading.Event()
+        self._thread = None
+
+        self.runs = 0
+        self.users = 0
+        self.errors = 0
+        self.last_duration = 0.0
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="stats-reconciler", daemon=True)
+        self._thread.start()
+
+    def run_once(self) -> int:
+        started = time.monotonic()
+        try:
+            users = self.reconcile(self.batch_size)
+        except Exception as e:
+            self.errors += 1
+            print(f"Ошибка при сверке статистики: {e}")
+            return 0
+        self.runs += 1
+        self.users += users
+        self.last_duration = time.monotonic() - started
+        return users
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self.run_once()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {"runs": self.runs, "users": self.users, "errors": self.errors,
+                "last_duration_seconds": self.last_duration}
@@ -0,0 +1,194 @@
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import types
+
+
+class WebhookServer:
+    """
+    Прием обновлений Telegram через webhook.
+
+    Встроенный HTTP-сервер принимает POST с обновлением, кладет его в ограниченную
+    очередь и сразу отвечает 200. Один поток забирает очередь пачками и передает их
+    в bot.process_new_updates по порядку поступления: параллельно обработчики разных
+    пользователей выполняет OrderedTeleBot (см. dispatcher.py), а несколько потоков
+    здесь могли бы передать ему обновления одного пользователя не по порядку.
+    Если очередь заполнена, сервер отвечает 503 с заголовком Retry-After, и Telegram
+    повторит доставку позже.
+    """
+
+    # False – обновления не ставятся в очередь (см. supervisor.WebhookIngress), поток не нужен
+    consume = True
+
+    def __init__(self, bot, host: str = "127.0.0.1", port: int = 8443, path: str = "/webhook",
+                 secret_token: str = "", queue_size: int = 1000,
+                 batch_size: int = 20, batch_wait: float = 0.01):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+
+        self.updates = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._httpd = None
+        self._stopping = threading.Event()
+
+        self._lock = threading.Lock()
+        self._accepted = 0
+        self._rejected = 0
+        self._processed = 0
+        self._batches = 0
+        self._errors = 0
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != server.path:
+                    self._reply(404)
+                    return
+                if server.secret_token and \
+                        self.headers.get("X-Telegram-Bot-Api-Secret-Token") != server.secret_token:
+                    self._reply(403)
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    update = server.parse(self.rfile.read(length))
+                except (ValueError, KeyError, TypeError):
+                    self._reply(400)
+                    return
+                if server.submit(update):
+                    self._reply(200)
+                else:
+                    self._reply(503, {"Retry-After": "1"})
+
+            def _reply(self, code, headers=None):
+                self.send_response(code)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def parse(self, body: bytes):
+        """
+        Обновление из тела запроса
+        """
+        return types.Update.de_json(json.loads(body))
+
+    def submit(self, update) -> bool:
+        """
+        Ставит обновление в очередь, False если очередь заполнена
+        """
+        try:
+            self.updates.put_nowait(update)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            return False
+        with self._lock:
+            self._accepted += 1
+        return True
+
+    def _next_batch(self):
+        """
+        Ждет первое обновление и добирает к нему пачку, не дольше batch_wait секунд
+        """
+        first = self.updates.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                update = self.updates.get(timeout=timeout) if timeout > 0 else self.updates.get_nowait()
+            except queue.Empty:
+                break
+            if update is None:
+                # Сигнал остановки возвращаем в очередь, его получит следующий вызов
+                self.updates.put(None)
+                break
+            batch.append(update)
+        return batch
+
+    def _consume(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # OrderedTeleBot сам раздает пачку по очередям пользователей (см. dispatcher.py)
+            try:
+                self.bot.process_new_updates(batch)
+            except Exception as e:
+                with self._lock:
+                    self._errors += 1
+                print(f"Ошибка при обработке обновлений: {e}")
+            with self._lock:
+                self._processed += len(batch)
+                self._batches += 1
+
+    def start(self):
+        if self.consume:
+            self.bot.threaded = False
+            self._thread = threading.Thread(target=self._consume, name="webhook-consumer", daemon=True)
+            self._thread.start()
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._httpd.daemon_threads = True
+        # Порт 0 означает свободный порт, берем фактический
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name="webhook-http", daemon=True).start()
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Перестает принимать обновления и дожидается обработки уже принятых
+        """
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+        if self._thread is not None:
+            self.updates.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self.updates.qsize(),
+                "queue_size": self.updates.maxsize,
+                "accepted": self._accepted,
+                "rejected": self._rejected,
+                "processed": self._processed,
+                "batches": self._batches,
+                "errors": self._errors,
+            }
+
+    def serve_forever(self, url: str = ""):
+        """
+        Запускает сервер, регистрирует webhook в Telegram (если задан url) и ждет Ctrl+C
+        """
+        self.start()
+        if url:
+            self.bot.remove_webhook()
+            self.bot.set_webhook(url=url, secret_token=self.secret_token or None)
+        try:
+            while not self._stopping.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def shutdown(self):
+        self._stopping.set()
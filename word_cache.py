@@ -0,0 +1,189 @@
+import select
+import sys
+import threading
+from collections import OrderedDict
+
+import psycopg2
+
+# Кэш строк таблицы words в памяти процесса: id -> (id, russian_word, target_word,
+# other_word_1, other_word_2, other_word_3). Общие слова почти не меняются, поэтому
+# повторная попытка ответа и повторный вопрос по тому же слову обходятся без запроса к БД.
+# Объем ограничен max_bytes, при переполнении вытесняются давно не использованные слова.
+# Строку, прочитанную из БД до NOTIFY об изменении слова, нельзя класть в кэш после
+# сброса: она устарела. Поэтому читающий берет номер версии кэша до запроса (version),
+# сброс слова запоминает для него новый номер, и put с более ранней версией пропускается.
+
+# Канал NOTIFY, в который триггер на words пишет id измененного или удаленного слова
+NOTIFY_CHANNEL = "words_changed"
+# Накладные расходы OrderedDict на одну запись, в байтах (оценка)
+ENTRY_OVERHEAD = 100
+# Сколько номеров сброшенных слов помнить; при переполнении они забываются, и put
+# пропускает все строки, прочитанные до этого момента, как после clear
+MAX_INVALIDATED = 10000
+
+
+def row_size(row) -> int:
+    """
+    Примерный объем строки слова в памяти
+    """
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) + ENTRY_OVERHEAD
+
+
+class WordCache:
+    """
+    LRU-кэш слов по id с ограничением по памяти и счетчиками попаданий
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._rows = OrderedDict()  # id -> (строка, размер)
+        self._bytes = 0
+        self._version = 0  # растет при каждом сбросе
+        self._invalidated = {}  # id -> версия, на которой слово сброшено
+        self._cleared = 0  # версия последнего сброса всего кэша
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    def version(self) -> int:
+        """
+        Номер версии кэша, берется до чтения строк из БД и передается в put
+        """
+        with self._lock:
+            return self._version
+
+    def _is_stale(self, word_id, version) -> bool:
+        return version < self._cleared or version < self._invalidated.get(word_id, 0)
+
+    def get(self, word_id):
+        with self._lock:
+            item = self._rows.get(word_id)
+            if item is None:
+                self.misses += 1
+                return None
+            self._rows.move_to_end(word_id)
+            self.hits += 1
+            return item[0]
+
+    def put(self, row, version: int):
+        """
+        Кладет строку, прочитанную из БД после version(), если слово с тех пор не сброшено
+        """
+        if row is None or self.max_bytes <= 0:
+            return
+        size = row_size(row)
+        with self._lock:
+            if self._is_stale(row[0], version):
+                self.stale += 1
+                return
+            old = self._rows.pop(row[0], None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._rows[row[0]] = (row, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._rows:
+                _, (_, evicted_size) = self._rows.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def put_many(self, rows, version: int):
+        for row in rows:
+            self.put(row, version)
+
+    def invalidate(self, word_id):
+        with self._lock:
+            self._version += 1
+            if len(self._invalidated) >= MAX_INVALIDATED:
+                self._invalidated.clear()
+                self._cleared = self._version
+            self._invalidated[word_id] = self._version
+            item = self._rows.pop(word_id, None)
+            if item is not None:
+                self._bytes -= item[1]
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._invalidated.clear()
+            self._cleared = self._version
+            self.invalidations += len(self._rows)
+            self._rows.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "entries": len(self._rows),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale": self.stale,
+            }
+
+
+class WordCacheListener:
+    """
+    Поток, который слушает LISTEN words_changed на отдельном соединении и сбрасывает
+    измененные слова из кэша. Так несколько процессов бота видят правки словаря,
+    сделанные любым из них или командой manage.py load-words --update.
+    Если соединение потеряно, уведомления могли пропасть, поэтому кэш очищается целиком.
+    """
+
+    def __init__(self, cache: WordCache, dsn: dict, reconnect_delay: float = 5.0):
+        self.cache = cache
+        self.dsn = dsn
+        self.reconnect_delay = reconnect_delay
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="word-cache-listener", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                conn = psycopg2.connect(**self.dsn)
+            except psycopg2.Error as e:
+                print(f"Кэш слов: не удалось подключиться для LISTEN: {e}")
+                self._stopping.wait(self.reconnect_delay)
+                continue
+            try:
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {NOTIFY_CHANNEL};")
+                # Пока соединения не было, слова могли измениться
+                self.cache.clear()
+                while not self._stopping.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._apply(conn.notifies.pop(0).payload)
+            except psycopg2.Error as e:
+                print(f"Кэш слов: соединение LISTEN потеряно: {e}")
+                self.cache.clear()
+                self._stopping.wait(self.reconnect_delay)
+            finally:
+                conn.close()
+
+    def _apply(self, payload: str):
+        try:
+            self.cache.invalidate(int(payload))
+        except ValueError:
+            self.cache.clear()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,213 @@
+import csv
+import io
+import json
+import os
+
+# Загрузка общего словаря из CSV, JSON или JSONL.
+# Файл читается потоково, строки проверяются и пачками по chunk_size загружаются
+# через COPY во временную таблицу, откуда переносятся в words с ON CONFLICT.
+# Память не зависит от размера файла: в ней держится только текущая пачка.
+
+COLUMNS = ("russian_word", "target_word", "other_word_1", "other_word_2", "other_word_3")
+MAX_WORD_LENGTH = 50  # VARCHAR(50) в таблице words
+JSON_READ_SIZE = 64 * 1024
+
+
+class RowError(ValueError):
+    """
+    Строка словаря не подходит для загрузки
+    """
+
+
+def detect_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension in ("csv", "json", "jsonl"):
+        return extension
+    raise ValueError(f"Не удалось определить формат файла {path}, укажите csv, json или jsonl")
+
+
+def _iter_csv(file, delimiter=","):
+    reader = csv.reader(file, delimiter=delimiter)
+    for row in reader:
+        if reader.line_num == 1 and [cell.strip().lower() for cell in row] == list(COLUMNS):
+            continue  # Заголовок
+        if not row:
+            continue
+        yield reader.line_num, row
+
+
+def _iter_jsonl(file):
+    for number, line in enumerate(file, 1):
+        if line.strip():
+            try:
+                yield number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield number, RowError(f"некорректный JSON: {e.msg}")
+
+
+def _iter_json_array(file):
+    """
+    Потоково читает JSON-массив строк словаря, не загружая весь файл в память
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    eof = False
+    started = False
+    number = 0
+    while True:
+        buffer = buffer.lstrip()
+        if not started:
+            if not buffer and not eof:
+                chunk = file.read(JSON_READ_SIZE)
+                eof = not chunk
+                buffer += chunk
+                continue
+            if not buffer.startswith("["):
+                raise ValueError("JSON-файл должен содержать массив строк словаря")
+            buffer = buffer[1:]
+            started = True
+            continue
+        if buffer.startswith(","):
+            buffer = buffer[1:]
+            continue
+        if buffer.startswith("]"):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError(f"Некорректный JSON после элемента {number}")
+            chunk = file.read(JSON_READ_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        number += 1
+        buffer = buffer[end:]
+        yield number, item
+
+
+def validate_row(row):
+    """
+    Приводит строку к кортежу из пяти непустых слов или бросает RowError
+    """
+    if isinstance(row, RowError):
+        raise row
+    if isinstance(row, dict):
+        missing = [column for column in COLUMNS if column not in row]
+        if missing:
+            raise RowError(f"нет полей: {', '.join(missing)}")
+        row = [row[column] for column in COLUMNS]
+    if not isinstance(row, (list, tuple)):
+        raise RowError("ожидается список из 5 слов или объект с полями " + ", ".join(COLUMNS))
+    if len(row) != len(COLUMNS):
+        raise RowError(f"ожидается 5 значений, получено {len(row)}")
+    words = []
+    for column, value in zip(COLUMNS, row):
+        if not isinstance(value, str):
+            raise RowError(f"{column}: ожидается строка")
+        value = value.strip()
+        if not value:
+            raise RowError(f"{column}: пустое значение")
+        if len(value) > MAX_WORD_LENGTH:
+            raise RowError(f"{column}: длиннее {MAX_WORD_LENGTH} символов")
+        words.append(value)
+    return tuple(words)
+
+
+def iter_rows(path: str, file_format: str = None, delimiter: str = ","):
+    """
+    Выдает (номер строки, строка словаря) из файла. Номер – строка файла для CSV/JSONL
+    и номер элемента массива для JSON
+    """
+    file_format = file_format or detect_format(path)
+    with open(path, encoding="utf-8-sig", newline="") as file:
+        if file_format == "csv":
+            yield from _iter_csv(file, delimiter)
+        elif file_format == "jsonl":
+            yield from _iter_jsonl(file)
+        elif file_format == "json":
+            yield from _iter_json_array(file)
+        else:
+            raise ValueError(f"Неизвестный формат: {file_format}")
+
+
+def _copy_chunk(cur, chunk, update: bool) -> int:
+    """
+    Загружает пачку через COPY во временную таблицу и переносит в words.
+    Возвращает число добавленных (или обновленных) слов
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(chunk)
+    buffer.seek(0)
+    cur.execute("TRUNCATE words_staging;")
+    cur.copy_expert(
+        "COPY words_staging (russian_word, target_word, other_word_1, other_word_2, other_word_3) "
+        "FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+    conflict_action = """DO UPDATE
+        SET target_word = EXCLUDED.target_word,
+            other_word_1 = EXCLUDED.other_word_1,
+            other_word_2 = EXCLUDED.other_word_2,
+            other_word_3 = EXCLUDED.other_word_3""" if update else "DO NOTHING"
+    # Повторы внутри пачки схлопываем до последнего вхождения слова
+    cur.execute(f"""
+        INSERT INTO words (russian_word, target_word, other_word_1, other_word_2, other_word_3)
+        SELECT DISTINCT ON (russian_word)
+               russian_word, target_word, other_word_1, other_word_2, other_word_3
+        FROM words_staging
+        ORDER BY russian_word, line DESC
+        ON CONFLICT (russian_word) WHERE user_id IS NULL {conflict_action};
+    """)
+    return cur.rowcount
+
+
+def load_words(conn, path: str, file_format: str = None, chunk_size: int = 10000,
+               update: bool = False, delimiter: str = ",", on_progress=None, on_reject=None) -> dict:
+    """
+    Загружает общий словарь из файла в таблицу words.
+
+    conn – соединение psycopg2, после каждой пачки выполняется commit.
+    update – обновлять переводы уже существующих слов, иначе они пропускаются.
+    on_progress(stats) вызывается после каждой пачки, on_reject(номер, строка, причина) –
+    для каждой отклоненной строки. Возвращает статистику загрузки.
+    """
+    stats = {"read": 0, "loaded": 0, "skipped": 0, "rejected": 0}
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS words_staging(
+            line BIGSERIAL,
+            russian_word TEXT,
+            target_word TEXT,
+            other_word_1 TEXT,
+            other_word_2 TEXT,
+            other_word_3 TEXT
+            );
+        """)
+        chunk = []
+
+        def flush():
+            loaded = _copy_chunk(cur, chunk, update)
+            conn.commit()
+            stats["loaded"] += loaded
+            stats["skipped"] += len(chunk) - loaded
+            chunk.clear()
+            if on_progress:
+                on_progress(dict(stats))
+
+        for number, row in iter_rows(path, file_format, delimiter):
+            stats["read"] += 1
+            try:
+                chunk.append(validate_row(row))
+            except RowError as e:
+                stats["rejected"] += 1
+                if on_reject:
+                    on_reject(number, row, str(e))
+                continue
+            if len(chunk) >= chunk_size:
+                flush()
+        if chunk:
+            flush()
+        cur.execute("DROP TABLE IF EXISTS words_staging;")
+        conn.commit()
+    return stats
@@ -0,0 +1,203 @@
+import bisect
+import heapq
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Поиск слова в словаре пользователя по введенному тексту (удаление слова).
+# Точное совпадение ищет хранилище по нормализованному написанию (normalize: нижний регистр,
+# без пробелов по краям, ё -> е) по индексу на выражении – в PostgreSQL это normalize_word()
+# из миграции 10, в SQLite та же функция на Python.
+# Если точного совпадения нет, WordLookup предлагает до SUGGESTIONS похожих слов кнопками:
+# сначала слова, которые начинаются с введенного текста (бинарный поиск в отсортированном
+# списке, как спуск по префиксному дереву), затем похожие по триграммам со сходством как
+# у pg_trgm, но без расширения в БД и на любом хранилище.
+# Индекс строится по словарю пользователя при первом поиске и хранится для max_users
+# пользователей не дольше max_age секунд. Удаленное слово убирается из индекса сразу,
+# добавление своего слова сбрасывает индекс пользователя. Индекс, который строился
+# во время такого изменения, не сохраняется и будет построен при следующем поиске.
+# Цели на словаре в 10 000 слов: подсказки не дольше 2 мс (p95), построение индекса
+# не дольше 250 мс (см. benchmarks/bench_word_lookup.py).
+
+SUGGESTIONS = 5
+# Наименьшее сходство по триграммам (как pg_trgm.similarity_threshold)
+MIN_SIMILARITY = 0.3
+# Префикс короче этого дает слишком много совпадений и не ищется
+MIN_PREFIX = 2
+
+
+def normalize(text: str) -> str:
+    """
+    Написание слова для сравнения: нижний регистр, без пробелов по краям, ё -> е
+    """
+    return text.strip().lower().replace('ё', 'е')
+
+
+def trigrams(key: str) -> set:
+    """
+    Триграммы нормализованного слова с пробелами по краям, как в pg_trgm
+    """
+    padded = f"  {key} "
+    return {padded[start:start + 3] for start in range(len(padded) - 2)}
+
+
+class WordIndex:
+    """
+    Индекс слов одного пользователя: words – пары (id, russian_word).
+    Позиции слов с каждой триграммой (posting lists) лежат подряд в одном массиве numpy,
+    поэтому число общих триграмм со всеми словами считается одним bincount
+    """
+
+    def __init__(self, words):
+        self.ids = []
+        self.texts = []
+        self.keys = []
+        self._positions = {}  # id слова -> позиция
+        for word_id, text in words:
+            key = normalize(text)
+            if key and word_id not in self._positions:
+                self._positions[word_id] = len(self.ids)
+                self.ids.append(word_id)
+                self.texts.append(text)
+                self.keys.append(key)
+        grams = [trigrams(key) for key in self.keys]
+        self._sizes = np.fromiter(map(len, grams), dtype=np.float32, count=len(grams))
+        # Номера триграмм: np.unique сортирует все триграммы словаря без цикла на Python
+        unique, codes = np.unique(np.array([gram for word in grams for gram in word] or [''], dtype=str),
+                                  return_inverse=True)
+        codes = codes[:int(self._sizes.sum())]
+        self._grams = dict(zip(unique.tolist(), range(len(unique))))  # триграмма -> номер
+        # Позиции слов, отсортированные по номеру триграммы, и начало каждой триграммы в них
+        self._postings = np.repeat(np.arange(len(grams), dtype=np.int32),
+                                   self._sizes.astype(np.int32))[np.argsort(codes, kind='stable')]
+        self._offsets = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=len(self._grams)))))
+        self._alive = np.ones(len(self.ids), dtype=bool)
+        self._sorted = sorted((key, position) for position, key in enumerate(self.keys))
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return int(self._alive.sum())
+
+    def remove(self, word_id):
+        position = self._positions.get(word_id)
+        if position is not None:
+            self._alive[position] = False
+
+    def _prefixed(self, key: str, limit: int) -> list:
+        """
+        Позиции слов, начинающихся с key: самые короткие, затем по алфавиту
+        """
+        start = bisect.bisect_left(self._sorted, (key,))
+        end = bisect.bisect_left(self._sorted, (key + '\U0010ffff',))
+        matches = [position for _, position in self._sorted[start:end] if self._alive[position]]
+        return heapq.nsmallest(limit, matches, key=lambda position: len(self.keys[position]))
+
+    def _similar(self, key: str, limit: int) -> list:
+        """
+        Позиции слов, самых похожих на key по триграммам, не ниже MIN_SIMILARITY
+        """
+        grams = trigrams(key)
+        codes = [self._grams[gram] for gram in grams if gram in self._grams]
+        lists = [self._postings[self._offsets[code]:self._offsets[code + 1]] for code in codes]
+        if not lists:
+            return []
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.ids)).astype(np.float32)
+        scores = shared / (len(grams) + self._sizes - shared)
+        scores[~self._alive] = 0
+        top = min(limit, len(scores))
+        candidates = np.argpartition(-scores, top - 1)[:top] if top < len(scores) else np.arange(len(scores))
+        candidates = candidates[scores[candidates] >= MIN_SIMILARITY]
+        return candidates[np.argsort(-scores[candidates], kind='stable')].tolist()
+
+    def suggest(self, text: str, limit: int = SUGGESTIONS) -> list:
+        """
+        До limit написаний слов, похожих на text: сначала продолжения, затем похожие
+        """
+        key = normalize(text)
+        if not key or not self.ids:
+            return []
+        positions = self._prefixed(key, limit) if len(key) >= MIN_PREFIX else []
+        for position in self._similar(key, limit + len(positions)):
+            if len(positions) >= limit:
+                break
+            if position not in positions:
+                positions.append(position)
+        return [self.texts[position] for position in positions if self.keys[position] != key]
+
+
+class WordLookup:
+    """
+    Индексы WordIndex по пользователям. loader(user_id) возвращает пары (id, russian_word)
+    всех слов, доступных пользователю (общие без удаленных и свои)
+    """
+
+    def __init__(self, loader, max_users: int = 1000, max_age: float = 600, limit: int = SUGGESTIONS):
+        self.loader = loader
+        self.max_users = max_users
+        self.max_age = max_age
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._indexes = OrderedDict()  # user_id -> WordIndex
+        # Пользователи, чей индекс сейчас строится: user_id -> [число построений, поколение].
+        # invalidate увеличивает поколение, и индекс, построенный по словарю до изменения,
+        # не сохраняется
+        self._loading = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def _index(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None and now - index.built_at <= self.max_age:
+                self._indexes.move_to_end(user_id)
+                self.hits += 1
+                return index
+            self.misses += 1
+            loading = self._loading.setdefault(user_id, [0, 0])
+            loading[0] += 1
+            generation = loading[1]
+        # Словарь читается без блокировки: медленный пользователь не задерживает остальных
+        index = None
+        try:
+            index = WordIndex(self.loader(user_id))
+        finally:
+            with self._lock:
+                loading[0] -= 1
+                if not loading[0]:
+                    del self._loading[user_id]
+                if index is not None and loading[1] == generation:
+                    self._indexes[user_id] = index
+                    self._indexes.move_to_end(user_id)
+                    while len(self._indexes) > self.max_users:
+                        self._indexes.popitem(last=False)
+        return index
+
+    def suggest(self, user_id, text: str) -> list:
+        """
+        Написания слов пользователя, похожих на text, для кнопок быстрого выбора
+        """
+        return self._index(user_id).suggest(text, self.limit)
+
+    def invalidate(self, user_id, word_id=None):
+        """
+        Слушатель изменений словаря (Storage.add_vocabulary_listener): удаленное слово
+        убирается из индекса, после добавления своего слова индекс строится заново
+        """
+        with self._lock:
+            if user_id in self._loading:
+                self._loading[user_id][1] += 1
+            index = self._indexes.get(user_id)
+            if index is None:
+                return
+            if word_id is None:
+                del self._indexes[user_id]
+            else:
+                index.remove(word_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"users": len(self._indexes), "hits": self.hits, "misses": self.misses}
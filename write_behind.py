@@ -0,0 +1,320 @@
+import threading
+import time
+
+from psycopg2.extras import execute_values
+
+import metrics
+
+# Отложенная запись активности и прогресса пользователей.
+# Ответы на вопросы, выученные и удаленные слова и время последней активности
+# складываются в буфер в памяти, а в БД попадают пачками: несколькими многострочными
+# запросами в одной транзакции раз в flush_interval секунд, как только в буфере
+# набралось max_rows записей, и при остановке бота. Так каждое нажатие кнопки
+# не стоит отдельного commit.
+# Удаления, еще не записанные в БД, доступны через pending_deletions, чтобы запросы
+# выбора слов исключали их сразу. Пока БД недоступна, удаления и выученные слова
+# копятся без ограничения max_pending, но пропадут, если процесс упадет до записи.
+
+# Время событий передается как unix time и переводится в TIMESTAMP той же функцией,
+# что и DEFAULT NOW() в схеме, поэтому часовой пояс совпадает.
+TOUCH_SQL = """
+    UPDATE users SET last_active = to_timestamp(v.at)
+    FROM (VALUES %s) AS v(user_id, at)
+    WHERE users.id = v.user_id
+    AND (users.last_active IS NULL OR users.last_active < to_timestamp(v.at))
+"""
+
+# Слово или пользователь могли быть удалены, пока запись ждала в буфере:
+# такие строки пропускаются, чтобы не ломать всю пачку внешним ключом.
+# Счетчики user_stats (см. user_stats.py) увеличиваются в том же запросе
+# на число действительно добавленных строк
+DELETED_SQL = """
+    WITH inserted AS (
+        INSERT INTO deleted_words (user_id, words_id, deleted_at)
+        SELECT v.user_id, v.words_id, to_timestamp(v.at)
+        FROM (VALUES %s) AS v(user_id, words_id, at)
+        WHERE EXISTS (SELECT 1 FROM words w WHERE w.id = v.words_id)
+        AND EXISTS (SELECT 1 FROM users u WHERE u.id = v.user_id)
+        ON CONFLICT (user_id, words_id) DO NOTHING
+        RETURNING user_id
+    )
+    INSERT INTO user_stats AS s (user_id, deleted_words)
+    SELECT user_id, COUNT(*) FROM inserted GROUP BY user_id
+    ON CONFLICT (user_id) DO UPDATE SET deleted_words = s.deleted_words + EXCLUDED.deleted_words
+"""
+
+# Удаленное слово больше не повторяется, его прогресс не нужен
+PROGRESS_DELETED_SQL = """
+    DELETE FROM word_progress p
+    USING (VALUES %s) AS v(user_id, words_id, at)
+    WHERE p.user_id = v.user_id AND p.words_id = v.words_id
+"""
+
+LEARNED_SQL = """
+    WITH inserted AS (
+        INSERT INTO learned_words (user_id, words_id, learned_at)
+        SELECT v.user_id, v.words_id, to_timestamp(v.at)
+        FROM (VALUES %s) AS v(user_id, words_id, at)
+        WHERE EXISTS (SELECT 1 FROM words w WHERE w.id = v.words_id)
+        AND EXISTS (SELECT 1 FROM users u WHERE u.id = v.user_id)
+        ON CONFLICT (user_id, words_id) DO NOTHING
+        RETURNING user_id
+    )
+    INSERT INTO user_stats AS s (user_id, learned_words)
+    SELECT user_id, COUNT(*) FROM inserted GROUP BY user_id
+    ON CONFLICT (user_id) DO UPDATE SET learned_words = s.learned_words + EXCLUDED.learned_words
+"""
+
+# Серия считается по всем дням с ответами в пачке, как в user_stats.RECONCILE_SQL:
+# пачка может захватить полночь или вернуться в буфер после неудачной записи и
+# склеиться со следующей. Дни не позже уже записанного last_answer_date серию не
+# продлевают, поэтому повторная запись тех же ответов ее не увеличит.
+ANSWERS_SQL = """
+    WITH inserted AS (
+        INSERT INTO answer_events (user_id, words_id, correct, attempt, answered_at)
+        SELECT v.user_id, v.words_id, v.correct, v.attempt, to_timestamp(v.at)
+        FROM (VALUES %s) AS v(user_id, words_id, correct, attempt, at)
+        WHERE EXISTS (SELECT 1 FROM words w WHERE w.id = v.words_id)
+        AND EXISTS (SELECT 1 FROM users u WHERE u.id = v.user_id)
+        RETURNING user_id, correct, answered_at
+    ),
+    totals AS (
+        SELECT user_id, COUNT(*) AS n, COUNT(*) FILTER (WHERE correct) AS correct,
+               MAX(answered_at)::date AS last_day
+        FROM inserted
+        GROUP BY user_id
+    ),
+    days AS (
+        SELECT DISTINCT i.user_id, i.answered_at::date AS day,
+               st.last_answer_date AS known_day, COALESCE(st.streak_days, 0) AS streak
+        FROM inserted i LEFT JOIN user_stats st ON st.user_id = i.user_id
+        WHERE st.last_answer_date IS NULL OR i.answered_at::date > st.last_answer_date
+    ),
+    runs AS (
+        -- Первая серия пачки продолжает записанную, если начинается на следующий день
+        SELECT user_id, MAX(day) AS last_day,
+               COUNT(*) + CASE WHEN MIN(day) = MIN(known_day) + 1 THEN MIN(streak) ELSE 0 END AS length
+        FROM (
+            SELECT user_id, day, known_day, streak,
+                   day - (ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY day))::integer AS series
+            FROM days
+        ) numbered
+        GROUP BY user_id, series
+    ),
+    streaks AS (
+        SELECT user_id, MAX(length) AS best, (ARRAY_AGG(length ORDER BY last_day DESC))[1] AS current
+        FROM runs
+        GROUP BY user_id
+    )
+    INSERT INTO user_stats AS s (user_id, answers, correct_answers, streak_days, best_streak, last_answer_date)
+    SELECT t.user_id, t.n, t.correct, COALESCE(r.current, 0), COALESCE(r.best, 0), t.last_day
+    FROM totals t LEFT JOIN streaks r ON r.user_id = t.user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET answers = s.answers + EXCLUDED.answers,
+        correct_answers = s.correct_answers + EXCLUDED.correct_answers,
+        streak_days = CASE WHEN s.last_answer_date >= EXCLUDED.last_answer_date THEN s.streak_days
+                           ELSE EXCLUDED.streak_days END,
+        best_streak = GREATEST(s.best_streak, EXCLUDED.best_streak),
+        last_answer_date = GREATEST(s.last_answer_date, EXCLUDED.last_answer_date)
+"""
+
+TOUCH_TEMPLATE = "(%s::bigint, %s::double precision)"
+PAIR_TEMPLATE = "(%s::bigint, %s::integer, %s::double precision)"
+ANSWER_TEMPLATE = "(%s::bigint, %s::integer, %s::boolean, %s::smallint, %s::double precision)"
+
+
+class _Batch:
+    __slots__ = ("touched", "deleted", "learned", "answers")
+
+    def __init__(self):
+        self.touched = {}  # user_id -> время последней активности
+        self.deleted = {}  # (user_id, word_id) -> время
+        self.learned = {}  # (user_id, word_id) -> время
+        self.answers = []  # (user_id, word_id, correct, attempt, время)
+
+    def __len__(self):
+        return len(self.touched) + len(self.deleted) + len(self.learned) + len(self.answers)
+
+    def merge(self, newer):
+        """
+        Добавляет записи более новой пачки (после неудачной записи старая возвращается в буфер)
+        """
+        for user_id, at in newer.touched.items():
+            self.touched[user_id] = max(at, self.touched.get(user_id, at))
+        for key, at in newer.deleted.items():
+            self.deleted.setdefault(key, at)
+        for key, at in newer.learned.items():
+            self.learned.setdefault(key, at)
+        self.answers.extend(newer.answers)
+
+
+@metrics.query('write_behind_flush')
+def write_batch(conn, batch):
+    """
+    Записывает пачку в одной транзакции
+    """
+    with conn.cursor() as cur:
+        if batch.touched:
+            execute_values(cur, TOUCH_SQL, list(batch.touched.items()), template=TOUCH_TEMPLATE,
+                           page_size=1000)
+        if batch.deleted:
+            deleted = [(*key, at) for key, at in batch.deleted.items()]
+            execute_values(cur, DELETED_SQL, deleted, template=PAIR_TEMPLATE, page_size=1000)
+            execute_values(cur, PROGRESS_DELETED_SQL, deleted, template=PAIR_TEMPLATE, page_size=1000)
+        if batch.learned:
+            execute_values(cur, LEARNED_SQL, [(*key, at) for key, at in batch.learned.items()],
+                           template=PAIR_TEMPLATE, page_size=1000)
+        if batch.answers:
+            execute_values(cur, ANSWERS_SQL, batch.answers, template=ANSWER_TEMPLATE, page_size=1000)
+    conn.commit()
+
+
+class WriteBehind:
+    """
+    Буфер отложенной записи. get_pool возвращает пул соединений (database.get_pool).
+    flush_interval = 0 – запись сразу при каждом событии, без буфера
+    """
+
+    def __init__(self, get_pool, flush_interval: float = 1.0, max_rows: int = 500, max_pending: int = 100000):
+        self.get_pool = get_pool
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self.max_pending = max_pending
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()  # одна запись в БД за раз
+        self._batch = _Batch()
+        self._writing = None  # пачка, которая сейчас записывается
+        self._thread = None
+        self._stopping = False
+
+        self.flushes = 0
+        self.rows_written = 0
+        self.errors = 0
+        self.dropped = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None or self.flush_interval <= 0:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def _add(self, record):
+        with self._lock:
+            record(self._batch)
+            if len(self._batch) >= self.max_rows:
+                self._wakeup.notify()
+        if self._thread is None:
+            self.flush()
+
+    def touch(self, user_id):
+        """
+        Пользователь был активен сейчас
+        """
+        at = time.time()
+        self._add(lambda batch: batch.touched.__setitem__(user_id, at))
+
+    def deleted(self, user_id, word_id):
+        """
+        Пользователь убрал слово из списка изучения
+        """
+        at = time.time()
+        self._add(lambda batch: batch.deleted.setdefault((user_id, word_id), at))
+
+    def learned(self, user_id, word_id):
+        """
+        Пользователь выучил слово
+        """
+        at = time.time()
+        self._add(lambda batch: batch.learned.setdefault((user_id, word_id), at))
+
+    def answer(self, user_id, word_id, correct: bool, attempt: int):
+        """
+        Ответ пользователя на вопрос
+        """
+        at = time.time()
+        self._add(lambda batch: batch.answers.append((user_id, word_id, correct, attempt, at)))
+
+    def pending_deletions(self, user_id) -> list:
+        """
+        id слов, удаленных пользователем, но еще не записанных в deleted_words
+        """
+        with self._lock:
+            batches = (self._batch, self._writing) if self._writing is not None else (self._batch,)
+            return [word_id for batch in batches for (uid, word_id) in batch.deleted if uid == user_id]
+
+    def flush(self) -> int:
+        """
+        Записывает все накопленное, возвращает число записанных строк
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._batch:
+                    return 0
+                batch, self._batch = self._batch, _Batch()
+                self._writing = batch
+            try:
+                with self.get_pool().connection() as conn:
+                    try:
+                        write_batch(conn, batch)
+                    except Exception:
+                        conn.rollback()
+                        raise
+            except Exception as e:
+                print(f"Ошибка при записи отложенных изменений: {e}")
+                with self._lock:
+                    self.errors += 1
+                    self._writing = None
+                    # Возвращаем пачку в буфер, но не копим его без ограничения, пока БД недоступна:
+                    # сверх max_pending отбрасываются время активности и ответы, а удаления
+                    # и выученные слова пользователь уже видел, их не теряем
+                    if len(batch) + len(self._batch) > self.max_pending:
+                        self.dropped += len(batch.touched) + len(batch.answers)
+                        batch.touched, batch.answers = {}, []
+                    batch.merge(self._batch)
+                    self._batch = batch
+                return 0
+            with self._lock:
+                self._writing = None
+                self.flushes += 1
+                self.rows_written += len(batch)
+            return len(batch)
+
+    def _run(self):
+        failed = False
+        while True:
+            with self._lock:
+                # После ошибки ждем полный интервал, даже если буфер уже полон
+                if not self._stopping and (failed or len(self._batch) < self.max_rows):
+                    self._wakeup.wait(self.flush_interval)
+                stopping = self._stopping
+                errors = self.errors
+            self.flush()
+            if stopping:
+                return
+            failed = self.errors != errors
+
+    def stop(self):
+        """
+        Записывает остаток буфера и останавливает поток записи
+        """
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": len(self._batch),
+                "flushes": self.flushes,
+                "rows_written": self.rows_written,
+                "errors": self.errors,
+                "dropped": self.dropped,
+            }